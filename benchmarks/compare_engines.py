@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение OCR-движков (ocr_engines.py) на корпусе документов: скорость и точность
+рядом, по каждому документу и по типам документов.
+
+Корпус - каталог с PDF и изображениями; подкаталог первого уровня считается типом
+документа (corpus/letters/..., corpus/invoices/...). Эталон для документа
+doc.pdf - файл doc.txt рядом с ним (или в --reference-dir). Без эталонов
+точность считается относительно первого движка из --engines.
+"""
+
+import argparse
+import difflib
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'research'))
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'}
+
+
+def find_documents(corpus: Path):
+    """[(тип документа, путь)] для всех PDF и изображений корпуса"""
+    if corpus.is_file():
+        return [('-', corpus)]
+    documents = []
+    for path in sorted(corpus.rglob('*')):
+        if path.suffix.lower() in IMAGE_EXTENSIONS | {'.pdf'}:
+            relative = path.relative_to(corpus)
+            doc_type = relative.parts[0] if len(relative.parts) > 1 else '-'
+            documents.append((doc_type, path))
+    return documents
+
+
+def render_pages(path: Path, dpi: int, max_pages: int):
+    """Страницы документа в numpy-массивы RGB"""
+    import numpy as np
+    
+    if path.suffix.lower() != '.pdf':
+        from PIL import Image
+        return [np.asarray(Image.open(path).convert('RGB'))]
+    
+    import cv2
+    import fitz
+    from preprocessing import pixmap_to_bgr
+    pages = []
+    with fitz.open(str(path)) as doc:
+        for page in list(doc)[:max_pages]:
+            pix = page.get_pixmap(dpi=dpi, alpha=False)
+            # cvtColor создаёт новый массив - он не зависит от буфера пиксмапа
+            pages.append(cv2.cvtColor(pixmap_to_bgr(pix), cv2.COLOR_BGR2RGB))
+    return pages
+
+
+def find_reference(path: Path, reference_dir):
+    """Эталонный текст документа, если есть"""
+    candidate = (Path(reference_dir) if reference_dir else path.parent) / f"{path.stem}.txt"
+    return candidate.read_text(encoding='utf-8') if candidate.exists() else None
+
+
+def similarity(text: str, reference: str) -> float:
+    """Посимвольная близость (0..1) к эталону"""
+    return difflib.SequenceMatcher(None, text, reference).ratio()
+
+
+def main():
+    from ocr_engines import ENGINES, create_engine, page_text
+    
+    parser = argparse.ArgumentParser(description='Сравнение OCR-движков на корпусе документов')
+    parser.add_argument('corpus', help='Каталог с документами (или один файл)')
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES),
+                        help='Движки для сравнения (по умолчанию: все)')
+    parser.add_argument('--dpi', type=int, default=300, help='DPI рендера PDF (по умолчанию: 300)')
+    parser.add_argument('--pages', type=int, default=3, help='Максимум страниц на документ (по умолчанию: 3)')
+    parser.add_argument('--reference-dir', help='Каталог с эталонными текстами <имя>.txt')
+    parser.add_argument('--gpu', action='store_true', help='Использовать GPU')
+    args = parser.parse_args()
+    
+    documents = find_documents(Path(args.corpus))
+    if not documents:
+        print(f"❌ В {args.corpus} нет PDF и изображений")
+        sys.exit(1)
+    print(f"📚 Документов: {len(documents)}, движков: {len(args.engines)}")
+    
+    engines = {}
+    for name in args.engines:
+        start = time.perf_counter()
+        engines[name] = create_engine(name, use_gpu=args.gpu)
+        print(f"🔧 {name}: создан за {time.perf_counter() - start:.1f} с")
+    
+    # (тип, документ) -> движок -> (текст, секунды, страниц)
+    results = {}
+    references = {}
+    for doc_type, path in documents:
+        pages = render_pages(path, args.dpi, args.pages)
+        references[path] = find_reference(path, args.reference_dir)
+        print(f"\n📄 {path.name} ({doc_type}): {len(pages)} стр.")
+        
+        results[(doc_type, path)] = {}
+        for name, engine in engines.items():
+            start = time.perf_counter()
+            try:
+                texts = [page_text(engine.recognize_page(page)) for page in pages]
+            except Exception as e:
+                print(f"   ⚠️  {name}: {e}")
+                continue
+            seconds = time.perf_counter() - start
+            results[(doc_type, path)][name] = ('\n'.join(texts), seconds, len(pages))
+            print(f"   ✓ {name}: {seconds:.1f} с")
+    
+    # Точность: к эталону, а без него - к первому движку
+    baseline = args.engines[0]
+    summary = defaultdict(lambda: {'seconds': 0.0, 'pages': 0, 'scores': []})
+    
+    print(f"\n{'Документ':<30} {'Движок':<15} {'стр/сек':>9} {'точность':>9}")
+    print('-' * 66)
+    for (doc_type, path), by_engine in results.items():
+        reference = references[path]
+        if reference is None and baseline in by_engine:
+            reference = by_engine[baseline][0]
+        for name, (text, seconds, page_count) in by_engine.items():
+            score = similarity(text, reference) if reference is not None else None
+            stats = summary[(doc_type, name)]
+            stats['seconds'] += seconds
+            stats['pages'] += page_count
+            if score is not None:
+                stats['scores'].append(score)
+            score_text = f"{score:.3f}" if score is not None else '-'
+            print(f"{path.name[:30]:<30} {name:<15} {page_count / seconds:>9.3f} {score_text:>9}")
+    
+    print(f"\n{'Тип':<20} {'Движок':<15} {'стр/сек':>9} {'точность':>9}")
+    print('-' * 56)
+    for (doc_type, name), stats in sorted(summary.items()):
+        scores = stats['scores']
+        score_text = f"{sum(scores) / len(scores):.3f}" if scores else '-'
+        print(f"{doc_type:<20} {name:<15} {stats['pages'] / stats['seconds']:>9.3f} {score_text:>9}")
+    
+    if not any(references.values()):
+        print(f"\nℹ️  Эталонов нет - точность относительно движка {baseline}")
+
+
+if __name__ == '__main__':
+    main()
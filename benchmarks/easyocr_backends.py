@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение скорости и точности EasyOCR: torch vs ONNX Runtime (fp32/int8) на CPU.
+Эталоном точности служит вывод torch (или текст из --reference, если задан).
+"""
+
+import argparse
+import difflib
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+LANG = ['ru', 'en']
+
+
+def render_pages(pdf_path: Path, dpi: int, max_pages: int):
+    """Рендерит первые max_pages страниц в numpy-массивы"""
+    import numpy as np
+    from pdf2image import convert_from_path
+    images = convert_from_path(str(pdf_path), dpi=dpi, first_page=1, last_page=max_pages)
+    return [np.array(image) for image in images]
+
+
+def run_backend(reader, pages):
+    """Распознаёт страницы, возвращает (тексты, секунды)"""
+    texts = []
+    start = time.perf_counter()
+    for page in pages:
+        results = reader.readtext(page)
+        texts.append('\n'.join(text for _, text, _ in results))
+    return texts, time.perf_counter() - start
+
+
+def similarity(texts, reference_texts) -> float:
+    """Средняя посимвольная близость (0..1) к эталону"""
+    ratios = [
+        difflib.SequenceMatcher(None, text, reference).ratio()
+        for text, reference in zip(texts, reference_texts)
+    ]
+    return sum(ratios) / len(ratios) if ratios else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк EasyOCR: torch vs ONNX Runtime')
+    parser.add_argument('pdf_file', help='PDF для замеров')
+    parser.add_argument('--dpi', type=int, default=400, help='DPI (по умолчанию: 400)')
+    parser.add_argument('--pages', type=int, default=2, help='Сколько страниц брать (по умолчанию: 2)')
+    parser.add_argument('--reference', help='Эталонный текст (по умолчанию: вывод torch)')
+    parser.add_argument('--threads', type=int, default=None, help='Потоков на процесс')
+    args = parser.parse_args()
+    
+    import easyocr
+    from easyocr_onnx import enable_onnx_backend
+    from easyocr_script import configure_thread_budget
+    
+    if args.threads:
+        configure_thread_budget(args.threads)
+    
+    pages = render_pages(Path(args.pdf_file), args.dpi, args.pages)
+    print(f"📄 Страниц: {len(pages)}")
+    
+    results = {}
+    
+    reader = easyocr.Reader(LANG, gpu=False, verbose=False)
+    reader.readtext(pages[0][:256, :256])  # прогрев
+    results['torch'] = run_backend(reader, pages)
+    
+    for precision in ['fp32', 'int8']:
+        reader = easyocr.Reader(LANG, gpu=False, verbose=False)
+        enable_onnx_backend(reader, LANG, precision=precision)
+        reader.readtext(pages[0][:256, :256])
+        results[f'onnx-{precision}'] = run_backend(reader, pages)
+    
+    if args.reference:
+        reference_texts = [Path(args.reference).read_text(encoding='utf-8')]
+        compare = lambda texts: ['\n'.join(texts)]
+    else:
+        reference_texts = results['torch'][0]
+        compare = lambda texts: texts
+    
+    base_time = results['torch'][1]
+    print(f"\n{'Бэкенд':<12} {'сек':>8} {'стр/сек':>9} {'ускорение':>10} {'точность':>9}")
+    print('-' * 52)
+    for name, (texts, seconds) in results.items():
+        print(f"{name:<12} {seconds:>8.2f} {len(pages) / seconds:>9.3f} "
+              f"{base_time / seconds:>9.2f}x {similarity(compare(texts), reference_texts):>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
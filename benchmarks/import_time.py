@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Время старта CLI: запускает точки входа с `--help` под `python -X importtime`
+и показывает, какие модули грузятся и сколько это стоит.
+Завершается с кодом 1, если загружена тяжёлая библиотека или превышен лимит времени.
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple, Set
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ENTRY_POINTS = ['easyocr_script.py', 'llm_regex_analyzer.py', 'easyocr_autotune.py']
+
+# Эти библиотеки не должны загружаться для --help
+HEAVY_MODULES = ['torch', 'easyocr', 'img2table', 'pdf2image', 'pytesseract',
+                 'pandas', 'cv2', 'PIL', 'numpy', 'requests', 'onnxruntime', 'transformers']
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def measure(script: str) -> Tuple[float, List[Tuple[str, int]], Set[str]]:
+    """Возвращает (время запуска в сек, [(модуль верхнего уровня, кумулятивно мкс)], все модули)"""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', str(ROOT / script), '--help'],
+        capture_output=True, text=True, cwd=ROOT
+    )
+    elapsed = time.perf_counter() - start
+    
+    top_level = []
+    all_modules = set()
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        all_modules.add(match.group(4).split('.')[0])
+        # Отступ в одну позицию - импорт верхнего уровня
+        if len(match.group(3)) == 1:
+            top_level.append((match.group(4), int(match.group(2))))
+    
+    return elapsed, top_level, all_modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время импорта точек входа (python -X importtime)')
+    parser.add_argument('--max-ms', type=float, default=500,
+                        help='Лимит времени запуска --help в мс (по умолчанию: 500)')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Сколько самых медленных импортов показать (по умолчанию: 10)')
+    args = parser.parse_args()
+    
+    failed = False
+    for script in ENTRY_POINTS:
+        elapsed, imports, all_modules = measure(script)
+        heavy = sorted(all_modules & set(HEAVY_MODULES))
+        
+        status = '✅'
+        if heavy or elapsed * 1000 > args.max_ms:
+            status = '❌'
+            failed = True
+        
+        print(f"\n{status} {script}: {elapsed * 1000:.0f} мс, импорт "
+              f"{sum(us for _, us in imports) / 1000:.0f} мс")
+        for name, us in sorted(imports, key=lambda i: i[1], reverse=True)[:args.top]:
+            print(f"   {us / 1000:>8.1f} мс  {name}")
+        if heavy:
+            print(f"   ⚠️  Тяжёлые модули при --help: {', '.join(heavy)}")
+    
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение профилей шумоподавления research/preprocessing.py: время предобработки
+страницы и точность последующего OCR (EasyOCR или Tesseract).
+Эталоном точности служит вывод с профилем nlmeans (или текст из --reference).
+"""
+
+import argparse
+import difflib
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'research'))
+
+LANG = ['ru', 'en']
+
+
+def render_pages(pdf_path: Path, resolution: float, max_pages: int, noise: float):
+    """Рендерит первые max_pages страниц в полутоновые numpy-массивы, при noise > 0 добавляет шум"""
+    import fitz
+    import numpy as np
+    
+    rng = np.random.default_rng(0)
+    pages = []
+    with fitz.open(str(pdf_path)) as doc:
+        for page in list(doc)[:max_pages]:
+            pix = page.get_pixmap(matrix=fitz.Matrix(resolution, resolution), colorspace=fitz.csGRAY, alpha=False)
+            gray = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+            if noise > 0:
+                # Имитация скана: гауссов шум
+                gray = np.clip(gray + rng.normal(0, noise, gray.shape), 0, 255).astype(np.uint8)
+            pages.append(np.ascontiguousarray(gray))
+    return pages
+
+
+def preprocess(gray, profile):
+    """Та же цепочка, что в TrOCRProcessor.preprocess_image: CLAHE + шумоподавление"""
+    import cv2
+    from preprocessing import denoise
+    
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return denoise(clahe.apply(gray), profile)
+
+
+def make_recognizer(engine: str):
+    """Функция image -> текст для выбранного движка"""
+    if engine == 'tesseract':
+        import pytesseract
+        return lambda image: pytesseract.image_to_string(image, lang='rus+eng')
+    
+    import easyocr
+    reader = easyocr.Reader(LANG, gpu=False, verbose=False)
+    return lambda image: '\n'.join(text for _, text, _ in reader.readtext(image))
+
+
+def similarity(texts, reference_texts) -> float:
+    """Средняя посимвольная близость (0..1) к эталону"""
+    ratios = [
+        difflib.SequenceMatcher(None, text, reference).ratio()
+        for text, reference in zip(texts, reference_texts)
+    ]
+    return sum(ratios) / len(ratios) if ratios else 0.0
+
+
+def main():
+    from preprocessing import PREPROCESS_PROFILES, estimate_noise
+    
+    parser = argparse.ArgumentParser(description='Бенчмарк профилей шумоподавления')
+    parser.add_argument('pdf_file', help='PDF для замеров')
+    parser.add_argument('--resolution', type=float, default=5.0, help='Множитель рендера (по умолчанию: 5.0)')
+    parser.add_argument('--pages', type=int, default=2, help='Сколько страниц брать (по умолчанию: 2)')
+    parser.add_argument('--noise', type=float, default=0.0,
+                        help='Добавить гауссов шум с этой сигмой (имитация скана)')
+    parser.add_argument('--engine', choices=['easyocr', 'tesseract'], default='easyocr',
+                        help='Движок для оценки точности (по умолчанию: easyocr)')
+    parser.add_argument('--profiles', nargs='+', choices=PREPROCESS_PROFILES, default=PREPROCESS_PROFILES,
+                        help='Какие профили сравнивать (по умолчанию: все)')
+    parser.add_argument('--reference', help='Эталонный текст (по умолчанию: вывод с nlmeans)')
+    args = parser.parse_args()
+    
+    pages = render_pages(Path(args.pdf_file), args.resolution, args.pages, args.noise)
+    print(f"📄 Страниц: {len(pages)}, оценка шума: "
+          f"{', '.join(f'{estimate_noise(page):.1f}' for page in pages)}")
+    
+    recognize = make_recognizer(args.engine)
+    
+    profiles = list(args.profiles)
+    if not args.reference and 'nlmeans' not in profiles:
+        profiles.insert(0, 'nlmeans')
+    
+    results = {}
+    for profile in profiles:
+        start = time.perf_counter()
+        prepared = [preprocess(page, profile) for page in pages]
+        seconds = time.perf_counter() - start
+        texts = [recognize(image) for image in prepared]
+        results[profile] = (texts, seconds)
+        print(f"  ✓ {profile}")
+    
+    if args.reference:
+        reference_texts = [Path(args.reference).read_text(encoding='utf-8')]
+        compare = lambda texts: ['\n'.join(texts)]
+    else:
+        reference_texts = results['nlmeans'][0]
+        compare = lambda texts: texts
+    
+    print(f"\n{'Профиль':<10} {'сек/стр':>9} {'точность':>9}")
+    print('-' * 30)
+    for profile, (texts, seconds) in results.items():
+        print(f"{profile:<10} {seconds / len(pages):>9.3f} {similarity(compare(texts), reference_texts):>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Поиск таблиц (research/table_regions.py): полное разрешение против уменьшенной копии.
+Показывает время на страницу и совпадают ли найденные области.
+
+Кроме PDF корпуса (или вместо него) можно сгенерировать страницы (--synthetic):
+таблицы с сеткой, текст в ячейках и абзацы текста вплотную к таблицам - на них
+уменьшенная копия легче всего принимает строки текста за линии.
+"""
+
+import argparse
+import itertools
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'research'))
+
+
+def render_pages(pdf_paths, resolution: float, max_pages: int):
+    """(имя, номер страницы, numpy-массив) для первых max_pages страниц каждого PDF"""
+    if not pdf_paths:
+        return
+    import fitz
+    from preprocessing import pixmap_to_bgr
+    
+    for pdf_path in pdf_paths:
+        with fitz.open(str(pdf_path)) as doc:
+            for page_num, page in enumerate(list(doc)[:max_pages], start=1):
+                pix = page.get_pixmap(matrix=fitz.Matrix(resolution, resolution), alpha=False)
+                yield pdf_path.name, page_num, pixmap_to_bgr(pix).copy()
+
+
+def synthetic_pages(count: int, seed: int = 0):
+    """(имя, номер страницы, numpy-массив) для count страниц A4 при 5x: таблицы и текст рядом"""
+    import cv2
+    import numpy as np
+    
+    rng = np.random.default_rng(seed)
+    words = ['Таблица', 'sample', 'steel', '0,25', 'ГОСТ', 'weight', 'length', 'mm', '12.5', 'HRC']
+    
+    def put_text(page, x, y, width, size):
+        while width > 0:
+            word = str(rng.choice(words))
+            cv2.putText(page, word, (x, y), cv2.FONT_HERSHEY_DUPLEX, size, 0, max(1, round(size * 3)),
+                        cv2.LINE_AA)
+            step = int(len(word) * 22 * size) + 25
+            x, width = x + step, width - step
+    
+    for page_num in range(1, count + 1):
+        page = np.full((4200, 2970, 3), 255, dtype=np.uint8)
+        y = 150
+        while y < 3900:
+            # Абзац текста над таблицей, строки до самого её края
+            for _ in range(int(rng.integers(1, 5))):
+                put_text(page, 200, y + 40, 2500, float(rng.uniform(1.2, 2.0)))
+                y += int(rng.integers(50, 70))
+            y += int(rng.integers(5, 30))
+            
+            rows, cols = int(rng.integers(2, 8)), int(rng.integers(2, 7))
+            row_h, col_w = int(rng.integers(60, 120)), int(rng.integers(200, 400))
+            x0 = int(rng.integers(150, 350))
+            if y + rows * row_h > 4000 or x0 + cols * col_w > 2900:
+                break
+            thickness = int(rng.integers(2, 6))
+            for r in range(rows + 1):
+                cv2.line(page, (x0, y + r * row_h), (x0 + cols * col_w, y + r * row_h), (0, 0, 0), thickness)
+            for c in range(cols + 1):
+                cv2.line(page, (x0 + c * col_w, y), (x0 + c * col_w, y + rows * row_h), (0, 0, 0), thickness)
+            for r in range(rows):
+                for c in range(cols):
+                    put_text(page, x0 + c * col_w + 15, y + r * row_h + row_h // 2 + 15, col_w - 60, 1.2)
+            # Подпись сбоку от таблицы - текст в нескольких px от вертикальной линии
+            put_text(page, x0 + cols * col_w + int(rng.integers(5, 40)), y + row_h, 2900 - x0 - cols * col_w, 1.5)
+            y += rows * row_h + int(rng.integers(10, 60))
+        yield 'synthetic', page_num, page
+
+
+def same_regions(full, scaled, tolerance: int) -> bool:
+    """Одинаковые области с точностью до tolerance px по каждой координате"""
+    if len(full) != len(scaled):
+        return False
+    return all(
+        max(abs(a - b) for a, b in zip(region_full, region_scaled)) <= tolerance
+        for region_full, region_scaled in zip(sorted(full), sorted(scaled))
+    )
+
+
+def main():
+    from table_regions import auto_scale, find_table_regions, find_table_regions_full
+    
+    parser = argparse.ArgumentParser(description='Бенчмарк поиска таблиц: полное разрешение vs уменьшенная копия')
+    parser.add_argument('corpus', nargs='?', help='PDF или каталог с PDF')
+    parser.add_argument('--resolution', type=float, default=5.0, help='Множитель рендера (по умолчанию: 5.0)')
+    parser.add_argument('--pages', type=int, default=5, help='Максимум страниц на документ (по умолчанию: 5)')
+    parser.add_argument('--scale', type=int, default=None, help='Коэффициент уменьшения (по умолчанию: авто)')
+    parser.add_argument('--tolerance', type=int, default=2, help='Допуск совпадения координат, px (по умолчанию: 2)')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='Добавить столько сгенерированных страниц с таблицами и текстом рядом')
+    args = parser.parse_args()
+    if not args.corpus and not args.synthetic:
+        parser.error('укажите corpus и/или --synthetic N')
+    
+    pdf_paths = []
+    if args.corpus:
+        corpus = Path(args.corpus)
+        pdf_paths = [corpus] if corpus.is_file() else sorted(corpus.rglob('*.pdf'))
+    
+    full_seconds = scaled_seconds = 0.0
+    pages = mismatched = 0
+    all_pages = itertools.chain(render_pages(pdf_paths, args.resolution, args.pages), synthetic_pages(args.synthetic))
+    for name, page_num, image in all_pages:
+        start = time.perf_counter()
+        full = find_table_regions_full(image)
+        full_seconds += time.perf_counter() - start
+        
+        start = time.perf_counter()
+        scaled = find_table_regions(image, scale=args.scale)
+        scaled_seconds += time.perf_counter() - start
+        
+        pages += 1
+        if not same_regions(full, scaled, args.tolerance):
+            mismatched += 1
+            print(f"⚠️  {name} стр. {page_num} (x{args.scale or auto_scale(image)}): {full} != {scaled}")
+    
+    if not pages:
+        print(f"❌ В {args.corpus} нет PDF" if args.corpus else "❌ Нет страниц")
+        sys.exit(1)
+    
+    print(f"\n📄 Страниц: {pages}, совпало: {pages - mismatched}/{pages}")
+    print(f"   Полное разрешение:  {full_seconds / pages * 1000:>7.1f} мс/стр")
+    print(f"   Уменьшенная копия:  {scaled_seconds / pages * 1000:>7.1f} мс/стр "
+          f"({full_seconds / scaled_seconds:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
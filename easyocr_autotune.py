@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Автоподбор числа процессов и потоков для easyocr_script.py.
+Замеряет страницы/сек для комбинаций "процессы × потоки" на этой машине
+и сохраняет лучшую конфигурацию в JSON.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple, Dict, Any
+
+SCRIPT_PATH = Path(__file__).resolve().parent / 'easyocr_script.py'
+
+
+def count_pdf_pages(pdf_path: Path) -> int:
+    """Возвращает число страниц PDF"""
+    from pdf2image import pdfinfo_from_path
+    return int(pdfinfo_from_path(str(pdf_path))['Pages'])
+
+
+def candidate_configs(cpu_count: int, max_workers: int) -> List[Tuple[int, int]]:
+    """Комбинации (процессы, потоки), не превышающие число ядер"""
+    configs = []
+    workers = 1
+    while workers <= min(cpu_count, max_workers):
+        threads = 1
+        while workers * threads <= cpu_count:
+            configs.append((workers, threads))
+            threads *= 2
+        workers *= 2
+    return configs
+
+
+def run_config(pdf_path: Path, workers: int, threads: int, dpi: int, use_gpu: bool) -> float:
+    """Запускает workers процессов easyocr_script.py одновременно, возвращает время (сек)"""
+    with tempfile.TemporaryDirectory(prefix='easyocr_autotune_') as tmp_dir:
+        commands = []
+        for worker_idx in range(workers):
+            command = [
+                sys.executable, str(SCRIPT_PATH), str(pdf_path),
+                '--output', str(Path(tmp_dir) / f"worker_{worker_idx}"),
+                '--dpi', str(dpi),
+                '--artifacts', 'none',
+                '--threads-per-worker', str(threads)
+            ]
+            if use_gpu:
+                command.append('--gpu')
+            commands.append(command)
+
+        start = time.perf_counter()
+        processes = [
+            subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for command in commands
+        ]
+        return_codes = [process.wait() for process in processes]
+        elapsed = time.perf_counter() - start
+
+    if any(return_codes):
+        raise RuntimeError(f"easyocr_script.py завершился с ошибкой: {return_codes}")
+
+    return elapsed
+
+
+def autotune(pdf_path: Path, max_workers: int, dpi: int, use_gpu: bool) -> Dict[str, Any]:
+    """Перебирает конфигурации и возвращает лучшую по страницам/сек"""
+    cpu_count = os.cpu_count() or 1
+    pages = count_pdf_pages(pdf_path)
+    configs = candidate_configs(cpu_count, max_workers)
+
+    print(f"🖥️  Ядер: {cpu_count}, страниц в образце: {pages}")
+    print(f"🔬 Конфигураций для проверки: {len(configs)}")
+
+    measurements = []
+    for workers, threads in configs:
+        print(f"\n⏱️  Процессов: {workers}, потоков на процесс: {threads}...")
+        try:
+            elapsed = run_config(pdf_path, workers, threads, dpi, use_gpu)
+        except RuntimeError as e:
+            print(f"   ⚠️  {e}")
+            continue
+
+        pages_per_sec = workers * pages / elapsed
+        measurements.append({
+            'workers': workers,
+            'threads_per_worker': threads,
+            'seconds': round(elapsed, 2),
+            'pages_per_sec': round(pages_per_sec, 4)
+        })
+        print(f"   ✅ {elapsed:.1f} сек, {pages_per_sec:.3f} стр/сек")
+
+    if not measurements:
+        return {}
+
+    best = max(measurements, key=lambda m: m['pages_per_sec'])
+    return {
+        'workers': best['workers'],
+        'threads_per_worker': best['threads_per_worker'],
+        'pages_per_sec': best['pages_per_sec'],
+        'cpu_count': cpu_count,
+        'dpi': dpi,
+        'gpu': use_gpu,
+        'sample_file': pdf_path.name,
+        'measurements': measurements
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Подбор числа процессов и потоков для easyocr_script.py',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Примеры использования:
+  %(prog)s input/document.pdf
+  %(prog)s input/document.pdf --max-workers 4 --output ocr_workers.json
+  python3 easyocr_script.py input/document.pdf --thread-config ocr_workers.json
+        """
+    )
+    parser.add_argument('pdf_file', type=str,
+                        help='PDF-образец для замеров (лучше 1-3 страницы)')
+    parser.add_argument('--output', '-o', type=str, default='ocr_workers.json',
+                        help='Файл для лучшей конфигурации (по умолчанию: ocr_workers.json)')
+    parser.add_argument('--max-workers', type=int, default=8,
+                        help='Максимум одновременных процессов (по умолчанию: 8)')
+    parser.add_argument('--dpi', type=int, default=400,
+                        help='DPI для замеров (по умолчанию: 400)')
+    parser.add_argument('--gpu', action='store_true',
+                        help='Замерять с GPU')
+
+    args = parser.parse_args()
+
+    pdf_path = Path(args.pdf_file)
+    if not pdf_path.exists():
+        print(f"❌ Файл не найден: {pdf_path}")
+        sys.exit(1)
+
+    result = autotune(pdf_path, args.max_workers, args.dpi, args.gpu)
+    if not result:
+        print("\n❌ Ни одна конфигурация не отработала")
+        sys.exit(1)
+
+    output_file = Path(args.output)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(f"\n{'='*70}")
+    print(f"🏆 Лучшая конфигурация: {result['workers']} процесс(ов) × "
+          f"{result['threads_per_worker']} поток(ов), {result['pages_per_sec']:.3f} стр/сек")
+    print(f"💾 Сохранено: {output_file}")
+    print(f"{'='*70}")
+
+
+if __name__ == '__main__':
+    main()
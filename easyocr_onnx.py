@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime бэкенд для EasyOCR (только CPU).
+Модели детектора (CRAFT) и распознавателя экспортируются в ONNX один раз,
+квантуются в int8 и кэшируются на диске. Затем подменяют torch-модели
+внутри easyocr.Reader, так что весь остальной код EasyOCR/img2table не меняется.
+"""
+
+import copy
+import hashlib
+from pathlib import Path
+from typing import List, Dict
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'letterexplorer' / 'onnx'
+ONNX_PRECISIONS = ['int8', 'fp32']
+ONNX_OPSET = 14
+
+
+class OnnxModule:
+    """Обёртка над onnxruntime.InferenceSession с интерфейсом torch-модели
+    
+    EasyOCR вызывает детектор как net(x) и распознаватель как model(image, text),
+    ожидая torch-тензоры на выходе. Лишние позиционные аргументы (text)
+    отбрасываются - в ONNX-графе их нет.
+    """
+    
+    def __init__(self, session):
+        self.session = session
+        self.input_names = [inp.name for inp in session.get_inputs()]
+    
+    def eval(self):
+        return self
+    
+    def __call__(self, *inputs):
+        import torch
+        feeds = {
+            name: tensor.detach().cpu().numpy().astype(np.float32)
+            for name, tensor in zip(self.input_names, inputs)
+        }
+        outputs = [torch.from_numpy(output) for output in self.session.run(None, feeds)]
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+
+def _cache_key(lang: List[str]) -> str:
+    """Ключ кэша: версии библиотек + языки (набор моделей EasyOCR зависит от языков)"""
+    import easyocr
+    import torch
+    raw = f"easyocr={easyocr.__version__};torch={torch.__version__};lang={','.join(sorted(lang))}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def _export_models(lang: List[str], target_dir: Path) -> Dict[str, Path]:
+    """Экспортирует детектор и распознаватель EasyOCR в ONNX (fp32)"""
+    import torch
+    import easyocr
+    
+    print("📦 Экспорт моделей EasyOCR в ONNX (выполняется один раз)...")
+    # quantize=False: на CPU EasyOCR по умолчанию квантует распознаватель средствами torch,
+    # такой граф не экспортируется в ONNX
+    reader = easyocr.Reader(lang, gpu=False, quantize=False, verbose=False)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    paths = {
+        'detector': target_dir / 'detector.onnx',
+        'recognizer': target_dir / 'recognizer.onnx'
+    }
+    
+    detector = reader.detector.module if hasattr(reader.detector, 'module') else reader.detector
+    detector.eval()
+    torch.onnx.export(
+        detector,
+        torch.randn(1, 3, 640, 640),
+        str(paths['detector']),
+        input_names=['image'],
+        output_names=['score', 'feature'],
+        dynamic_axes={
+            'image': {0: 'batch', 2: 'height', 3: 'width'},
+            'score': {0: 'batch', 1: 'height', 2: 'width'},
+            'feature': {0: 'batch', 2: 'height', 3: 'width'}
+        },
+        opset_version=ONNX_OPSET
+    )
+    
+    recognizer = reader.recognizer.module if hasattr(reader.recognizer, 'module') else reader.recognizer
+    recognizer = copy.deepcopy(recognizer).eval()
+    # AdaptiveAvgPool2d((None, 1)) не экспортируется при динамической ширине,
+    # но по смыслу это среднее по последней оси
+    if hasattr(recognizer, 'AdaptiveAvgPool'):
+        recognizer.AdaptiveAvgPool = _mean_last_dim_module()
+    
+    torch.onnx.export(
+        _recognizer_export_module(recognizer),
+        torch.randn(1, 1, 64, 256),
+        str(paths['recognizer']),
+        input_names=['image'],
+        output_names=['preds'],
+        dynamic_axes={
+            'image': {0: 'batch', 3: 'width'},
+            'preds': {0: 'batch', 1: 'steps'}
+        },
+        opset_version=ONNX_OPSET
+    )
+    
+    print(f"✅ ONNX модели сохранены: {target_dir}")
+    return paths
+
+
+def _quantize(model_path: Path) -> Path:
+    """Динамическая int8-квантизация весов ONNX модели"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    
+    quantized_path = model_path.with_suffix('.int8.onnx')
+    quantize_dynamic(str(model_path), str(quantized_path), weight_type=QuantType.QInt8)
+    print(f"✅ Квантовано в int8: {quantized_path.name}")
+    return quantized_path
+
+
+def prepare_onnx_models(lang: List[str], cache_dir: Path = DEFAULT_CACHE_DIR,
+                        precision: str = 'int8') -> Dict[str, Path]:
+    """Возвращает пути к ONNX моделям, при необходимости экспортируя их в кэш"""
+    if precision not in ONNX_PRECISIONS:
+        raise ValueError(f"Неизвестная точность ONNX: {precision}")
+    
+    target_dir = Path(cache_dir) / _cache_key(lang)
+    paths = {
+        'detector': target_dir / 'detector.onnx',
+        'recognizer': target_dir / 'recognizer.onnx'
+    }
+    
+    if not all(path.exists() for path in paths.values()):
+        paths = _export_models(lang, target_dir)
+    
+    if precision == 'int8':
+        for name, path in paths.items():
+            quantized_path = path.with_suffix('.int8.onnx')
+            paths[name] = quantized_path if quantized_path.exists() else _quantize(path)
+    
+    return paths
+
+
+def create_session(model_path: Path, threads: int = 0):
+    """Создаёт сессию ONNX Runtime на CPU"""
+    import onnxruntime as ort
+    
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return ort.InferenceSession(str(model_path), sess_options=options,
+                                providers=['CPUExecutionProvider'])
+
+
+def enable_onnx_backend(reader, lang: List[str], cache_dir: Path = DEFAULT_CACHE_DIR,
+                        precision: str = 'int8'):
+    """Подменяет torch-модели easyocr.Reader на сессии ONNX Runtime"""
+    import torch
+    
+    paths = prepare_onnx_models(lang, cache_dir, precision)
+    # Согласуем с --threads-per-worker (configure_thread_budget задаёт torch.set_num_threads)
+    threads = torch.get_num_threads()
+    
+    reader.detector = OnnxModule(create_session(paths['detector'], threads))
+    reader.recognizer = OnnxModule(create_session(paths['recognizer'], threads))
+    reader.device = 'cpu'
+    print(f"⚡ EasyOCR работает через ONNX Runtime ({precision}, потоков: {threads})")
+    return reader
+
+
+# torch импортируется лениво, поэтому вспомогательные модули создаются фабриками
+
+def _mean_last_dim_module():
+    import torch
+    
+    class MeanLastDim(torch.nn.Module):
+        def forward(self, x):
+            return x.mean(dim=-1, keepdim=True)
+    
+    return MeanLastDim()
+
+
+def _recognizer_export_module(model):
+    import torch
+    
+    class RecognizerExport(torch.nn.Module):
+        """Распознаватель без неиспользуемого входа text (CTC-модели его игнорируют)"""
+        def __init__(self, wrapped):
+            super().__init__()
+            self.wrapped = wrapped
+        
+        def forward(self, image):
+            return self.wrapped(image, None)
+    
+    return RecognizerExport(model)
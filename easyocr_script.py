@@ -3,38 +3,225 @@
 """
 OCR скрипт с использованием EasyOCR для лучшего распознавания таблиц.
 Таблицы представляются в Markdown формате.
+
+Тяжёлые библиотеки (pdf2image, img2table/torch, pytesseract, pandas, PIL)
+импортируются только на том этапе, где они нужны, поэтому --help и ошибки
+аргументов отрабатывают мгновенно.
 """
 
+from __future__ import annotations
+
 import argparse
+import io
+import json
+import os
 import sys
+import zipfile
 from pathlib import Path
-from pdf2image import convert_from_path
-from img2table.document import Image as Img2TableImage
-from img2table.ocr import EasyOCR
-import pytesseract
-from PIL import Image
-import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from PIL import Image
+
+# Переменные окружения, ограничивающие пулы потоков (OpenMP/BLAS, Tesseract)
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'OMP_THREAD_LIMIT']
+
+
+def configure_thread_budget(threads: int):
+    """Согласованно ограничивает число потоков torch, OpenCV, OpenMP и Tesseract
+    
+    Нужно при запуске нескольких процессов easyocr_script.py на одной машине:
+    каждая библиотека по умолчанию занимает все ядра, и процессы мешают друг другу.
+    Вызывать до начала распознавания.
+    """
+    if threads < 1:
+        raise ValueError(f"Число потоков должно быть >= 1: {threads}")
+    
+    # Tesseract запускается подпроцессом и наследует окружение
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+    
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Можно задать только до первой параллельной операции
+            pass
+    except ImportError:
+        pass
+    
+    print(f"🧵 Потоков на процесс: {threads}")
+
+
+def load_thread_config(config_path: Path) -> int:
+    """Читает threads_per_worker из файла, созданного easyocr_autotune.py
+    
+    Процессы скрипт сам не запускает: workers из файла только печатается как
+    рекомендуемое число одновременных запусков easyocr_script.py.
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    if 'workers' in config:
+        print(f"🚀 Рекомендуется запускать одновременно: {config['workers']} процесс(ов) "
+              f"(подобрано easyocr_autotune.py)")
+    return int(config['threads_per_worker'])
+
+
+# Политики сохранения промежуточных файлов (изображения страниц, таблицы)
+ARTIFACT_POLICIES = ['full', 'none', 'thumbnails', 'compressed', 'archive']
+
+
+class ArtifactStore:
+    """Сохранение промежуточных файлов согласно выбранной политике
+    
+    full        - page_N.png (полное разрешение) + tableN.csv (как раньше)
+    none        - изображения страниц не сохраняются
+    thumbnails  - уменьшенные копии страниц page_N.jpg
+    compressed  - страницы в lossless WebP (page_N.webp)
+    archive     - один архив [имя_файла]_artifacts.zip на документ: страницы в
+                  градациях серого вдвое меньше (200 DPI при 400), lossy WebP
+    
+    Во всех режимах, кроме full, таблицы собираются в один файл на документ.
+    Запись падает больше чем на 90% в none, thumbnails и archive; в compressed
+    страница весит ~25-80% от PNG (больше всего - на сканах с шумом), и без потерь
+    меньше не получить.
+    """
+    
+    THUMBNAIL_SIZE = (1024, 1024)
+    
+    # Страницы в архиве: уменьшение в ARCHIVE_REDUCE раз и качество WebP
+    ARCHIVE_REDUCE = 2
+    ARCHIVE_QUALITY = 80
+    
+    def __init__(self, output_dir: Path, doc_stem: str, policy: str = 'full'):
+        if policy not in ARTIFACT_POLICIES:
+            raise ValueError(f"Неизвестная политика артефактов: {policy}")
+        self.output_dir = output_dir
+        self.doc_stem = doc_stem
+        self.policy = policy
+        self.tables: List[Dict[str, Any]] = []
+        self.archive: Optional[zipfile.ZipFile] = None
+        if policy == 'archive':
+            self.archive = zipfile.ZipFile(self.archive_path, 'w')
+    
+    @property
+    def archive_path(self) -> Path:
+        return self.output_dir / f"{self.doc_stem}_artifacts.zip"
+    
+    @property
+    def tables_path(self) -> Path:
+        return self.output_dir / f"{self.doc_stem}_tables.json"
+    
+    def save_page(self, page_num: int, image: Image.Image) -> Optional[Path]:
+        """Сохраняет изображение страницы. Возвращает путь (или None)"""
+        if self.policy == 'full':
+            path = self.output_dir / f"page_{page_num}.png"
+            image.save(path, "PNG")
+            return path
+        
+        if self.policy == 'thumbnails':
+            thumb = image.convert('L')
+            thumb.thumbnail(self.THUMBNAIL_SIZE)
+            path = self.output_dir / f"page_{page_num}.jpg"
+            thumb.save(path, "JPEG", quality=80)
+            return path
+        
+        if self.policy == 'compressed':
+            path = self.output_dir / f"page_{page_num}.webp"
+            image.save(path, "WEBP", lossless=True, method=4)
+            return path
+        
+        if self.policy == 'archive':
+            page = image.convert('L').reduce(self.ARCHIVE_REDUCE)
+            buffer = io.BytesIO()
+            page.save(buffer, "WEBP", quality=self.ARCHIVE_QUALITY, method=4)
+            # WebP уже сжат, повторно не сжимаем
+            self.archive.writestr(f"page_{page_num}.webp", buffer.getvalue(),
+                                  compress_type=zipfile.ZIP_STORED)
+            return self.archive_path
+        
+        return None
+    
+    def save_table(self, table_num: int, page_num: int, df: pd.DataFrame, bbox: Any) -> Path:
+        """Сохраняет таблицу. Возвращает путь к файлу, содержащему таблицу"""
+        if self.policy == 'full':
+            csv_path = self.output_dir / f"table{table_num}.csv"
+            df.to_csv(csv_path, index=False, encoding='utf-8')
+            return csv_path
+        
+        if self.policy == 'archive':
+            self.archive.writestr(f"table{table_num}.csv",
+                                  df.to_csv(index=False),
+                                  compress_type=zipfile.ZIP_DEFLATED)
+            return self.archive_path
+        
+        # Копим таблицы в памяти и пишем одним файлом в close()
+        self.tables.append({
+            'table_number': table_num,
+            'page': page_num,
+            'bbox': str(bbox),
+            'columns': [str(col) for col in df.columns],
+            'rows': df.astype(object).where(df.notna(), None).values.tolist()
+        })
+        return self.tables_path
+    
+    def close(self):
+        """Завершает запись артефактов документа"""
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        
+        if self.tables:
+            with open(self.tables_path, 'w', encoding='utf-8') as f:
+                json.dump({'source_file': self.doc_stem, 'tables': self.tables},
+                          f, ensure_ascii=False, default=str)
+            self.tables = []
+
 
 class EasyOCRProcessor:
     """Обработчик PDF с использованием EasyOCR"""
     
-    def __init__(self, pdf_path: Path, output_dir: Path, dpi: int = 400, use_gpu: bool = False, min_confidence: int = 30):
+    def __init__(self, pdf_path: Path, output_dir: Path, dpi: int = 400, use_gpu: bool = False, min_confidence: int = 30,
+                 artifacts: str = 'full', backend: str = 'torch', onnx_precision: str = 'int8',
+                 onnx_cache: Optional[Path] = None, layout: bool = False, layout_workers: int = 4):
         self.pdf_path = pdf_path
         self.output_dir = output_dir
         self.dpi = dpi
         self.use_gpu = use_gpu
         self.min_confidence = min_confidence
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.artifacts = ArtifactStore(output_dir, pdf_path.stem, policy=artifacts)
+        self.layout = layout
+        self.layout_workers = layout_workers
         
         # Инициализируем EasyOCR один раз
         gpu_status = "GPU" if use_gpu else "CPU"
         print(f"🔧 Инициализируем EasyOCR ({gpu_status})...")
+        from img2table.ocr import EasyOCR
         self.ocr = EasyOCR(lang=["ru", "en"], kw={"gpu": use_gpu})
+        
+        # ONNX Runtime вместо torch (только CPU)
+        if backend == 'onnx':
+            from easyocr_onnx import enable_onnx_backend, DEFAULT_CACHE_DIR
+            if use_gpu:
+                print("⚠️  ONNX бэкенд работает только на CPU, --gpu игнорируется")
+            enable_onnx_backend(self.ocr.reader, ["ru", "en"],
+                                cache_dir=onnx_cache or DEFAULT_CACHE_DIR,
+                                precision=onnx_precision)
     
     def convert_pdf_to_images(self) -> List[Image.Image]:
         """Конвертирует PDF в изображения"""
         print(f"📄 Конвертируем PDF в изображения (DPI={self.dpi})...")
+        from pdf2image import convert_from_path
         try:
             images = convert_from_path(
                 str(self.pdf_path),
@@ -47,11 +234,14 @@ class EasyOCRProcessor:
             print(f"❌ Ошибка при конвертации PDF: {e}")
             sys.exit(1)
     
-    def extract_tables_from_image(self, image_path: Path) -> List[Dict[str, Any]]:
-        """Извлекает таблицы из изображения"""
+    def extract_tables_from_image(self, image_src) -> List[Dict[str, Any]]:
+        """Извлекает таблицы из изображения (путь к файлу или PNG-байты)"""
+        from img2table.document import Image as Img2TableImage
         try:
+            if isinstance(image_src, Path):
+                image_src = str(image_src)
             # detect_rotation=True для автоматического исправления наклона
-            img_doc = Img2TableImage(src=str(image_path), detect_rotation=True)
+            img_doc = Img2TableImage(src=image_src, detect_rotation=True)
             tables = img_doc.extract_tables(
                 ocr=self.ocr,
                 implicit_rows=True,
@@ -71,20 +261,31 @@ class EasyOCRProcessor:
             print(f"⚠️  Ошибка при извлечении таблиц: {e}")
             return []
     
-    def extract_text_from_image(self, image_path: Path, exclude_bboxes: List = None) -> str:
+    def extract_text_from_image(self, image, exclude_bboxes: List = None) -> str:
         """Извлекает весь текст со страницы используя Tesseract, исключая области таблиц"""
         try:
-            # Загружаем изображение
-            from PIL import ImageDraw
-            image = Image.open(image_path)
+            # Загружаем изображение (если передан путь)
+            import pytesseract
+            from PIL import Image, ImageDraw
+            if not isinstance(image, Image.Image):
+                image = Image.open(image)
             
             # Если есть области для исключения (таблицы), закрашиваем их белым
             if exclude_bboxes:
+                # Не портим исходное изображение страницы
+                image = image.copy()
                 draw = ImageDraw.Draw(image)
                 for bbox in exclude_bboxes:
                     # bbox содержит x1, y1, x2, y2
                     draw.rectangle([bbox.x1, bbox.y1, bbox.x2, bbox.y2], fill='white')
             
+            # Анализ вёрстки: блоки в порядке чтения, каждый со своим --psm
+            if self.layout:
+                from layout_analysis import LayoutAnalyzer, ocr_blocks
+                blocks = LayoutAnalyzer(dpi=self.dpi).analyze(image)
+                print(f"   🧱 Текстовых блоков: {len(blocks)}")
+                return ocr_blocks(image, blocks, lang='rus+eng', workers=self.layout_workers)
+            
             # Используем pytesseract для обычного текста (быстрее чем EasyOCR)
             text = pytesseract.image_to_string(
                 image,
@@ -96,9 +297,9 @@ class EasyOCRProcessor:
             print(f"⚠️  Ошибка при извлечении текста: {e}")
             return ""
     
-    def dataframe_to_markdown(self, df: pd.DataFrame) -> str:
-        """Конвертирует DataFrame в Markdown таблицу"""
-        lines = []
+    def dataframe_rows(self, df: pd.DataFrame) -> List[List[str]]:
+        """Строки таблицы (первая - заголовок) с пустыми строками вместо None/NaN"""
+        import pandas as pd
         
         # Заголовок
         headers = []
@@ -107,8 +308,7 @@ class EasyOCRProcessor:
             header = str(col) if col is not None and str(col) != 'None' else ''
             headers.append(header)
         
-        lines.append('| ' + ' | '.join(headers) + ' |')
-        lines.append('|' + '|'.join(['---' for _ in headers]) + '|')
+        rows = [headers]
         
         # Данные
         for _, row in df.iterrows():
@@ -120,19 +320,62 @@ class EasyOCRProcessor:
                 else:
                     cell = str(val).replace('\n', ' ').strip()
                 cells.append(cell)
+            rows.append(cells)
+        
+        return rows
+    
+    def dataframe_to_markdown(self, df: pd.DataFrame) -> str:
+        """Конвертирует DataFrame в Markdown таблицу"""
+        headers, *rows = self.dataframe_rows(df)
+        
+        lines = []
+        lines.append('| ' + ' | '.join(headers) + ' |')
+        lines.append('|' + '|'.join(['---' for _ in headers]) + '|')
+        for cells in rows:
             lines.append('| ' + ' | '.join(cells) + ' |')
         
         return '\n'.join(lines)
     
+    def recognize_page(self, image) -> Dict[str, Any]:
+        """Общий интерфейс движков (ocr_engines.py): страница RGB -> блоки текста и таблицы
+        
+        Tesseract здесь возвращает текст страницы целиком, без рамок строк,
+        поэтому весь текст вне таблиц - один блок.
+        """
+        from PIL import Image
+        if not isinstance(image, Image.Image):
+            image = Image.fromarray(image)
+        
+        page_buffer = io.BytesIO()
+        image.save(page_buffer, "PNG", compress_level=1)
+        tables = self.extract_tables_from_image(page_buffer.getvalue())
+        
+        table_bboxes = [table['bbox'] for table in tables] if tables else None
+        text = self.extract_text_from_image(image, exclude_bboxes=table_bboxes)
+        
+        blocks = []
+        if text:
+            blocks.append({'text': text, 'bbox': (0, 0, image.width, image.height), 'confidence': None})
+        
+        return {
+            'blocks': blocks,
+            'tables': [
+                {
+                    'bbox': (table['bbox'].x1, table['bbox'].y1, table['bbox'].x2, table['bbox'].y2),
+                    'rows': self.dataframe_rows(table['df'])
+                }
+                for table in tables
+            ]
+        }
+    
     def process_page(self, page_num: int, image: Image.Image, table_counter: int) -> tuple[str, int]:
         """Обрабатывает одну страницу. Возвращает (текст_страницы, обновленный_счетчик_таблиц)"""
         print(f"\n{'='*70}")
         print(f"📄 Обработка страницы {page_num}")
         print(f"{'='*70}")
         
-        # Сохраняем изображение страницы
-        image_path = self.output_dir / f"page_{page_num}.png"
-        image.save(image_path, "PNG")
+        # Сохраняем изображение страницы согласно политике артефактов
+        self.artifacts.save_page(page_num, image)
         
         result_parts = []
         result_parts.append(f"\n{'='*70}")
@@ -141,7 +384,10 @@ class EasyOCRProcessor:
         
         # Извлекаем таблицы
         print("🔍 Поиск таблиц...")
-        tables = self.extract_tables_from_image(image_path)
+        # img2table получает страницу из памяти, без записи на диск
+        page_buffer = io.BytesIO()
+        image.save(page_buffer, "PNG", compress_level=1)
+        tables = self.extract_tables_from_image(page_buffer.getvalue())
         
         if tables:
             print(f"✅ Найдено таблиц: {len(tables)}")
@@ -151,7 +397,7 @@ class EasyOCRProcessor:
         # Извлекаем текст, исключая области таблиц
         print("📝 Извлечение текста...")
         table_bboxes = [table['bbox'] for table in tables] if tables else None
-        text = self.extract_text_from_image(image_path, exclude_bboxes=table_bboxes)
+        text = self.extract_text_from_image(image, exclude_bboxes=table_bboxes)
         
         if text:
             result_parts.append("## Текст\n")
@@ -180,10 +426,9 @@ class EasyOCRProcessor:
                 result_parts.append(markdown_table)
                 result_parts.append("")
                 
-                # Сохраняем также в CSV со сквозной нумерацией
-                csv_path = self.output_dir / f"table{table_counter}.csv"
-                df.to_csv(csv_path, index=False, encoding='utf-8')
-                print(f"   💾 CSV: {csv_path}")
+                # Сохраняем также таблицу (CSV или общий файл документа)
+                table_path = self.artifacts.save_table(table_counter, page_num, df, bbox)
+                print(f"   💾 Таблица: {table_path}")
         
         return '\n'.join(result_parts), table_counter
     
@@ -200,9 +445,12 @@ class EasyOCRProcessor:
         all_pages = []
         table_counter = 0  # Глобальный счетчик таблиц
         
-        for page_num, image in enumerate(images, start=1):
-            page_text, table_counter = self.process_page(page_num, image, table_counter)
-            all_pages.append(page_text)
+        try:
+            for page_num, image in enumerate(images, start=1):
+                page_text, table_counter = self.process_page(page_num, image, table_counter)
+                all_pages.append(page_text)
+        finally:
+            self.artifacts.close()
         
         # Объединяем всё
         final_text = '\n\n'.join(all_pages)
@@ -235,6 +483,10 @@ def main():
   %(prog)s input/document.pdf --output output/easyocr/
   %(prog)s input/document.pdf --dpi 400
   %(prog)s input/document.pdf --gpu  # использовать GPU для ускорения
+  %(prog)s input/document.pdf --artifacts archive  # один архив вместо page_N.png/tableN.csv
+  %(prog)s input/document.pdf --threads-per-worker 4  # несколько процессов на одной машине
+  %(prog)s input/document.pdf --backend onnx  # ONNX Runtime + int8 на CPU
+  %(prog)s input/document.pdf --layout  # блоки в порядке чтения (многоколоночные шапки)
         """
     )
     
@@ -271,6 +523,67 @@ def main():
         help='Минимальная уверенность OCR для ячейки таблицы (по умолчанию: 30)'
     )
     
+    parser.add_argument(
+        '--artifacts',
+        choices=ARTIFACT_POLICIES,
+        default='full',
+        help='Промежуточные файлы: full (page_N.png + tableN.csv), none, thumbnails, '
+             'compressed (lossless WebP), archive (один zip на документ, страницы - 200 DPI lossy WebP). '
+             'Кроме full, таблицы собираются в один файл (по умолчанию: full)'
+    )
+    
+    parser.add_argument(
+        '--threads-per-worker',
+        type=int,
+        default=None,
+        help='Число потоков torch/OpenCV/OpenMP/Tesseract на процесс '
+             '(по умолчанию: без ограничений)'
+    )
+    
+    parser.add_argument(
+        '--thread-config',
+        type=str,
+        default=None,
+        help='JSON от easyocr_autotune.py: применяет threads_per_worker, печатает рекомендуемое '
+             'число процессов (workers)'
+    )
+    
+    parser.add_argument(
+        '--backend',
+        choices=['torch', 'onnx'],
+        default='torch',
+        help='Движок инференса EasyOCR: torch или onnx (ONNX Runtime, только CPU) '
+             '(по умолчанию: torch)'
+    )
+    
+    parser.add_argument(
+        '--onnx-precision',
+        choices=['int8', 'fp32'],
+        default='int8',
+        help='Точность ONNX моделей (по умолчанию: int8)'
+    )
+    
+    parser.add_argument(
+        '--onnx-cache',
+        type=str,
+        default=None,
+        help='Каталог кэша экспортированных ONNX моделей (по умолчанию: ~/.cache/letterexplorer/onnx)'
+    )
+    
+    parser.add_argument(
+        '--layout',
+        action='store_true',
+        help='Разбивать страницу на текстовые блоки (шапка, адресаты, текст, подписи) '
+             'и распознавать их параллельно в порядке чтения'
+    )
+    
+    parser.add_argument(
+        '--layout-workers',
+        type=int,
+        default=4,
+        help='Число параллельных процессов Tesseract для блоков (по умолчанию: 4)'
+    )
+    
     args = parser.parse_args()
     
     # Проверяем входной файл
@@ -289,13 +602,26 @@ def main():
     else:
         output_dir = Path('output') / f"{pdf_path.stem}_easyocr"
     
+    # Ограничиваем потоки до инициализации EasyOCR
+    threads = args.threads_per_worker
+    if threads is None and args.thread_config:
+        threads = load_thread_config(Path(args.thread_config))
+    if threads is not None:
+        configure_thread_budget(threads)
+    
     # Обрабатываем PDF
     processor = EasyOCRProcessor(
         pdf_path, 
         output_dir, 
         dpi=args.dpi, 
         use_gpu=args.gpu,
-        min_confidence=args.min_confidence
+        min_confidence=args.min_confidence,
+        artifacts=args.artifacts,
+        backend=args.backend,
+        onnx_precision=args.onnx_precision,
+        onnx_cache=Path(args.onnx_cache) if args.onnx_cache else None,
+        layout=args.layout,
+        layout_workers=args.layout_workers
     )
     text = processor.process()
     output_file = processor.save_result(text)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш ответов LLM на диске (SQLite) для llm_regex_analyzer.py и LLM-скриптов research/
+
+Ключ - SHA-256 от запроса к Ollama /api/generate без транспортных полей:
+модель, полный промпт и параметры генерации (options, format и т.п.). Повторный
+запуск на том же тексте с теми же инструкциями берёт ответ из кэша вместо минут
+генерации.
+
+Записи старше TTL удаляются при чтении и при очистке; если кэш больше лимита
+по размеру, вытесняются давно не использованные записи.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+DEFAULT_CACHE_PATH = Path.home() / '.cache' / 'letterexplorer' / 'llm_cache.sqlite'
+DEFAULT_TTL_DAYS = 30
+DEFAULT_MAX_SIZE_MB = 500
+
+# Поля запроса, которые не влияют на текст ответа
+TRANSPORT_FIELDS = {'stream', 'keep_alive'}
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    """Ключ кэша для запроса к /api/generate"""
+    significant = {k: v for k, v in payload.items() if k not in TRANSPORT_FIELDS}
+    raw = json.dumps(significant, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """Кэш ответов LLM: lookup(payload) перед запросом, store(payload, ответ) после
+    
+    read=False - ответы из кэша не берутся (принудительное обновление), но пишутся.
+    """
+    
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, ttl_days: float = DEFAULT_TTL_DAYS,
+                 max_size_mb: float = DEFAULT_MAX_SIZE_MB, read: bool = True):
+        self.path = Path(path)
+        self.ttl = ttl_days * 86400 if ttl_days else None
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.read = read
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        # Те же счётчики по меткам запросов (например, по документам пакета)
+        self.label_stats = {}
+        
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Одно соединение на кэш; запросы из нескольких потоков идут под блокировкой
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                size INTEGER,
+                created REAL,
+                last_used REAL,
+                hits INTEGER DEFAULT 0
+            )
+        """)
+        self.db.commit()
+    
+    def _count(self, label: str, key: str):
+        """+1 к счётчику key (hits / misses / stores) по метке; вызывается под self.lock"""
+        if label:
+            stats = self.label_stats.setdefault(label, {"hits": 0, "misses": 0, "stores": 0})
+            stats[key] += 1
+    
+    def lookup(self, payload: Dict[str, Any], label: str = '') -> Optional[str]:
+        """Ответ из кэша или None (label - метка для stats(label))"""
+        if not self.read:
+            return None
+        
+        key = cache_key(payload)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl and now - row[1] > self.ttl:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.db.commit()
+                row = None
+            
+            if row is None:
+                self.misses += 1
+                self._count(label, 'misses')
+                return None
+            
+            self.db.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self.db.commit()
+            self.hits += 1
+            self._count(label, 'hits')
+            return row[0]
+    
+    def store(self, payload: Dict[str, Any], response: str, label: str = ''):
+        """Сохраняет ответ и при необходимости вытесняет старые записи"""
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (cache_key(payload), payload.get('model'), response, size, now, now)
+            )
+            self.stores += 1
+            self._count(label, 'stores')
+            self._evict(now)
+            self.db.commit()
+    
+    def _evict(self, now: float):
+        if self.ttl:
+            self.db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_size:
+            return
+        
+        # Давно не использованные - первыми
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= self.max_size:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+    
+    def clear(self):
+        """Удаляет все записи"""
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+    
+    def stats(self, label: Optional[str] = None) -> Dict[str, Any]:
+        """Статистика за запуск (попадания/промахи; label - только с этой меткой) и размер кэша"""
+        with self.lock:
+            entries, size = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            if label is None:
+                counts = {"hits": self.hits, "misses": self.misses, "stores": self.stores}
+            else:
+                counts = dict(self.label_stats.get(label, {"hits": 0, "misses": 0, "stores": 0}))
+        lookups = counts['hits'] + counts['misses']
+        return {
+            **counts,
+            "hit_rate": round(counts['hits'] / lookups, 3) if lookups else None,
+            "entries": entries,
+            "size_mb": round(size / 1024 / 1024, 2)
+        }
+    
+    def print_stats(self, label: Optional[str] = None):
+        stats = self.stats(label)
+        print(f"🗄️  Кэш LLM: попаданий {stats['hits']}, промахов {stats['misses']}, "
+              f"записей {stats['entries']} ({stats['size_mb']} МБ) - {self.path}")
+
+
+def add_cache_arguments(parser):
+    """Аргументы кэша для CLI LLM-скриптов"""
+    parser.add_argument('--cache-file', default=str(DEFAULT_CACHE_PATH),
+                        help=f'Файл кэша ответов LLM (по умолчанию: {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--cache-ttl-days', type=float, default=DEFAULT_TTL_DAYS,
+                        help=f'Срок жизни записей кэша в днях, 0 - бессрочно (по умолчанию: {DEFAULT_TTL_DAYS})')
+    parser.add_argument('--cache-max-mb', type=float, default=DEFAULT_MAX_SIZE_MB,
+                        help=f'Максимальный размер кэша в МБ (по умолчанию: {DEFAULT_MAX_SIZE_MB})')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Не использовать кэш ответов LLM')
+    parser.add_argument('--refresh-cache', action='store_true',
+                        help='Не брать ответы из кэша, но обновить их')
+
+
+def cache_from_args(args) -> Optional[LLMCache]:
+    """LLMCache по аргументам add_cache_arguments (None при --no-cache)"""
+    if args.no_cache:
+        return None
+    try:
+        return LLMCache(args.cache_file, ttl_days=args.cache_ttl_days,
+                        max_size_mb=args.cache_max_mb, read=not args.refresh_cache)
+    except (sqlite3.Error, OSError) as e:
+        print(f"⚠️  Кэш LLM недоступен ({e}), работаем без него")
+        return None
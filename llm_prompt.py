@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сборка промптов для LLM-скриптов с неизменным префиксом
+
+Ollama переиспользует KV-кэш модели для совпадающего начала промпта: если
+несколько запросов подряд начинаются с одних и тех же байтов, повторно
+обрабатывается только отличающийся хвост. Поэтому промпт всегда собирается в
+одном порядке:
+
+    1. статические инструкции (одинаковые для всех документов и задач)
+    2. текст документа (одинаковый для всех задач по документу)
+    3. задание конкретного запроса (раздел, блок, задача)
+
+и части склеиваются одинаково, чтобы префикс совпадал побайтно.
+
+ContextPlanner следит, чтобы промпт и ответ помещались в окно контекста модели:
+Ollama молча отбрасывает начало промпта, не вошедшее в num_ctx. Токены
+оцениваются по числу символов (кириллица - мельче латиницы) с поправкой по
+prompt_eval_count из ответов Ollama. Документ, не влезающий в окно, делится на
+части по границам абзацев и страниц (несколько запросов) или сокращается до
+самых релевантных задаче фрагментов - с сообщением, сколько пропущено.
+"""
+
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+DIVIDER = '═' * 64
+
+DOCUMENT_TITLE = 'ТЕКСТ ДОКУМЕНТА ДЛЯ АНАЛИЗА'
+
+
+def document_block(document: str, title: str = DOCUMENT_TITLE) -> str:
+    """Текст документа между разделителями"""
+    return f"{DIVIDER}\n{title}:\n{DIVIDER}\n\n{document.strip()}\n\n{DIVIDER}"
+
+
+def build_prompt(instructions: str, document: str = '', task: str = '',
+                 document_title: str = DOCUMENT_TITLE) -> str:
+    """Промпт: инструкции, затем документ, затем задание"""
+    parts = [instructions.strip()]
+    if document:
+        parts.append(document_block(document, document_title))
+    if task:
+        parts.append(task.strip())
+    return '\n\n'.join(parts) + '\n'
+
+
+def part_task(task: str, index: int, total: int) -> str:
+    """Задание для части документа, разбитого планировщиком на total частей"""
+    return (f"{task.strip()}\n\nВ запросе - часть {index} из {total} документа: "
+            f"ищи данные только в ней, ненайденное не выдумывай.")
+
+
+# Окно контекста, если его не сообщили ни --num-ctx, ни модель (/api/show)
+DEFAULT_CONTEXT_WINDOW = 16384
+
+# Больше без явного --num-ctx не берём: память KV-кэша растёт вместе с окном
+MAX_AUTO_CONTEXT_WINDOW = 32768
+
+# Символов на токен для оценки: кириллицу BPE-токенизаторы дробят мельче
+CHARS_PER_TOKEN_CYRILLIC = 2.5
+CHARS_PER_TOKEN_OTHER = 3.5
+
+# Запас окна на неточность оценки
+SAFETY_MARGIN = 0.1
+
+# Меньше этого документу не оставляем, даже если инструкции заняли почти всё окно
+MIN_DOCUMENT_TOKENS = 1000
+
+CYRILLIC = re.compile(r'[а-яёА-ЯЁ]')
+PAGE_MARKER = re.compile(r'^--- Страница')
+WORD = re.compile(r'\w{4,}')
+
+# Вставка на месте пропущенных фрагментов при выборе релевантных
+GAP_MARKER = '\n[...]\n'
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов текста без токенизатора модели"""
+    cyrillic = len(CYRILLIC.findall(text))
+    return int(cyrillic / CHARS_PER_TOKEN_CYRILLIC + (len(text) - cyrillic) / CHARS_PER_TOKEN_OTHER) + 1
+
+
+def paragraphs(text: str) -> List[str]:
+    """Текст абзацами: граница - пустая строка или строка "--- Страница N ---"
+    
+    Абзацы склеиваются обратно в исходный текст без потерь.
+    """
+    result = []
+    current = ''
+    for line in text.splitlines(keepends=True):
+        if current and PAGE_MARKER.match(line):
+            result.append(current)
+            current = ''
+        current += line
+        if not line.strip():
+            result.append(current)
+            current = ''
+    if current:
+        result.append(current)
+    return result
+
+
+def resolve_context_window(num_ctx: Optional[int], model_context: Dict[str, Optional[int]]) -> Tuple[int, str]:
+    """Окно контекста и его источник: --num-ctx, num_ctx модели, предел модели или по умолчанию"""
+    if num_ctx:
+        return num_ctx, '--num-ctx'
+    if model_context.get('num_ctx'):
+        return model_context['num_ctx'], 'num_ctx модели'
+    if model_context.get('context_length'):
+        return min(model_context['context_length'], MAX_AUTO_CONTEXT_WINDOW), 'предел модели'
+    return DEFAULT_CONTEXT_WINDOW, 'по умолчанию'
+
+
+class ContextPlanner:
+    """Бюджет токенов: инструкции + документ + задание + ответ не больше окна модели"""
+    
+    def __init__(self, context_window: int = DEFAULT_CONTEXT_WINDOW, output_tokens: int = 4096):
+        self.context_window = context_window
+        self.output_tokens = output_tokens
+        # Поправка оценки по фактическому числу токенов от Ollama
+        self.scale = 1.0
+        self.lock = threading.Lock()
+    
+    @classmethod
+    def for_model(cls, pool, model: str, num_ctx: Optional[int] = None,
+                  output_tokens: int = 4096) -> 'ContextPlanner':
+        """Планировщик с окном модели (num_ctx=None - узнать у Ollama)"""
+        model_context = pool.model_context(model) if not num_ctx else {}
+        window, source = resolve_context_window(num_ctx, model_context)
+        print(f"📐 Окно контекста: {window} токенов ({source}), на ответ - {output_tokens}")
+        return cls(window, output_tokens)
+    
+    def count(self, text: str) -> int:
+        return int(estimate_tokens(text) * self.scale) + 1
+    
+    def calibrate(self, prompt: str, prompt_eval_count: Optional[int]):
+        """Поправка оценки по prompt_eval_count ответа Ollama
+        
+        Только в сторону увеличения: при попадании в KV-кэш Ollama считает
+        не весь промпт, и меньшее число токенов ничего не говорит об оценке.
+        """
+        if not prompt_eval_count:
+            return
+        with self.lock:
+            self.scale = max(self.scale, prompt_eval_count / estimate_tokens(prompt))
+    
+    def document_budget(self, instructions: str, task: str = '') -> int:
+        """Сколько токенов остаётся на документ при этих инструкциях и задании"""
+        overhead = self.count(build_prompt(instructions, '-', task))
+        budget = int(self.context_window * (1 - SAFETY_MARGIN)) - self.output_tokens - overhead
+        if budget < MIN_DOCUMENT_TOKENS:
+            print(f"⚠️  Инструкции (~{overhead} токенов) и ответ ({self.output_tokens}) занимают почти всё "
+                  f"окно {self.context_window} - увеличьте --num-ctx")
+            budget = MIN_DOCUMENT_TOKENS
+        return budget
+    
+    def _units(self, document: str, budget: int) -> List[str]:
+        """Абзацы документа; абзац длиннее бюджета делится по строкам, строка - по символам"""
+        units = []
+        for paragraph in paragraphs(document):
+            if self.count(paragraph) <= budget:
+                units.append(paragraph)
+                continue
+            for line in paragraph.splitlines(keepends=True):
+                if self.count(line) <= budget:
+                    units.append(line)
+                    continue
+                step = max(1, len(line) * budget // self.count(line))
+                units.extend(line[i:i + step] for i in range(0, len(line), step))
+        return units
+    
+    def split(self, document: str, budget: int) -> List[str]:
+        """Документ частями не больше budget токенов по границам абзацев (вместе - весь документ)"""
+        parts = []
+        current = ''
+        current_tokens = 0
+        for unit in self._units(document, budget):
+            tokens = self.count(unit)
+            if current and current_tokens + tokens > budget:
+                parts.append(current)
+                current, current_tokens = '', 0
+            current += unit
+            current_tokens += tokens
+        if current.strip():
+            parts.append(current)
+        return parts
+    
+    def plan(self, instructions: str, document: str, task: str = '',
+             max_tokens: Optional[int] = None) -> List[str]:
+        """Части документа, каждая из которых помещается в окно вместе с инструкциями и заданием
+        
+        max_tokens - дополнительный предел части (например, если ответ повторяет её текст).
+        """
+        budget = self.document_budget(instructions, part_task(task, 99, 99))
+        if max_tokens:
+            budget = min(budget, max_tokens)
+        tokens = self.count(document)
+        if tokens <= budget:
+            return [document]
+        
+        parts = self.split(document, budget)
+        print(f"✂️  Документ (~{tokens} токенов) не помещается в окно {self.context_window} "
+              f"(на документ ~{budget}) - {len(parts)} частей")
+        return parts
+    
+    def select(self, instructions: str, document: str, task: str = '', query: str = '') -> Tuple[str, int]:
+        """Самые релевантные query абзацы документа в пределах окна
+        
+        Абзацы ранжируются по числу общих с query слов и возвращаются в
+        исходном порядке, пропуски отмечены [...]. Возвращает (текст, сколько
+        символов документа не вошло); документ, который помещается целиком,
+        возвращается без изменений.
+        """
+        budget = self.document_budget(instructions, task)
+        if self.count(document) <= budget:
+            return document, 0
+        
+        words = {word[:6] for word in WORD.findall(query.lower())}
+        units = self._units(document, budget)
+        scores = [len(words & {word[:6] for word in WORD.findall(unit.lower())}) for unit in units]
+        
+        chosen = set()
+        used = 0
+        for index in sorted(range(len(units)), key=lambda i: (-scores[i], i)):
+            tokens = self.count(units[index]) + self.count(GAP_MARKER)
+            if used + tokens > budget:
+                continue
+            chosen.add(index)
+            used += tokens
+        
+        pieces = []
+        for index, unit in enumerate(units):
+            if index in chosen:
+                pieces.append(unit)
+            elif not pieces or pieces[-1] != GAP_MARKER:
+                pieces.append(GAP_MARKER)
+        omitted = sum(len(unit) for index, unit in enumerate(units) if index not in chosen)
+        print(f"✂️  Документ не помещается в окно {self.context_window}: взяты релевантные фрагменты, "
+              f"пропущено {omitted} из {len(document)} символов")
+        return ''.join(pieces), omitted
+    
+    def options(self) -> Dict[str, Any]:
+        """Опции запроса Ollama: окно одно на все вызовы (смена num_ctx перезагружает модель)"""
+        return {"num_ctx": self.context_window}
+
+
+def add_context_arguments(parser):
+    """Аргумент --num-ctx для CLI LLM-скриптов"""
+    parser.add_argument('--num-ctx', type=int, default=None,
+                        help='Окно контекста модели в токенах (по умолчанию: num_ctx модели из Ollama, '
+                             f'иначе её предел, но не больше {MAX_AUTO_CONTEXT_WINDOW})')
@@ -10,67 +10,296 @@ LLM Regex Analyzer - гибридный подход
 """
 
 import argparse
+import contextvars
 import json
-import requests
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Any, Optional
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from typing import Dict, List, Any, Optional, Tuple, Union
+
+from llm_cache import LLMCache, add_cache_arguments, cache_from_args
+from llm_prompt import DEFAULT_CONTEXT_WINDOW, ContextPlanner, add_context_arguments, build_prompt, part_task
+from llm_schema import ANALYSIS_SCHEMA, DEFAULT_JSON_FORMAT, JSONParseStats, add_format_arguments, response_format
+from ollama_client import (DEFAULT_HEALTH_INTERVAL, DEFAULT_KEEP_ALIVE, DEFAULT_POOL_SIZE, DEFAULT_RETRIES,
+                           OllamaMetrics, OllamaPool, add_http_arguments)
+from pattern_library import DEFAULT_MIN_COVERAGE, DEFAULT_MIN_SIMILARITY, PatternLibrary, regex_flags
+
+# Сколько символов ответа ждать начала JSON-объекта в потоковом режиме
+MAX_PREAMBLE_CHARS = 2000
+
+# Сколько символов после конца JSON дочитывать ради чанка с метриками (при заданном format)
+MAX_TRAILING_CHARS = 200
+
+# Лимит токенов ответа LLM (большие JSON); учитывается и в бюджете окна контекста
+NUM_PREDICT = 8000
+
+# Заголовок раздела инструкций для анализа по разделам
+SECTION_HEADER = re.compile(r'^##\s*РАЗДЕЛ\s+\d+.*$', re.MULTILINE)
+
+# Документ, к которому относятся вызовы LLM текущего потока: метка в метриках Ollama
+CURRENT_DOCUMENT = contextvars.ContextVar('current_document', default='')
+
+
+class IncrementalJSONParser:
+    """Разбор JSON-объекта из ответа LLM по мере генерации
+    
+    feed(chunk) возвращает разделы [(имя, значение)], закрывшиеся в этом куске, -
+    значения-объекты внутри ключа "sections" корневого объекта. Текст до первой
+    "{" (```json и пояснения) пропускается. complete - корневой объект закрыт,
+    error - ответ уже не станет валидным JSON (скобки не сходятся, нет объекта).
+    """
+    
+    def __init__(self, sections_key: str = 'sections'):
+        self.sections_key = sections_key
+        self.buffer = ''
+        self.pos = 0
+        self.start = -1
+        self.end = -1
+        # Открытые контейнеры: {'bracket', 'key', 'start', 'expect_key', 'last_key'}
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = -1
+        self.complete = False
+        self.error = None
+    
+    @property
+    def done(self) -> bool:
+        return self.complete or self.error is not None
+    
+    def json_text(self) -> str:
+        """Текст корневого объекта (после complete) или всё, что получено"""
+        if self.complete:
+            return self.buffer[self.start:self.end]
+        return self.buffer[self.start:] if self.start != -1 else self.buffer
+    
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.buffer += chunk
+        sections = []
+        
+        while self.pos < len(self.buffer) and not self.done:
+            ch = self.buffer[self.pos]
+            
+            if self.start == -1:
+                if ch == '{':
+                    self.start = self.pos
+                    self._open(ch)
+                elif self.pos >= MAX_PREAMBLE_CHARS:
+                    self.error = f"нет JSON-объекта в первых {MAX_PREAMBLE_CHARS} символах"
+            elif self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    top = self.stack[-1]
+                    if top['bracket'] == '{' and top['expect_key']:
+                        top['last_key'] = json.loads(self.buffer[self.string_start:self.pos + 1])
+            elif ch == '"':
+                self.in_string = True
+                self.string_start = self.pos
+            elif ch in '{[':
+                self._open(ch)
+            elif ch in '}]':
+                section = self._close(ch)
+                if section:
+                    sections.append(section)
+            elif ch == ',':
+                if self.stack[-1]['bracket'] == '{':
+                    self.stack[-1]['expect_key'] = True
+            elif ch == ':':
+                self.stack[-1]['expect_key'] = False
+            
+            self.pos += 1
+        
+        return sections
+    
+    def _open(self, bracket: str):
+        parent = self.stack[-1] if self.stack else None
+        key = parent['last_key'] if parent and parent['bracket'] == '{' else None
+        self.stack.append({'bracket': bracket, 'key': key, 'start': self.pos,
+                           'expect_key': bracket == '{', 'last_key': None})
+    
+    def _close(self, bracket: str) -> Optional[Tuple[str, Any]]:
+        opened = self.stack.pop()
+        if {'{': '}', '[': ']'}[opened['bracket']] != bracket:
+            self.error = f"непарная скобка '{bracket}' в позиции {self.pos}"
+            return None
+        
+        if not self.stack:
+            self.complete = True
+            self.end = self.pos + 1
+            return None
+        
+        # Закрылось значение внутри корневого "sections": {...}
+        if (opened['bracket'] == '{' and len(self.stack) == 2
+                and self.stack[1]['key'] == self.sections_key):
+            try:
+                return opened['key'], json.loads(self.buffer[opened['start']:self.pos + 1])
+            except json.JSONDecodeError as e:
+                self.error = f"раздел {opened['key']}: {e}"
+        return None
 
 
 class LLMRegexAnalyzer:
     """Анализатор документов с генерацией regex через LLM"""
     
-    def __init__(self, ollama_url: str, model: str, token: Optional[str] = None, verify_ssl: bool = True):
-        self.ollama_url = ollama_url.rstrip('/')
+    def __init__(self, ollama_url: Union[str, List[str]], model: str, token: Optional[str] = None,
+                 verify_ssl: bool = True, cache: Optional[LLMCache] = None,
+                 health_interval: float = DEFAULT_HEALTH_INTERVAL, retries: int = DEFAULT_RETRIES,
+                 deadline: Optional[float] = None, pool_size: int = DEFAULT_POOL_SIZE,
+                 keep_alive: Union[str, int] = DEFAULT_KEEP_ALIVE, json_format: str = DEFAULT_JSON_FORMAT,
+                 num_ctx: Optional[int] = None):
+        # requests импортируется в OllamaPool, чтобы --help и ошибки аргументов не ждали его загрузки
+        self.pool = OllamaPool(ollama_url, token, verify_ssl, health_interval,
+                               retries=retries, deadline=deadline, pool_size=pool_size)
         self.model = model
         self.token = token
-        self.session = requests.Session()
-        self.session.verify = verify_ssl
-        if token:
-            self.session.headers.update({'X-Access-Token': token})
+        self.cache = cache
+        self.keep_alive = keep_alive
+        self.metrics = OllamaMetrics()
+        # Все ответы анализатора - {"sections": ...}: схема ограничивает генерацию
+        self.response_format = response_format(json_format, ANALYSIS_SCHEMA)
+        self.parse_stats = JSONParseStats()
+        # Окно контекста узнаётся у модели при первом соединении
+        self.num_ctx = num_ctx
+        self.planner = None
+        self.connected = None
+        self.connection_lock = threading.Lock()
     
     def test_connection(self) -> bool:
-        """Тестирует соединение с Ollama"""
-        try:
-            response = self.session.get(f"{self.ollama_url}/api/tags")
-            if response.status_code == 200:
-                print("✅ Соединение с Ollama установлено")
-                return True
-            else:
-                print(f"❌ Ошибка соединения: {response.status_code}")
-                return False
-        except Exception as e:
-            print(f"❌ Ошибка соединения: {e}")
-            return False
+        """Тестирует соединение с Ollama (со всеми серверами)"""
+        return self.pool.check_health()
+    
+    def ensure_connection(self) -> bool:
+        """Проверка соединения один раз за запуск; дальше серверы проверяются в фоне"""
+        with self.connection_lock:
+            if self.connected is None:
+                self.connected = self.test_connection()
+                if self.connected:
+                    self.pool.start_health_checks()
+                    self.planner = ContextPlanner.for_model(self.pool, self.model, self.num_ctx, NUM_PREDICT)
+            return self.connected
+    
+    def context_planner(self) -> ContextPlanner:
+        """Планировщик окна контекста (без соединения - окно по --num-ctx или по умолчанию)"""
+        if self.planner is None and not self.ensure_connection():
+            self.planner = ContextPlanner(self.num_ctx or DEFAULT_CONTEXT_WINDOW, NUM_PREDICT)
+        return self.planner
+    
+    def _payload(self, prompt: str, temperature: float, stream: bool) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": temperature,
+                "top_p": 0.9,
+                "num_predict": NUM_PREDICT  # Увеличиваем лимит для больших JSON
+            }
+        }
+        if self.planner:
+            payload["options"].update(self.planner.options())
+        if self.response_format:
+            payload["format"] = self.response_format
+        return payload
     
     def call_ollama(self, prompt: str, temperature: float = 0.1) -> Optional[str]:
         """Вызывает Ollama API"""
         try:
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": temperature,
-                    "top_p": 0.9,
-                    "num_predict": 8000  # Увеличиваем лимит для больших JSON
-                }
-            }
+            payload = self._payload(prompt, temperature, stream=False)
+            
+            cached = self.cache.lookup(payload, CURRENT_DOCUMENT.get()) if self.cache else None
+            if cached is not None:
+                print("🗄️  Ответ LLM взят из кэша")
+                return cached
             
             print(f"🤖 Отправляем запрос к LLM (модель: {self.model})...")
-            response = self.session.post(f"{self.ollama_url}/api/generate", 
-                                       json=payload, 
-                                       timeout=300)
+            with self.pool.post("/api/generate", json=payload, timeout=300,
+                                label=CURRENT_DOCUMENT.get()) as response:
+                if response.status_code == 200:
+                    result = response.json()
+                    self.metrics.record(result, CURRENT_DOCUMENT.get())
+                    if self.planner:
+                        self.planner.calibrate(prompt, result.get('prompt_eval_count'))
+                    text = result.get('response', '').strip()
+                    if self.cache and text:
+                        self.cache.store(payload, text, CURRENT_DOCUMENT.get())
+                    return text
+                else:
+                    print(f"❌ Ошибка API: {response.status_code} - {response.text}")
+                    return None
+                
+        except Exception as e:
+            print(f"❌ Ошибка вызова Ollama: {e}")
+            return None
+    
+    def call_ollama_stream(self, prompt: str, temperature: float = 0.1) -> Optional[IncrementalJSONParser]:
+        """Вызывает Ollama API в потоковом режиме
+        
+        Куски ответа сразу идут в IncrementalJSONParser: закрывшиеся разделы
+        печатаются по мере генерации, а соединение закрывается, как только ответ
+        заведомо невалиден или (без --json-format) корневой объект завершён, - Ollama
+        при этом прекращает генерацию, и лишние токены не тратятся. С format поток
+        дочитывается до последнего чанка: в нём метрики вызова.
+        """
+        parser = IncrementalJSONParser()
+        try:
+            payload = self._payload(prompt, temperature, stream=True)
             
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('response', '').strip()
-            else:
-                print(f"❌ Ошибка API: {response.status_code} - {response.text}")
-                return None
+            cached = self.cache.lookup(payload, CURRENT_DOCUMENT.get()) if self.cache else None
+            if cached is not None:
+                print("🗄️  Ответ LLM взят из кэша")
+                parser.feed(cached)
+                return parser
+            
+            print(f"🤖 Отправляем потоковый запрос к LLM (модель: {self.model})...")
+            start = time.time()
+            trailing = 0
+            # Таймаут чтения - на паузу между кусками, а не на весь ответ
+            with self.pool.post("/api/generate", json=payload, stream=True, timeout=(30, 300),
+                                label=CURRENT_DOCUMENT.get()) as response:
+                if response.status_code != 200:
+                    print(f"❌ Ошибка API: {response.status_code} - {response.text}")
+                    return None
                 
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        print(f"❌ Ошибка API: {chunk['error']}")
+                        return None
+                    
+                    if parser.done:
+                        trailing += len(chunk.get('response', ''))
+                    else:
+                        for name, _ in parser.feed(chunk.get('response', '')):
+                            print(f"   ✓ Раздел {name} ({time.time() - start:.1f} с)")
+                        if parser.error:
+                            print(f"⚠️  Генерация прервана: {parser.error}")
+                    
+                    if chunk.get('done'):
+                        self.metrics.record(chunk, CURRENT_DOCUMENT.get())
+                        if self.planner:
+                            self.planner.calibrate(prompt, chunk.get('prompt_eval_count'))
+                        break
+                    # Со схемой или "json" генерация кончается на закрывающей скобке - дочитываем
+                    # последний чанк с метриками; без format модель может продолжить текст, обрываем.
+                    # Если сервер не остановился и с format, тоже обрываем - метрик не будет
+                    if parser.done and (parser.error or not self.response_format or trailing > MAX_TRAILING_CHARS):
+                        break
+            
+            print(f"   Получено {len(parser.buffer)} символов за {time.time() - start:.1f} с")
+            # В кэш - только завершённый JSON: оборванный ответ при повторе нужно перегенерировать
+            if self.cache and parser.complete:
+                self.cache.store(payload, parser.json_text(), CURRENT_DOCUMENT.get())
+            return parser
+        
         except Exception as e:
             print(f"❌ Ошибка вызова Ollama: {e}")
             return None
@@ -86,34 +315,13 @@ class LLMRegexAnalyzer:
             print(f"❌ Ошибка загрузки инструкций: {e}")
             return ""
     
-    def analyze_document(self, text: str, instructions: str) -> Dict[str, Any]:
-        """Анализирует документ с помощью LLM"""
-        
-        # Формируем полный промпт
-        full_prompt = f"""{instructions}
-
-════════════════════════════════════════════════════════════════
-ТЕКСТ ДОКУМЕНТА ДЛЯ АНАЛИЗА:
-════════════════════════════════════════════════════════════════
-
-{text}
-
-════════════════════════════════════════════════════════════════
-
-ПРОАНАЛИЗИРУЙ этот документ согласно ВСЕМ инструкциям выше.
-Для КАЖДОГО раздела:
-1. Найди данные в тексте
-2. Создай regex паттерны
-
-Верни результат в формате JSON как указано в инструкциях.
-ТОЛЬКО JSON, без markdown блоков!
-"""
-        
-        print("🔄 Этап 1: Анализ документа и генерация regex паттернов...")
-        print(f"   Размер документа: {len(text)} символов")
-        print(f"   Размер инструкций: {len(instructions)} символов")
-        
-        response = self.call_ollama(full_prompt, temperature=0.1)
+    def _request_json(self, prompt: str, stream: bool = False) -> Dict[str, Any]:
+        """Запрос к LLM и разбор JSON из ответа ({} - нет ответа)"""
+        if stream:
+            parser = self.call_ollama_stream(prompt, temperature=0.1)
+            response = parser.json_text().strip() if parser else None
+        else:
+            response = self.call_ollama(prompt, temperature=0.1)
         
         if not response:
             print("❌ Не получен ответ от LLM")
@@ -129,10 +337,12 @@ class LLMRegexAnalyzer:
                     response = response[json_start:json_end]
             
             result = json.loads(response)
+            self.parse_stats.record(True, CURRENT_DOCUMENT.get())
             print("✅ Успешно распарсен JSON от LLM")
             return result
             
         except json.JSONDecodeError as e:
+            self.parse_stats.record(False, CURRENT_DOCUMENT.get())
             print(f"❌ Ошибка парсинга JSON: {e}")
             print(f"   Первые 500 символов ответа:\n{response[:500]}...")
             
@@ -142,6 +352,144 @@ class LLMRegexAnalyzer:
                 "raw_response": response[:2000]
             }
     
+    def _request_document(self, instructions: str, text: str, task: str, stream: bool = False) -> Dict[str, Any]:
+        """Запрос по документу; не помещающийся в окно контекста документ - по частям
+        
+        Части идут отдельными запросами, ответы объединяются merge_part_results.
+        """
+        parts = self.context_planner().plan(instructions, text, task)
+        if len(parts) == 1:
+            return self._request_json(build_prompt(instructions, text, task), stream)
+        
+        results = []
+        for index, part in enumerate(parts, 1):
+            print(f"   📄 Часть {index}/{len(parts)} ({len(part)} символов)")
+            results.append(self._request_json(
+                build_prompt(instructions, part, part_task(task, index, len(parts))), stream))
+        return merge_part_results(results)
+    
+    def analyze_document(self, text: str, instructions: str, stream: bool = False) -> Dict[str, Any]:
+        """Анализирует документ с помощью LLM (stream=True - потоковый режим с ранней остановкой)"""
+        
+        task = """
+ПРОАНАЛИЗИРУЙ этот документ согласно ВСЕМ инструкциям выше.
+Для КАЖДОГО раздела:
+1. Найди данные в тексте
+2. Создай regex паттерны
+
+Верни результат в формате JSON как указано в инструкциях.
+ТОЛЬКО JSON, без markdown блоков!
+"""
+        
+        print("🔄 Этап 1: Анализ документа и генерация regex паттернов...")
+        print(f"   Размер документа: {len(text)} символов")
+        print(f"   Размер инструкций: {len(instructions)} символов")
+        
+        # Инструкции - неизменный префикс для всех документов пакета
+        return self._request_document(instructions, text, task, stream)
+        
+    @staticmethod
+    def split_instructions(instructions: str) -> Tuple[str, List[Tuple[str, str]]]:
+        """Делит инструкции на общую часть и разделы "## РАЗДЕЛ N"
+        
+        Общая часть - всё до первого раздела и всё после последнего, начиная с
+        линии ═══ (как создавать regex, формат ответа). Возвращает
+        (общая часть, [(заголовок раздела, текст раздела)]).
+        """
+        headers = list(SECTION_HEADER.finditer(instructions))
+        if not headers:
+            return instructions, []
+            
+        sections = []
+        for i, header in enumerate(headers):
+            end = headers[i + 1].start() if i + 1 < len(headers) else len(instructions)
+            sections.append([header.group(0).lstrip('#').strip(), instructions[header.start():end]])
+            
+        epilogue = ''
+        divider = re.search(r'^═{3,}', sections[-1][1], re.MULTILINE)
+        if divider:
+            epilogue = sections[-1][1][divider.start():]
+            sections[-1][1] = sections[-1][1][:divider.start()]
+            
+        common = instructions[:headers[0].start()].rstrip() + '\n\n' + epilogue
+        # Разделитель "---" в конце раздела относится к следующему
+        return common, [(title, re.sub(r'\s*-{3,}\s*$', '', body).strip()) for title, body in sections]
+    
+    def analyze_section(self, text: str, common: str, title: str, section: str,
+                        stream: bool = False) -> Dict[str, Any]:
+        """Анализ документа по одному разделу инструкций"""
+        
+        task = f"""
+ПРОАНАЛИЗИРУЙ этот документ ТОЛЬКО по следующему разделу инструкций:
+
+{section}
+
+1. Найди данные в тексте
+2. Создай regex паттерны
+
+Верни результат в формате JSON как указано в инструкциях, в "sections" - только этот раздел.
+ТОЛЬКО JSON, без markdown блоков!
+"""
+        print(f"🔄 {title}: запрос к LLM...")
+        # Общая часть и документ - одинаковый префикс у всех разделов, задание - в конце
+        return self._request_document(common, text, task, stream)
+    
+    def analyze_document_by_sections(self, text: str, instructions: str, parallel: int = 2,
+                                     stream: bool = False) -> Dict[str, Any]:
+        """Анализирует документ отдельными запросами по разделам инструкций, parallel запросов одновременно
+        
+        Ответы разделов объединяются в один {"sections": {...}}; ошибка одного
+        раздела попадает в "section_errors" и не портит остальные.
+        """
+        common, sections = self.split_instructions(instructions)
+        if not sections:
+            print("⚠️  В инструкциях нет разделов \"## РАЗДЕЛ N\" - анализ одним запросом")
+            return self.analyze_document(text, instructions, stream)
+        
+        print(f"🔄 Этап 1: Анализ по разделам ({len(sections)} разделов, параллельно {parallel})...")
+        print(f"   Размер документа: {len(text)} символов")
+        print(f"   Размер общей части инструкций: {len(common)} символов")
+        
+        start = time.time()
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, parallel)) as executor:
+            # Копия контекста - чтобы вызовы разделов попали в метрики своего документа
+            futures = {
+                executor.submit(contextvars.copy_context().run,
+                                self.analyze_section, text, common, title, section, stream): title
+                for title, section in sections
+            }
+            for future in as_completed(futures):
+                title = futures[future]
+                try:
+                    results[title] = future.result()
+                except Exception as e:
+                    results[title] = {"error": str(e)}
+        
+        # Объединяем в порядке разделов инструкций
+        merged = {"sections": {}}
+        section_errors = {}
+        for title, _ in sections:
+            result = results[title]
+            if result.get('sections') and isinstance(result['sections'], dict):
+                merged['sections'].update(result['sections'])
+                merged.setdefault('document_info', result.get('document_info'))
+                print(f"   ✓ {title}: {', '.join(result['sections'])}")
+            else:
+                section_errors[title] = result or {"error": "empty_response"}
+                print(f"   ❌ {title}: {section_errors[title].get('error', 'нет sections в ответе')}")
+        
+        print(f"⏱️  Разделы обработаны за {time.time() - start:.1f} с, "
+              f"успешно {len(sections) - len(section_errors)}/{len(sections)}")
+        
+        if not merged['sections']:
+            return {"error": "all_sections_failed", "section_errors": section_errors}
+        if section_errors:
+            merged['section_errors'] = section_errors
+        if merged.get('document_info') is None:
+            merged.pop('document_info', None)
+        return merged
+    
     def validate_with_regex(self, text: str, regex_patterns: Dict[str, Any]) -> Dict[str, Any]:
         """Валидирует извлеченные данные с помощью regex"""
         print("🔄 Этап 2: Валидация данных с помощью regex...")
@@ -160,16 +508,7 @@ class LLMRegexAnalyzer:
                     continue
                 
                 pattern = pattern_info['pattern']
-                flags_list = pattern_info.get('flags', [])
-                
-                # Формируем флаги
-                flags = 0
-                if 'MULTILINE' in flags_list:
-                    flags |= re.MULTILINE
-                if 'IGNORECASE' in flags_list:
-                    flags |= re.IGNORECASE
-                if 'DOTALL' in flags_list:
-                    flags |= re.DOTALL
+                flags = regex_flags(pattern_info.get('flags', []))
                 
                 try:
                     # Пытаемся применить regex
@@ -221,73 +560,69 @@ class LLMRegexAnalyzer:
         return data_only
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description='LLM Regex Analyzer - анализ документов с генерацией regex'
-    )
-    parser.add_argument('--file', '-f', required=True,
-                       help='Путь к текстовому файлу для обработки')
-    parser.add_argument('--instructions', '-i', 
-                       default='instructions_regex_generation.txt',
-                       help='Файл с инструкциями для LLM')
-    parser.add_argument('--output', '-o',
-                       help='Выходной JSON файл (по умолчанию: имя_файла_analyzed.json)')
-    parser.add_argument('--regex-output', '-r',
-                       help='Файл для сохранения только regex (по умолчанию: имя_файла.regex.json)')
-    parser.add_argument('--data-output', '-d',
-                       help='Файл для сохранения только данных (по умолчанию: имя_файла.data.json)')
-    parser.add_argument('--validate', action='store_true',
-                       help='Валидировать результаты с помощью сгенерированных regex')
-    parser.add_argument('--ollama-url', default='http://localhost:11434',
-                       help='URL Ollama сервера')
-    parser.add_argument('--model', '-m', required=True,
-                       help='Название модели Ollama')
-    parser.add_argument('--token', '-t',
-                       help='Токен авторизации')
-    parser.add_argument('--no-ssl-verify', action='store_true',
-                       help='Отключить проверку SSL')
-    
-    args = parser.parse_args()
+def merge_part_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Объединяет ответы по частям документа в один {"sections": {...}}
     
-    # Проверяем входной файл
-    input_file = Path(args.file)
-    if not input_file.exists():
-        print(f"❌ Файл не найден: {input_file}")
-        return
-    
-    # Проверяем файл с инструкциями
-    instructions_file = Path(args.instructions)
-    if not instructions_file.exists():
-        print(f"❌ Файл с инструкциями не найден: {instructions_file}")
-        return
+    Поле раздела (данные или паттерн) берётся из первой части, где оно
+    найдено; ответы частей с ошибкой попадают в "part_errors".
+    """
+    merged = {"sections": {}}
+    part_errors = {}
+    for index, result in enumerate(results, 1):
+        if not result or 'error' in result:
+            part_errors[f"part_{index}"] = result or {"error": "no_response"}
+            continue
+        
+        for key, value in result.items():
+            if key != 'sections':
+                merged.setdefault(key, value)
+        for name, section in (result.get('sections') or {}).items():
+            if not isinstance(section, dict):
+                continue
+            target = merged['sections'].setdefault(name, {"extracted_data": {}, "regex_patterns": {}})
+            for field in ('extracted_data', 'regex_patterns'):
+                values = section.get(field)
+                if not isinstance(values, dict):
+                    continue
+                for key, value in values.items():
+                    if value not in (None, '', [], {}) and key not in target[field]:
+                        target[field][key] = value
     
-    # Определяем выходные файлы
-    if args.output:
+    if not merged['sections'] and part_errors:
+        return {"error": "all_parts_failed", "part_errors": part_errors}
+    merged['document_parts'] = len(results)
+    if part_errors:
+        merged['part_errors'] = part_errors
+    return merged
+
+
+def output_paths(input_file: Path, args, single: bool) -> Tuple[Path, Path, Path]:
+    """Пути результатов; -o/-r/-d действуют только при анализе одного файла"""
+    if single and args.output:
         output_file = Path(args.output)
     else:
         output_file = input_file.parent / f"{input_file.stem}_analyzed.json"
     
-    if args.regex_output:
+    if single and args.regex_output:
         regex_output_file = Path(args.regex_output)
     else:
         regex_output_file = input_file.parent / f"{input_file.stem}.regex.json"
     
-    if args.data_output:
+    if single and args.data_output:
         data_output_file = Path(args.data_output)
     else:
         data_output_file = input_file.parent / f"{input_file.stem}.data.json"
     
-    # Создаем анализатор
-    analyzer = LLMRegexAnalyzer(
-        args.ollama_url,
-        args.model,
-        args.token,
-        verify_ssl=not args.no_ssl_verify
-    )
-    
-    # Тестируем соединение
-    if not analyzer.test_connection():
-        return
+    return output_file, regex_output_file, data_output_file
+
+
+def analyze_file(analyzer: LLMRegexAnalyzer, input_file: Path, instructions_file: Path, instructions: str,
+                 library: Optional[PatternLibrary], args, single: bool = True) -> Dict[str, Any]:
+    """Анализ одного документа с сохранением результатов; возвращает сводку для пакета"""
+    start = time.time()
+    summary = {"file": input_file.name, "status": "error", "method": None}
+    CURRENT_DOCUMENT.set(input_file.name)
+    output_file, regex_output_file, data_output_file = output_paths(input_file, args, single)
     
     # Читаем файлы
     try:
@@ -296,37 +631,67 @@ def main():
         print(f"📄 Загружен документ: {input_file.name} ({len(text)} символов)")
     except Exception as e:
         print(f"❌ Ошибка чтения файла: {e}")
-        return
-    
-    # Загружаем инструкции
-    instructions = analyzer.load_instructions(instructions_file)
-    if not instructions:
-        return
+        return summary
     
-    print("\n" + "="*70)
-    print("🚀 НАЧИНАЕМ АНАЛИЗ")
-    print("="*70)
+    # Сначала - паттерны похожих документов из библиотеки
+    library_match = None
+    if library:
+        print(f"🔎 Поиск в библиотеке паттернов ({len(library.entries)} наборов)...")
+        library_match = library.find(text, args.library_similarity, args.library_coverage)
     
-    # Анализируем документ
-    analysis_result = analyzer.analyze_document(text, instructions)
+    if library_match:
+        print(f"✅ Паттерны из библиотеки ({library_match['entry']['path'].name}) "
+              f"нашли {library_match['found']}/{library_match['fields']} полей - LLM не нужна")
+        analysis_result = {"sections": library_match['sections']}
+    else:
+        # Тестируем соединение (только если нужна LLM)
+        if not analyzer.ensure_connection():
+            return summary
+        
+        # Анализируем документ
+        if args.by_sections:
+            analysis_result = analyzer.analyze_document_by_sections(
+                text, instructions, parallel=args.parallel, stream=args.stream)
+        else:
+            analysis_result = analyzer.analyze_document(text, instructions, stream=args.stream)
+        if analyzer.cache:
+            analyzer.cache.print_stats(input_file.name)
     
     if not analysis_result or 'error' in analysis_result:
-        print("\n❌ Анализ завершился с ошибкой")
+        print(f"\n❌ Анализ {input_file.name} завершился с ошибкой")
         # Сохраняем ошибку для отладки
         error_file = input_file.parent / f"{input_file.stem}_error.json"
         analyzer.save_results(analysis_result, error_file)
-        return
+        summary["seconds"] = round(time.time() - start, 1)
+        return summary
     
     # Добавляем метаинформацию
     full_result = {
         "file_info": {
             "source_file": input_file.name,
             "instructions_file": instructions_file.name,
-            "analysis_method": "llm_regex_hybrid",
-            "model": args.model
+            "analysis_method": "pattern_library" if library_match else "llm_regex_hybrid",
+            "model": args.model,
+            # Кэш и разбор JSON - по запросам этого документа; итог за пакет - в консоли
+            "llm_cache": analyzer.cache.stats(input_file.name) if analyzer.cache else None,
+            "ollama_endpoints": analyzer.pool.stats(),
+            # Повторы запросов этого документа; итог за пакет - в консоли
+            "ollama_retries": analyzer.pool.retry_stats(input_file.name),
+            # Вызовы LLM по документу: токены, время загрузки модели, промпта и генерации;
+            # падение prompt_tokens - переиспользование KV-кэша Ollama
+            "ollama_metrics": analyzer.metrics.summary(input_file.name),
+            "json_format": args.json_format,
+            "json_parse": analyzer.parse_stats.summary(input_file.name),
+            "context_window": analyzer.planner.context_window if analyzer.planner else None
         },
         "analysis_result": analysis_result
     }
+    if library_match:
+        full_result["file_info"]["pattern_library"] = {
+            "entry": library_match['entry']['source_file'],
+            "similarity": round(library_match['similarity'], 3),
+            "coverage": round(library_match['coverage'], 3)
+        }
     
     # Сохраняем полный результат
     analyzer.save_results(full_result, output_file)
@@ -337,13 +702,20 @@ def main():
         regex_result = {
             "file_info": {
                 "source_file": input_file.name,
-                "pattern_source": "llm_generated",
+                "pattern_source": "pattern_library" if library_match else "llm_generated",
                 "model": args.model
             },
             "patterns": regex_patterns
         }
+        if library_match:
+            regex_result["file_info"]["library_entry"] = library_match['entry']['source_file']
+            regex_result["file_info"]["coverage"] = round(library_match['coverage'], 3)
         analyzer.save_results(regex_result, regex_output_file)
         print(f"📝 Regex паттерны сохранены отдельно: {regex_output_file}")
+        
+        # Новые паттерны от LLM пополняют библиотеку
+        if library and not library_match:
+            library.add(text, regex_patterns, input_file.name, args.model)
     
     # Извлекаем и сохраняем только данные
     extracted_data = analyzer.extract_data_only(analysis_result)
@@ -351,7 +723,7 @@ def main():
         data_result = {
             "file_info": {
                 "source_file": input_file.name,
-                "extraction_method": "llm_analysis",
+                "extraction_method": "regex_library" if library_match else "llm_analysis",
                 "model": args.model
             },
             "extracted_data": extracted_data
@@ -360,6 +732,7 @@ def main():
         print(f"📊 Извлеченные данные сохранены отдельно: {data_output_file}")
     
     # Валидация с помощью regex (опционально)
+    validation_file = None
     if args.validate and regex_patterns:
         print("\n" + "="*70)
         print("🔍 ВАЛИДАЦИЯ REGEX ПАТТЕРНОВ")
@@ -379,15 +752,162 @@ def main():
         print(f"✅ Результаты валидации: {validation_file}")
     
     print("\n" + "="*70)
-    print("✅ АНАЛИЗ ЗАВЕРШЕН!")
+    print(f"✅ АНАЛИЗ ЗАВЕРШЕН: {input_file.name}")
     print("="*70)
     print(f"📁 Полный результат: {output_file}")
     print(f"📝 Regex паттерны: {regex_output_file}")
     print(f"📊 Извлеченные данные: {data_output_file}")
-    if args.validate:
+    if validation_file:
         print(f"🔍 Валидация: {validation_file}")
+    
+    summary.update(status="ok", method=full_result["file_info"]["analysis_method"],
+                   seconds=round(time.time() - start, 1))
+    return summary
+
+
+def collect_input_files(paths: List[str]) -> List[Path]:
+    """Файлы для анализа: файлы как есть, из каталогов - *.txt"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.glob('*.txt')))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='LLM Regex Analyzer - анализ документов с генерацией regex'
+    )
+    parser.add_argument('--file', '-f', required=True, nargs='+',
+                       help='Текстовые файлы или каталоги с *.txt для обработки')
+    parser.add_argument('--instructions', '-i', 
+                       default='instructions_regex_generation.txt',
+                       help='Файл с инструкциями для LLM')
+    parser.add_argument('--output', '-o',
+                       help='Выходной JSON файл (по умолчанию: имя_файла_analyzed.json)')
+    parser.add_argument('--regex-output', '-r',
+                       help='Файл для сохранения только regex (по умолчанию: имя_файла.regex.json)')
+    parser.add_argument('--data-output', '-d',
+                       help='Файл для сохранения только данных (по умолчанию: имя_файла.data.json)')
+    parser.add_argument('--validate', action='store_true',
+                       help='Валидировать результаты с помощью сгенерированных regex')
+    parser.add_argument('--ollama-url', nargs='+', default=['http://localhost:11434'],
+                       help='URL Ollama сервера (несколько - запросы распределяются между ними)')
+    parser.add_argument('--health-interval', type=float, default=DEFAULT_HEALTH_INTERVAL,
+                       help=f'Период проверки доступности серверов Ollama, сек (по умолчанию: {DEFAULT_HEALTH_INTERVAL:.0f})')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                       help='Сколько документов анализировать одновременно (по умолчанию: 1)')
+    add_http_arguments(parser)
+    add_format_arguments(parser)
+    add_context_arguments(parser)
+    parser.add_argument('--model', '-m', required=True,
+                       help='Название модели Ollama')
+    parser.add_argument('--token', '-t',
+                       help='Токен авторизации')
+    parser.add_argument('--no-ssl-verify', action='store_true',
+                       help='Отключить проверку SSL')
+    parser.add_argument('--stream', action='store_true',
+                       help='Потоковый режим: разделы по мере генерации; с --json-format none генерация '
+                            'обрывается сразу после конца JSON (со schema/json модель останавливается сама)')
+    add_cache_arguments(parser)
+    parser.add_argument('--by-sections', action='store_true',
+                       help='Отдельный запрос к LLM на каждый раздел "## РАЗДЕЛ N" инструкций')
+    parser.add_argument('--parallel', type=int, default=2,
+                       help='Одновременных запросов к Ollama в режиме --by-sections (по умолчанию: 2)')
+    parser.add_argument('--library', '-l',
+                       help='Каталог библиотеки паттернов: подходящие паттерны применяются без LLM, новые сохраняются')
+    parser.add_argument('--library-similarity', type=float, default=DEFAULT_MIN_SIMILARITY,
+                       help=f'Минимальная похожесть структуры документов (по умолчанию: {DEFAULT_MIN_SIMILARITY})')
+    parser.add_argument('--library-coverage', type=float, default=DEFAULT_MIN_COVERAGE,
+                       help=f'Доля полей, которые должны найти паттерны библиотеки (по умолчанию: {DEFAULT_MIN_COVERAGE})')
+    
+    args = parser.parse_args()
+    
+    # Проверяем входные файлы
+    input_files = collect_input_files(args.file)
+    missing = [path for path in input_files if not path.exists()]
+    if missing:
+        print(f"❌ Файл не найден: {missing[0]}")
+        return
+    if not input_files:
+        print("❌ Нет файлов для анализа")
+        return
+    single = len(input_files) == 1
+    if not single and (args.output or args.regex_output or args.data_output):
+        print("⚠️  -o/-r/-d игнорируются при анализе нескольких файлов")
+    
+    # Проверяем файл с инструкциями
+    instructions_file = Path(args.instructions)
+    if not instructions_file.exists():
+        print(f"❌ Файл с инструкциями не найден: {instructions_file}")
+        return
+    
+    # Создаем анализатор
+    analyzer = LLMRegexAnalyzer(
+        args.ollama_url,
+        args.model,
+        args.token,
+        verify_ssl=not args.no_ssl_verify,
+        cache=cache_from_args(args),
+        health_interval=args.health_interval,
+        retries=args.retries,
+        deadline=args.request_deadline,
+        keep_alive=args.keep_alive,
+        json_format=args.json_format,
+        num_ctx=args.num_ctx,
+        # Соединений на сервер - по числу одновременных запросов
+        pool_size=max(args.jobs * (args.parallel if args.by_sections else 1), 1)
+    )
+    
+    # Загружаем инструкции
+    instructions = analyzer.load_instructions(instructions_file)
+    if not instructions:
+        return
+    
+    library = PatternLibrary(Path(args.library)) if args.library else None
+    
+    print("\n" + "="*70)
+    print(f"🚀 НАЧИНАЕМ АНАЛИЗ ({len(input_files)} файлов)" if not single else "🚀 НАЧИНАЕМ АНАЛИЗ")
+    print("="*70)
+    
+    start = time.time()
+    if single or args.jobs <= 1:
+        summaries = [analyze_file(analyzer, path, instructions_file, instructions, library, args, single)
+                     for path in input_files]
+    else:
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            summaries = list(executor.map(
+                lambda path: analyze_file(analyzer, path, instructions_file, instructions, library, args, False),
+                input_files))
+    
+    if not single:
+        ok = sum(1 for summary in summaries if summary['status'] == 'ok')
+        print("\n" + "="*70)
+        print(f"📦 ПАКЕТ: успешно {ok}/{len(summaries)} за {time.time() - start:.1f} с")
+        print("="*70)
+        for summary in summaries:
+            mark = "✅" if summary['status'] == 'ok' else "❌"
+            llm = analyzer.metrics.summary(summary['file'])
+            llm_note = (f" (Ollama: {llm['calls']} вызовов, промпт {llm['prompt_tokens']} / "
+                        f"ответ {llm['output_tokens']} токенов)" if llm['calls'] else "")
+            retries = analyzer.pool.retry_stats(summary['file'])
+            if retries['retries']:
+                llm_note += f", повторов {retries['retries']}"
+            print(f"   {mark} {summary['file']}: {summary.get('method') or 'ошибка'}, "
+                  f"{summary.get('seconds', 0)} с{llm_note}")
+    if analyzer.connected:
+        analyzer.pool.print_stats()
+        retry_stats = analyzer.pool.retry_stats()
+        if retry_stats['retries']:
+            print(f"🔁 Повторов запросов: {retry_stats['retries']}, "
+                  f"не удалось после всех повторов: {retry_stats['failed_requests']}")
+        analyzer.metrics.print_summary()
+        analyzer.parse_stats.print_summary()
+        if analyzer.cache and not single:
+            analyzer.cache.print_stats()
 
 
 if __name__ == "__main__":
     main()
-
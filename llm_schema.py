@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON-схемы ответов LLM для structured outputs Ollama и учёт ошибок разбора
+
+Поле "format" запроса /api/generate ограничивает генерацию: "json" - любой
+валидный JSON, JSON-схема - объект заданной структуры. Модель физически не может
+выдать markdown-обёртку, пояснения или оборванную скобку, поэтому ответ
+разбирается с первого раза. Старые версии Ollama (до 0.5) схему не понимают -
+для них есть режим json или none (--json-format).
+
+Ollama превращает схему в грамматику llama.cpp, а та считает отсутствующий
+additionalProperties равным false: модель не сможет выдать ни одного ключа, не
+перечисленного в properties. Поэтому в схемах перечислены все поля, которые
+просят промпты и читают скрипты, а объекты оставлены открытыми
+("additionalProperties": true) - схема задаёт типы, но не отбрасывает поля.
+
+Разбор с find('{')/rfind('}') в скриптах остаётся запасным путём; JSONParseStats
+считает ответы и ошибки разбора, чтобы доля ошибок была видна в метаданных.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Union
+
+# Режимы --json-format
+JSON_FORMAT_MODES = ['schema', 'json', 'none']
+DEFAULT_JSON_FORMAT = 'schema'
+
+REGEX_FLAGS = ['MULTILINE', 'IGNORECASE', 'DOTALL']
+
+# Regex-паттерн поля: {"pattern", "flags", "description", ...}; context_before,
+# context_after и example_match просят инструкции llm_regex_analyzer.py,
+# extraction_method и subsection_pattern - разделы research/regex_parser.py
+REGEX_PATTERN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "pattern": {"type": "string"},
+        "flags": {"type": "array", "items": {"type": "string", "enum": REGEX_FLAGS}},
+        "description": {"type": "string"},
+        "context_before": {"type": "string"},
+        "context_after": {"type": "string"},
+        "example_match": {"type": "string"},
+        "extraction_method": {"type": "string"},
+        "subsection_pattern": {"type": "string"}
+    },
+    "required": ["pattern"],
+    "additionalProperties": True
+}
+
+# Раздел ответа llm_regex_analyzer.py: найденные данные и паттерны к ним
+ANALYSIS_SECTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "extracted_data": {"type": "object"},
+        "regex_patterns": {"type": "object", "additionalProperties": REGEX_PATTERN_SCHEMA}
+    },
+    "required": ["extracted_data", "regex_patterns"],
+    "additionalProperties": True
+}
+
+
+# Ответ llm_regex_analyzer.py: {"sections": {раздел: {extracted_data, regex_patterns}}};
+# имена разделов задают инструкции, поэтому они не фиксируются
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "document_info": {"type": "object"},
+        "sections": {"type": "object", "additionalProperties": ANALYSIS_SECTION_SCHEMA}
+    },
+    "required": ["sections"],
+    "additionalProperties": True
+}
+
+
+# Таблица research/regex_parser.py: все поля, которые читает RegexParser.extract_table -
+# pattern/flags, structure (паттерны строк) и старый формат header_pattern/row_names/value_patterns
+REGEX_TABLE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "table_name": {"type": "string"},
+        "table_number": {"type": "string"},
+        "description": {"type": "string"},
+        "extraction_method": {"type": "string"},
+        "pattern": {"type": "string"},
+        "flags": {"type": "array", "items": {"type": "string", "enum": REGEX_FLAGS}},
+        "structure": {"type": "object", "additionalProperties": REGEX_PATTERN_SCHEMA},
+        "header_pattern": {"type": "string"},
+        "row_names": {"type": "array", "items": {"type": "string"}},
+        "value_patterns": {"type": "object", "additionalProperties": {"type": "string"}}
+    },
+    "required": ["table_name"],
+    "additionalProperties": True
+}
+
+
+# Ответ research/regex_parser.py: группы паттернов и таблицы
+REGEX_SET_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "metadata": {"type": "object", "additionalProperties": REGEX_PATTERN_SCHEMA},
+        "technical_params": {"type": "object", "additionalProperties": REGEX_PATTERN_SCHEMA},
+        "sections": {"type": "object", "additionalProperties": REGEX_PATTERN_SCHEMA},
+        "tables": {"type": "array", "items": REGEX_TABLE_SCHEMA}
+    },
+    "required": ["metadata", "technical_params", "sections", "tables"],
+    "additionalProperties": True
+}
+
+
+def blocks_schema(block_types: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Схема разбивки на блоки research/llm_parser.py: {"blocks": [{block_type, content, ...}]}"""
+    block_type = {"type": "string"}
+    if block_types:
+        block_type["enum"] = sorted(set(block_types) | {"unknown"})
+    return {
+        "type": "object",
+        "properties": {
+            "blocks": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "block_type": block_type,
+                        "content": {"type": "string"},
+                        "start_marker": {"type": "string"},
+                        "end_marker": {"type": "string"}
+                    },
+                    "required": ["block_type", "content"],
+                    "additionalProperties": True
+                }
+            }
+        },
+        "required": ["blocks"],
+        "additionalProperties": True
+    }
+
+
+def response_format(mode: str, schema: Optional[Dict[str, Any]] = None) -> Optional[Union[str, Dict[str, Any]]]:
+    """Значение поля "format" запроса: схема, "json" или None (без ограничений)
+    
+    В режиме schema без известной схемы используется "json".
+    """
+    if mode == 'none':
+        return None
+    if mode == 'schema' and schema:
+        return schema
+    return 'json'
+
+
+class JSONParseStats:
+    """Сколько ответов LLM разобрано как JSON и сколько - с ошибкой"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.responses = 0
+        self.failures = 0
+        # {метка: [ответов, ошибок]} - например, по документам пакета
+        self.labels = {}
+    
+    def record(self, ok: bool, label: str = ''):
+        with self.lock:
+            self.responses += 1
+            if not ok:
+                self.failures += 1
+            if label:
+                counts = self.labels.setdefault(label, [0, 0])
+                counts[0] += 1
+                counts[1] += 0 if ok else 1
+    
+    def summary(self, label: Optional[str] = None) -> Dict[str, Any]:
+        """Сводка за запуск (label - только по ответам с этой меткой)"""
+        with self.lock:
+            responses, failures = (self.responses, self.failures) if label is None else self.labels.get(label, (0, 0))
+        return {
+            "responses": responses,
+            "parse_failures": failures,
+            "failure_rate": round(failures / responses, 3) if responses else 0.0
+        }
+    
+    def print_summary(self, label: Optional[str] = None):
+        summary = self.summary(label)
+        if summary['responses']:
+            print(f"🧩 Разбор JSON: ответов {summary['responses']}, "
+                  f"ошибок {summary['parse_failures']} ({summary['failure_rate']:.0%})")
+
+
+def add_format_arguments(parser):
+    """Аргумент --json-format для CLI LLM-скриптов"""
+    parser.add_argument('--json-format', choices=JSON_FORMAT_MODES, default=DEFAULT_JSON_FORMAT,
+                        help='Ограничение ответа LLM: schema - JSON-схема ответа, json - любой JSON, '
+                             f'none - без ограничений (по умолчанию: {DEFAULT_JSON_FORMAT})')
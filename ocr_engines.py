@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общий интерфейс OCR-движков: изображение страницы -> текстовые блоки и таблицы
+с координатами и уверенностью.
+
+Движок - любой объект с методом recognize_page(image), где image - numpy-массив
+RGB (H, W, 3), а результат:
+
+    {
+        'blocks': [{'text': str, 'bbox': (x1, y1, x2, y2), 'confidence': float | None}],
+        'tables': [{'bbox': (x1, y1, x2, y2), 'rows': [[str, ...], ...]}]
+    }
+
+Бэкенды - существующие обработчики проекта:
+
+    img2table       easyocr_script.EasyOCRProcessor (img2table + Tesseract)
+    easyocr         research/ocr_script.OCRProcessor
+    easyocr-tables  research/ocr_with_tables.OCRProcessor
+    trocr           research/ocr_trocr.TrOCRProcessor
+
+Библиотеки движка загружаются только при create_engine(). readtext_blocks -
+общий для EasyOCR-бэкендов перевод результатов readtext в блоки.
+"""
+
+import importlib
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+RESEARCH_DIR = Path(__file__).resolve().parent / 'research'
+
+
+def _research_module(name: str):
+    """Импортирует скрипт из research/ (там модули импортируют друг друга по имени)"""
+    if str(RESEARCH_DIR) not in sys.path:
+        sys.path.insert(0, str(RESEARCH_DIR))
+    return importlib.import_module(name)
+
+
+def _create_img2table(use_gpu: bool = False, **kwargs):
+    from easyocr_script import EasyOCRProcessor
+    # Страницы приходят из памяти, артефакты не пишутся - PDF и каталог результатов не нужны
+    return EasyOCRProcessor(Path('page.pdf'), Path(tempfile.gettempdir()),
+                            use_gpu=use_gpu, artifacts='none', **kwargs)
+
+
+def _create_easyocr(use_gpu: bool = False, **kwargs):
+    return _research_module('ocr_script').OCRProcessor(use_gpu=use_gpu, **kwargs)
+
+
+def _create_easyocr_tables(use_gpu: bool = False, **kwargs):
+    return _research_module('ocr_with_tables').OCRProcessor(use_gpu=use_gpu, **kwargs)
+
+
+def _create_trocr(use_gpu: bool = False, **kwargs):
+    return _research_module('ocr_trocr').TrOCRProcessor(use_gpu=use_gpu, **kwargs)
+
+
+# Имя движка -> фабрика
+ENGINES = {
+    'img2table': _create_img2table,
+    'easyocr': _create_easyocr,
+    'easyocr-tables': _create_easyocr_tables,
+    'trocr': _create_trocr,
+}
+
+
+def create_engine(name: str, use_gpu: bool = False, **kwargs):
+    """Создаёт движок по имени; kwargs передаются конструктору обработчика"""
+    if name not in ENGINES:
+        raise ValueError(f"Неизвестный OCR движок: {name} (доступны: {', '.join(ENGINES)})")
+    return ENGINES[name](use_gpu=use_gpu, **kwargs)
+
+
+def readtext_blocks(reader, image, min_confidence: float = 0.5) -> List[Dict[str, Any]]:
+    """Результаты easyocr.Reader.readtext в блоки общего интерфейса: текст, рамка, уверенность"""
+    blocks = []
+    for (bbox, text, confidence) in reader.readtext(image):
+        if confidence > min_confidence:  # Фильтруем по уверенности
+            xs = [point[0] for point in bbox]
+            ys = [point[1] for point in bbox]
+            blocks.append({
+                'text': text,
+                'bbox': (int(min(xs)), int(min(ys)), int(max(xs)), int(max(ys))),
+                'confidence': float(confidence)
+            })
+    return blocks
+
+
+def rows_to_markdown(rows: List[List[str]]) -> str:
+    """Строки таблицы в Markdown (первая строка - заголовок)"""
+    if not rows:
+        return ''
+    width = max(len(row) for row in rows)
+    padded = [list(row) + [''] * (width - len(row)) for row in rows]
+    lines = ['| ' + ' | '.join(padded[0]) + ' |', '|' + '---|' * width]
+    lines.extend('| ' + ' | '.join(row) + ' |' for row in padded[1:])
+    return '\n'.join(lines)
+
+
+def page_text(page: Dict[str, Any]) -> str:
+    """Текст страницы из результата recognize_page: блоки, затем таблицы в Markdown"""
+    parts = [block['text'] for block in page['blocks'] if block['text']]
+    parts.extend(rows_to_markdown(table['rows']) for table in page['tables'] if table['rows'])
+    return '\n'.join(parts)
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общий HTTP-клиент Ollama для LLM-скриптов: пул соединений, повторы, балансировка
+
+Запрос уходит на доступный сервер с наименьшим числом незавершённых запросов
+(при равенстве - с меньшей средней задержкой). Ошибка соединения, таймаут или
+ответ 429/5xx помечают сервер недоступным; запрос повторяется - сразу на другом
+сервере, если он есть, иначе после паузы (экспоненциальная с джиттером). Число
+повторов ограничено, а deadline ограничивает общее время запроса со всеми
+повторами. Доступность проверяется запросом /api/tags - при старте и
+периодически в фоне, так что упавший сервер возвращается в работу сам.
+
+requests импортируется при создании OllamaPool, а не при импорте модуля.
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Union
+
+# Период фоновой проверки доступности серверов, сек
+DEFAULT_HEALTH_INTERVAL = 30.0
+
+# Таймаут запроса /api/tags
+HEALTH_TIMEOUT = 10
+
+# Соединений на сервер (keep-alive): не меньше числа одновременных запросов
+DEFAULT_POOL_SIZE = 8
+
+# Повторы запроса после сбоя и пауза между ними: случайная в [0, min(MAX, BASE * 2^n)]
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Сколько Ollama держит модель (и её KV-кэш) в памяти после запроса; по умолчанию
+# сервера - 5 минут, и между документами пакета модель успевает выгрузиться
+DEFAULT_KEEP_ALIVE = '30m'
+
+
+def make_session(token: Optional[str] = None, verify_ssl: bool = True, pool_size: int = DEFAULT_POOL_SIZE):
+    """requests.Session с пулом keep-alive соединений; повторы делает OllamaPool"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    
+    session = requests.Session()
+    session.verify = verify_ssl
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if token:
+        session.headers.update({'X-Access-Token': token})
+    return session
+
+
+def backoff_delay(attempt: int) -> float:
+    """Пауза перед повтором номер attempt (с 1): "full jitter" """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+class OllamaEndpoint:
+    """Один сервер Ollama: сессия, состояние и статистика задержек"""
+    
+    def __init__(self, url: str, session):
+        self.url = url.rstrip('/')
+        self.session = session
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.retries = 0
+        self.last_error = None
+    
+    @property
+    def avg_latency(self) -> float:
+        return self.total_seconds / self.requests if self.requests else 0.0
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_latency_sec": round(self.avg_latency, 2),
+            "last_error": self.last_error
+        }
+
+
+class OllamaPool:
+    """Набор серверов Ollama с балансировкой по числу незавершённых запросов"""
+    
+    def __init__(self, urls: Union[str, List[str]], token: Optional[str] = None, verify_ssl: bool = True,
+                 health_interval: float = DEFAULT_HEALTH_INTERVAL, retries: int = DEFAULT_RETRIES,
+                 deadline: Optional[float] = None, pool_size: int = DEFAULT_POOL_SIZE):
+        import requests
+        import urllib3
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        self.requests = requests
+        
+        if isinstance(urls, str):
+            urls = [urls]
+        self.endpoints = [OllamaEndpoint(url, make_session(token, verify_ssl, pool_size)) for url in urls]
+        
+        self.health_interval = health_interval
+        self.retries = retries
+        self.deadline = deadline
+        self.lock = threading.Lock()
+        self._health_thread = None
+        # Счётчики за запуск: повторы и запросы, не удавшиеся после всех повторов
+        self.retry_count = 0
+        self.failed_requests = 0
+        # Те же счётчики по меткам запросов (например, по документам пакета)
+        self.label_stats = {}
+    
+    def _check_endpoint(self, endpoint: OllamaEndpoint) -> Optional[str]:
+        """None - сервер доступен, иначе описание ошибки"""
+        try:
+            response = endpoint.session.get(f"{endpoint.url}/api/tags", timeout=HEALTH_TIMEOUT)
+            if response.status_code == 200:
+                return None
+            return f"HTTP {response.status_code}"
+        except Exception as e:
+            return str(e)
+    
+    def check_health(self, verbose: bool = True) -> bool:
+        """Проверяет все серверы; True - доступен хотя бы один"""
+        for endpoint in self.endpoints:
+            error = self._check_endpoint(endpoint)
+            was_healthy = endpoint.healthy
+            endpoint.healthy = error is None
+            if error:
+                endpoint.last_error = error
+            
+            if verbose:
+                where = f" ({endpoint.url})" if len(self.endpoints) > 1 else ""
+                if error is None:
+                    print(f"✅ Соединение с Ollama установлено{where}")
+                else:
+                    print(f"❌ Ошибка соединения{where}: {error}")
+            elif was_healthy != endpoint.healthy:
+                state = "снова доступен" if endpoint.healthy else f"недоступен: {error}"
+                print(f"🔁 Ollama {endpoint.url} {state}")
+        
+        return any(endpoint.healthy for endpoint in self.endpoints)
+    
+    def start_health_checks(self):
+        """Фоновая проверка доступности каждые health_interval секунд"""
+        if self._health_thread or len(self.endpoints) < 2 or not self.health_interval:
+            return
+        
+        def loop():
+            while True:
+                time.sleep(self.health_interval)
+                self.check_health(verbose=False)
+        
+        self._health_thread = threading.Thread(target=loop, name='ollama-health', daemon=True)
+        self._health_thread.start()
+    
+    def _acquire(self, exclude: List[OllamaEndpoint]) -> Optional[OllamaEndpoint]:
+        with self.lock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            # Если все помечены недоступными - всё равно пробуем: пометка могла устареть
+            healthy = [e for e in candidates if e.healthy] or candidates
+            if not healthy:
+                return None
+            endpoint = min(healthy, key=lambda e: (e.outstanding, e.avg_latency))
+            endpoint.outstanding += 1
+            return endpoint
+    
+    def _release(self, endpoint: OllamaEndpoint, seconds: float, error: Optional[str] = None):
+        with self.lock:
+            endpoint.outstanding -= 1
+            endpoint.requests += 1
+            endpoint.total_seconds += seconds
+            if error:
+                endpoint.errors += 1
+                endpoint.last_error = error
+                endpoint.healthy = False
+            else:
+                endpoint.healthy = True
+    
+    def _timeout(self, timeout, deadline_at: Optional[float]):
+        """Таймаут попытки, урезанный до оставшегося до deadline времени"""
+        if deadline_at is None:
+            return timeout
+        remaining = deadline_at - time.time()
+        if remaining <= 0:
+            raise self.requests.Timeout(f"превышен deadline запроса ({self.deadline:g} с)")
+        if isinstance(timeout, tuple):
+            return tuple(min(t, remaining) if t else remaining for t in timeout)
+        return min(timeout, remaining) if timeout else remaining
+    
+    def _count(self, label: str, key: str):
+        """+1 к счётчику key (retries / failed_requests) за запуск и по метке; вызывается под self.lock"""
+        if key == 'retries':
+            self.retry_count += 1
+        else:
+            self.failed_requests += 1
+        if label:
+            stats = self.label_stats.setdefault(label, {"retries": 0, "failed_requests": 0})
+            stats[key] += 1
+    
+    def _wait_before_retry(self, attempt: int, reason: str, endpoint: OllamaEndpoint,
+                           switching: bool, deadline_at: Optional[float], label: str = ''):
+        with self.lock:
+            self._count(label, 'retries')
+            endpoint.retries += 1
+        # На другой сервер - сразу, на тот же - после паузы
+        delay = 0.0 if switching else backoff_delay(attempt)
+        if deadline_at is not None:
+            delay = min(delay, max(0.0, deadline_at - time.time()))
+        target = "на другом сервере" if switching else f"через {delay:.1f} с"
+        print(f"🔁 {endpoint.url}: {reason} - повтор {attempt}/{self.retries} {target}")
+        if delay:
+            time.sleep(delay)
+    
+    @contextmanager
+    def post(self, path: str, timeout=None, label: str = '', **kwargs):
+        """POST с балансировкой, повторами и переходом на другой сервер при сбое
+        
+        Используется как session.post в with-блоке; сервер считается занятым,
+        пока блок не завершён (для stream=True - пока читается ответ). Если все
+        повторы исчерпаны, поднимается последняя ошибка соединения или
+        возвращается последний ответ с ошибкой. label - метка для retry_stats(label).
+        """
+        deadline_at = time.time() + self.deadline if self.deadline else None
+        failed = []
+        attempt = 0
+        while True:
+            endpoint = self._acquire(failed)
+            if endpoint is None:
+                # Все серверы уже отказали в этом круге - начинаем новый круг
+                failed = []
+                endpoint = self._acquire(failed)
+            
+            start = time.time()
+            try:
+                response = endpoint.session.post(f"{endpoint.url}{path}",
+                                                 timeout=self._timeout(timeout, deadline_at), **kwargs)
+                reason = f"HTTP {response.status_code}" if response.status_code in RETRYABLE_STATUSES else None
+            except (self.requests.ConnectionError, self.requests.Timeout) as e:
+                response, reason = None, str(e)
+            
+            if reason is None:
+                break
+            
+            attempt += 1
+            give_up = attempt > self.retries or (deadline_at is not None and time.time() >= deadline_at)
+            if give_up and response is not None:
+                # Последний ответ с ошибкой отдаём вызывающему коду как есть
+                with self.lock:
+                    self._count(label, 'failed_requests')
+                break
+            
+            if response is not None:
+                response.close()
+            self._release(endpoint, time.time() - start, reason)
+            if give_up:
+                with self.lock:
+                    self._count(label, 'failed_requests')
+                raise self.requests.ConnectionError(f"{endpoint.url}: {reason}")
+            failed.append(endpoint)
+            
+            switching = any(e not in failed for e in self.endpoints)
+            self._wait_before_retry(attempt, reason, endpoint, switching, deadline_at, label)
+        
+        error = f"HTTP {response.status_code}" if response.status_code >= 500 else None
+        try:
+            yield response
+        except (self.requests.ConnectionError, self.requests.Timeout) as e:
+            error = str(e)
+            raise
+        finally:
+            response.close()
+            self._release(endpoint, time.time() - start, error)
+    
+    def model_context(self, model: str) -> Dict[str, Optional[int]]:
+        """Окно контекста модели по /api/show
+        
+        num_ctx - из параметров Modelfile (столько сервер выделяет по умолчанию),
+        context_length - предел архитектуры модели. None - не удалось узнать.
+        """
+        info = {"num_ctx": None, "context_length": None}
+        # Служебный запрос - без повторов: первый ответивший сервер
+        result = None
+        for endpoint in sorted(self.endpoints, key=lambda e: not e.healthy):
+            try:
+                response = endpoint.session.post(f"{endpoint.url}/api/show", json={"model": model, "name": model},
+                                                 timeout=HEALTH_TIMEOUT)
+                if response.status_code == 200:
+                    result = response.json()
+                    break
+            except Exception as e:
+                print(f"⚠️  Не удалось получить параметры модели ({endpoint.url}): {e}")
+        if not isinstance(result, dict):
+            return info
+        
+        for line in (result.get('parameters') or '').splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[0] == 'num_ctx' and parts[1].isdigit():
+                info["num_ctx"] = int(parts[1])
+        for key, value in (result.get('model_info') or {}).items():
+            if key.endswith('.context_length') and isinstance(value, int):
+                info["context_length"] = value
+        return info
+    
+    def retry_stats(self, label: Optional[str] = None) -> Dict[str, int]:
+        """Повторы за запуск (label - только запросов с этой меткой) - для метаданных результата"""
+        with self.lock:
+            if label is None:
+                return {"retries": self.retry_count, "failed_requests": self.failed_requests}
+            return dict(self.label_stats.get(label, {"retries": 0, "failed_requests": 0}))
+    
+    def stats(self) -> List[Dict[str, Any]]:
+        return [endpoint.stats() for endpoint in self.endpoints]
+    
+    def print_stats(self):
+        print("🖥️  Серверы Ollama:")
+        for endpoint in self.endpoints:
+            state = "✅" if endpoint.healthy else "❌"
+            print(f"   {state} {endpoint.url}: запросов {endpoint.requests}, ошибок {endpoint.errors}, "
+                  f"повторов {endpoint.retries}, средняя задержка {endpoint.avg_latency:.1f} с")
+
+
+class OllamaMetrics:
+    """Метрики вызовов /api/generate из ответа Ollama (или последнего чанка потока)
+    
+    По каждому вызову - токены промпта и ответа и время: полное, загрузки
+    модели, обработки промпта и генерации. По сводке видно, во что упирается
+    запуск: в размер промпта, в размер ответа или в холодную загрузку модели.
+    Ollama считает в prompt_eval_count только токены, не найденные в KV-кэше,
+    поэтому при совпадающем префиксе промпта число и время падают.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+    
+    def record(self, result: Dict[str, Any], label: str = ''):
+        """Запоминает метрики ответа; ответы без них (не done) пропускаются"""
+        if not isinstance(result, dict) or not result.get('done'):
+            return
+        with self.lock:
+            self.calls.append({
+                "label": label,
+                "prompt_tokens": result.get('prompt_eval_count', 0),
+                "output_tokens": result.get('eval_count', 0),
+                "total_sec": round(result.get('total_duration', 0) / 1e9, 3),
+                "load_sec": round(result.get('load_duration', 0) / 1e9, 3),
+                "prompt_eval_sec": round(result.get('prompt_eval_duration', 0) / 1e9, 3),
+                "eval_sec": round(result.get('eval_duration', 0) / 1e9, 3)
+            })
+    
+    def summary(self, label: Optional[str] = None) -> Dict[str, Any]:
+        """Сводка по вызовам (label - только по вызовам с этой меткой)"""
+        with self.lock:
+            calls = [call for call in self.calls if label is None or call['label'] == label]
+        
+        def total(key):
+            return round(sum(call[key] for call in calls), 3)
+        
+        prompt_sec, eval_sec, load_sec = total('prompt_eval_sec'), total('eval_sec'), total('load_sec')
+        busy = prompt_sec + eval_sec + load_sec
+        return {
+            "calls": len(calls),
+            "prompt_tokens": total('prompt_tokens'),
+            "output_tokens": total('output_tokens'),
+            "total_sec": total('total_sec'),
+            "load_sec": load_sec,
+            "prompt_eval_sec": prompt_sec,
+            "eval_sec": eval_sec,
+            "prompt_tokens_per_sec": round(total('prompt_tokens') / prompt_sec, 1) if prompt_sec else None,
+            "output_tokens_per_sec": round(total('output_tokens') / eval_sec, 1) if eval_sec else None,
+            # Доли времени сервера: загрузка модели / обработка промпта / генерация
+            "load_share": round(load_sec / busy, 3) if busy else None,
+            "prompt_share": round(prompt_sec / busy, 3) if busy else None,
+            "generation_share": round(eval_sec / busy, 3) if busy else None,
+            "per_call": calls
+        }
+    
+    def print_summary(self, label: Optional[str] = None):
+        summary = self.summary(label)
+        if not summary['calls']:
+            return
+        print(f"🧮 Ollama: {summary['calls']} вызовов, {summary['total_sec']:.1f} с; "
+              f"промпт {summary['prompt_tokens']} токенов за {summary['prompt_eval_sec']:.1f} с"
+              f" ({summary['prompt_tokens_per_sec'] or 0} ток/с), "
+              f"ответ {summary['output_tokens']} токенов за {summary['eval_sec']:.1f} с"
+              f" ({summary['output_tokens_per_sec'] or 0} ток/с), "
+              f"загрузка модели {summary['load_sec']:.1f} с")
+        if summary['prompt_share'] is not None:
+            print(f"   Время сервера: загрузка {summary['load_share']:.0%}, "
+                  f"промпт {summary['prompt_share']:.0%}, генерация {summary['generation_share']:.0%}")
+
+
+def keep_alive_value(value: str) -> Union[str, int]:
+    """keep_alive для Ollama: число секунд ("-1", "0") - числом, длительность ("30m") - строкой"""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def add_http_arguments(parser):
+    """Аргументы повторов, deadline и keep_alive для CLI LLM-скриптов"""
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help=f'Повторов запроса к Ollama после сбоя (по умолчанию: {DEFAULT_RETRIES})')
+    parser.add_argument('--request-deadline', type=float, default=None,
+                        help='Предельное время одного запроса к Ollama со всеми повторами, сек')
+    parser.add_argument('--keep-alive', type=keep_alive_value, default=DEFAULT_KEEP_ALIVE,
+                        help=f'Сколько Ollama держит модель в памяти после запроса '
+                             f'(по умолчанию: {DEFAULT_KEEP_ALIVE}; -1 - всегда)')
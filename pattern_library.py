@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Библиотека regex-паттернов llm_regex_analyzer.py
+
+Каждый успешный набор паттернов (.regex.json) сохраняется вместе со структурным
+отпечатком исходного документа: заголовки разделов, шапки таблиц и строки-якоря
+("Марка стали:", "Таблица 1" и т.п.) с цифрами, заменёнными на #. Новый документ
+сравнивается с отпечатками библиотеки; паттерны похожих документов применяются
+напрямую, и если они находят достаточно полей, LLM не вызывается.
+
+Использование:
+    python3 pattern_library.py add --library patterns/ -f doc.txt -r doc.regex.json
+    python3 pattern_library.py match --library patterns/ -f new_doc.txt
+"""
+
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+# Минимальная похожесть отпечатков, чтобы пробовать паттерны документа
+DEFAULT_MIN_SIMILARITY = 0.5
+
+# Доля полей, которые паттерны должны найти, чтобы обойтись без LLM
+DEFAULT_MIN_COVERAGE = 0.8
+
+# Сколько самых похожих наборов проверять применением паттернов
+MAX_CANDIDATES = 3
+
+# Вес компонентов отпечатка в похожести
+FINGERPRINT_WEIGHTS = {'sections': 0.4, 'table_headers': 0.3, 'anchors': 0.3}
+
+SECTION_TITLE = re.compile(r'^(\d+(\.\d+)*\.?\s+\S.*|[А-ЯЁA-Z][А-ЯЁA-Z0-9 ,\-–.]{5,})$')
+TABLE_SEPARATOR = re.compile(r'^\|?\s*:?-{3,}')
+TABLE_CAPTION = re.compile(r'^таблица\s+\S+', re.IGNORECASE)
+MAX_ANCHOR_LENGTH = 60
+
+
+def _normalize(line: str) -> str:
+    """Строка без чисел, регистра и лишних пробелов: "Таблица 4" -> "таблица #" """
+    line = re.sub(r'\d+', '#', line.lower())
+    return re.sub(r'\s+', ' ', line).strip(' |:.-')
+
+
+def fingerprint(text: str) -> Dict[str, Set[str]]:
+    """Структурный отпечаток документа: {'sections', 'table_headers', 'anchors'}"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    result = {'sections': set(), 'table_headers': set(), 'anchors': set()}
+    
+    for i, line in enumerate(lines):
+        if line.startswith('|'):
+            # Шапка Markdown-таблицы - строка перед разделителем |---|
+            if i + 1 < len(lines) and TABLE_SEPARATOR.match(lines[i + 1]):
+                result['table_headers'].add(_normalize(line))
+            continue
+        
+        if line.startswith('--- Страница'):
+            continue
+        
+        if TABLE_CAPTION.match(line) or SECTION_TITLE.match(line):
+            result['sections'].add(_normalize(line)[:MAX_ANCHOR_LENGTH])
+        elif ':' in line:
+            # Подпись поля: "Марка стали: 6856" -> "марка стали"
+            label = _normalize(line.split(':', 1)[0])
+            if label and len(label) <= MAX_ANCHOR_LENGTH:
+                result['anchors'].add(label)
+        elif len(line) <= MAX_ANCHOR_LENGTH and re.search(r'[^\W\d_]{3}', line):
+            result['anchors'].add(_normalize(line))
+    
+    return {key: {value for value in values if value} for key, values in result.items()}
+
+
+def similarity(first: Dict[str, Set[str]], second: Dict[str, Set[str]]) -> float:
+    """Взвешенный коэффициент Жаккара по компонентам отпечатка (0..1)"""
+    score = total_weight = 0.0
+    for key, weight in FINGERPRINT_WEIGHTS.items():
+        a, b = set(first.get(key, ())), set(second.get(key, ()))
+        if not a and not b:
+            continue
+        score += weight * len(a & b) / len(a | b)
+        total_weight += weight
+    return score / total_weight if total_weight else 0.0
+
+
+def regex_flags(flags_list: List[str]) -> int:
+    """Флаги re из списка имён ("MULTILINE", "IGNORECASE", "DOTALL")"""
+    flags = 0
+    if 'MULTILINE' in flags_list:
+        flags |= re.MULTILINE
+    if 'IGNORECASE' in flags_list:
+        flags |= re.IGNORECASE
+    if 'DOTALL' in flags_list:
+        flags |= re.DOTALL
+    return flags
+
+
+def apply_patterns(text: str, patterns: Dict[str, Any]) -> Dict[str, Any]:
+    """Применяет паттерны {раздел: {поле: {pattern, flags}}} к тексту
+    
+    Возвращает {'sections': {раздел: {'extracted_data', 'regex_patterns'}},
+    'fields': всего полей, 'found': найдено полей, 'coverage': found / fields}.
+    """
+    sections = {}
+    fields = found = 0
+    
+    for section_name, section_patterns in patterns.items():
+        if not isinstance(section_patterns, dict):
+            continue
+        extracted = {}
+        for field_name, pattern_info in section_patterns.items():
+            if not isinstance(pattern_info, dict) or 'pattern' not in pattern_info:
+                continue
+            fields += 1
+            try:
+                matches = re.findall(pattern_info['pattern'], text, regex_flags(pattern_info.get('flags', [])))
+            except re.error:
+                continue
+            if matches:
+                found += 1
+                extracted[field_name] = matches[0] if len(matches) == 1 else matches
+        sections[section_name] = {'extracted_data': extracted, 'regex_patterns': section_patterns}
+    
+    return {
+        'sections': sections,
+        'fields': fields,
+        'found': found,
+        'coverage': found / fields if fields else 0.0
+    }
+
+
+class PatternLibrary:
+    """Каталог наборов паттернов: один JSON на исходный документ"""
+    
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.entries = []
+        for path in sorted(self.directory.glob('*.json')):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                entry['fingerprint'] = {k: set(v) for k, v in entry['fingerprint'].items()}
+                entry['path'] = path
+                self.entries.append(entry)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️  Пропущена запись библиотеки {path.name}: {e}")
+    
+    def add(self, text: str, patterns: Dict[str, Any], source_file: str,
+            model: Optional[str] = None) -> Path:
+        """Сохраняет набор паттернов с отпечатком документа (запись с тем же именем заменяется)"""
+        doc_fingerprint = fingerprint(text)
+        path = self.directory / f"{Path(source_file).stem}.json"
+        entry = {
+            'source_file': source_file,
+            'model': model,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'fingerprint': {k: sorted(v) for k, v in doc_fingerprint.items()},
+            'patterns': patterns
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+        
+        self.entries = [e for e in self.entries if e['path'] != path]
+        self.entries.append(dict(entry, fingerprint=doc_fingerprint, path=path))
+        print(f"📚 Паттерны добавлены в библиотеку: {path}")
+        return path
+    
+    def find(self, text: str, min_similarity: float = DEFAULT_MIN_SIMILARITY,
+             min_coverage: float = DEFAULT_MIN_COVERAGE) -> Optional[Dict[str, Any]]:
+        """Лучший подходящий набор паттернов или None
+        
+        Паттерны MAX_CANDIDATES самых похожих документов применяются к тексту;
+        подходит набор с наибольшим покрытием, если оно не ниже min_coverage.
+        """
+        doc_fingerprint = fingerprint(text)
+        candidates = sorted(
+            ((similarity(doc_fingerprint, entry['fingerprint']), entry) for entry in self.entries),
+            key=lambda item: item[0], reverse=True
+        )
+        candidates = [(score, entry) for score, entry in candidates if score >= min_similarity][:MAX_CANDIDATES]
+        
+        best = None
+        for score, entry in candidates:
+            applied = apply_patterns(text, entry['patterns'])
+            print(f"   📚 {entry['path'].name}: похожесть {score:.2f}, "
+                  f"найдено полей {applied['found']}/{applied['fields']} ({applied['coverage']:.0%})")
+            if applied['coverage'] >= min_coverage and (best is None or applied['coverage'] > best['coverage']):
+                best = dict(applied, entry=entry, similarity=score)
+        
+        return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Библиотека regex-паттернов llm_regex_analyzer.py')
+    parser.add_argument('command', choices=['add', 'match'],
+                        help='add - добавить .regex.json в библиотеку, match - подобрать паттерны для документа')
+    parser.add_argument('--library', '-l', required=True, help='Каталог библиотеки')
+    parser.add_argument('--file', '-f', required=True, help='Текстовый файл документа')
+    parser.add_argument('--regex-file', '-r', help='Файл .regex.json (для add)')
+    parser.add_argument('--min-similarity', type=float, default=DEFAULT_MIN_SIMILARITY,
+                        help=f'Минимальная похожесть отпечатков (по умолчанию: {DEFAULT_MIN_SIMILARITY})')
+    parser.add_argument('--min-coverage', type=float, default=DEFAULT_MIN_COVERAGE,
+                        help=f'Минимальная доля найденных полей (по умолчанию: {DEFAULT_MIN_COVERAGE})')
+    args = parser.parse_args()
+    
+    input_file = Path(args.file)
+    if not input_file.exists():
+        print(f"❌ Файл не найден: {input_file}")
+        return
+    text = input_file.read_text(encoding='utf-8')
+    library = PatternLibrary(Path(args.library))
+    
+    if args.command == 'add':
+        regex_file = Path(args.regex_file or input_file.parent / f"{input_file.stem}.regex.json")
+        if not regex_file.exists():
+            print(f"❌ Файл с паттернами не найден: {regex_file}")
+            return
+        with open(regex_file, 'r', encoding='utf-8') as f:
+            regex_result = json.load(f)
+        library.add(text, regex_result.get('patterns', {}), input_file.name,
+                    regex_result.get('file_info', {}).get('model'))
+        return
+    
+    print(f"🔎 Поиск в библиотеке ({len(library.entries)} наборов)...")
+    match = library.find(text, args.min_similarity, args.min_coverage)
+    if match:
+        print(f"✅ Подходит {match['entry']['path'].name}: найдено {match['found']}/{match['fields']} полей")
+    else:
+        print("❌ Подходящих паттернов нет - нужен анализ LLM")
+
+
+if __name__ == '__main__':
+    main()
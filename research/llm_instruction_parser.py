@@ -6,30 +6,67 @@ LLM-based парсер с человеческими инструкциями
 """
 
 import re
+import sys
 import json
 import argparse
-import requests
 import urllib3
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
+
+# Общие модули LLM (llm_cache, ollama_client) лежат в корне проекта
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from llm_cache import LLMCache, add_cache_arguments, cache_from_args
+from llm_prompt import ContextPlanner, add_context_arguments, build_prompt
+from llm_schema import DEFAULT_JSON_FORMAT, JSONParseStats, add_format_arguments, response_format
+from ollama_client import DEFAULT_KEEP_ALIVE, DEFAULT_RETRIES, OllamaMetrics, OllamaPool, add_http_arguments
 
 # Отключаем предупреждения SSL
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Лимит токенов ответа на задачу (резерв в окне контекста)
+NUM_PREDICT = 4096
+
+# Общая часть промпта всех задач: идёт первой, чтобы Ollama переиспользовала
+# KV-кэш - у задач одного документа совпадает и текст документа, задача в конце
+TASK_INSTRUCTIONS = """Ты - эксперт по извлечению данных из технических документов.
+Ниже приведён документ, после него - задача.
+
+ВАЖНО:
+1. Отвечай ТОЛЬКО валидным JSON, без дополнительных объяснений (если в задаче не сказано иное)
+2. Если данные не найдены, верни пустой объект {}
+3. Сохраняй точные значения из документа
+4. Для чисел используй числовой тип, для текста - строки"""
+
 
 class LLMInstructionParser:
     """Парсер документов на основе LLM инструкций"""
     
     def __init__(self, ollama_url: str, model: str, token: Optional[str] = None, 
-                 verify_ssl: bool = True):
+                 verify_ssl: bool = True, cache: Optional[LLMCache] = None,
+                 retries: int = DEFAULT_RETRIES, deadline: Optional[float] = None,
+                 keep_alive: Union[str, int] = DEFAULT_KEEP_ALIVE, json_format: str = DEFAULT_JSON_FORMAT,
+                 num_ctx: Optional[int] = None):
         self.ollama_url = ollama_url.rstrip('/')
         self.model = model
         self.verify_ssl = verify_ssl
+        self.cache = cache
+        self.keep_alive = keep_alive
+        self.metrics = OllamaMetrics()
+        self.json_format = json_format
+        self.parse_stats = JSONParseStats()
+        self.num_ctx = num_ctx
+        self.planner = None
+        # Сколько символов документа не вошло в окно контекста, по задачам
+        self.omitted_chars = {}
         
-        # Настраиваем сессию
-        self.session = requests.Session()
-        if token:
-            self.session.headers['X-Access-Token'] = token
+        # HTTP-клиент: пул соединений, повторы с паузой, deadline
+        self.pool = OllamaPool(self.ollama_url, token, verify_ssl, retries=retries, deadline=deadline)
+    
+    def context_planner(self) -> ContextPlanner:
+        """Планировщик окна контекста (окно узнаётся у модели при первом запросе)"""
+        if self.planner is None:
+            self.planner = ContextPlanner.for_model(self.pool, self.model, self.num_ctx, NUM_PREDICT)
+        return self.planner
     
     def parse_instructions_file(self, instructions_path: str) -> List[Dict[str, Any]]:
         """Парсит файл с инструкциями на задачи"""
@@ -75,35 +112,43 @@ class LLMInstructionParser:
         
         return tasks
     
-    def call_llm(self, prompt: str) -> str:
-        """Вызов LLM через Ollama API"""
+    def call_llm(self, prompt: str, label: str = '', json_output: bool = True) -> str:
+        """Вызов LLM через Ollama API (json_output - ответ ограничен валидным JSON)"""
         try:
-            url = f"{self.ollama_url}/api/generate"
-            
             payload = {
                 "model": self.model,
                 "prompt": prompt,
                 "stream": False,
+                "keep_alive": self.keep_alive,
                 "options": {
                     "temperature": 0.1,  # Низкая температура для точности
-                    "num_predict": 4096
+                    "num_predict": NUM_PREDICT,
+                    **self.context_planner().options()
                 }
             }
+            # Схемы у задач нет - ограничиваем ответ валидным JSON
+            output_format = response_format(self.json_format) if json_output else None
+            if output_format:
+                payload["format"] = output_format
             
-            response = self.session.post(
-                url,
-                json=payload,
-                verify=self.verify_ssl,
-                timeout=300
-            )
+            cached = self.cache.lookup(payload) if self.cache else None
+            if cached is not None:
+                print("   🗄️  Ответ LLM взят из кэша")
+                return cached
             
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('response', '')
-            else:
-                print(f"❌ Ошибка LLM API: {response.status_code}")
-                print(f"   {response.text}")
-                return ""
+            with self.pool.post("/api/generate", json=payload, timeout=300) as response:
+                if response.status_code == 200:
+                    result = response.json()
+                    self.metrics.record(result, label)
+                    self.context_planner().calibrate(prompt, result.get('prompt_eval_count'))
+                    text = result.get('response', '')
+                    if self.cache and text:
+                        self.cache.store(payload, text)
+                    return text
+                else:
+                    print(f"❌ Ошибка LLM API: {response.status_code}")
+                    print(f"   {response.text}")
+                    return ""
         
         except Exception as e:
             print(f"❌ Ошибка при вызове LLM: {e}")
@@ -113,32 +158,30 @@ class LLMInstructionParser:
         """Выполняет одну задачу парсинга"""
         print(f"\n🔍 Выполняется задача: {task['name']}")
         
-        # Формируем промпт
-        prompt = f"""Ты - эксперт по извлечению данных из технических документов.
-
-ДОКУМЕНТ:
-```
-{document_text[:15000]}  # Ограничиваем размер для LLM
-```
-
-ЗАДАЧА:
-{task['description']}
-
-ВАЖНО:
-1. Отвечай ТОЛЬКО валидным JSON, без дополнительных объяснений
-2. Если данные не найдены, верни пустой объект {{}}
-3. Сохраняй точные значения из документа
-4. Для чисел используй числовой тип, для текста - строки
-
-ОТВЕТ (только JSON):"""
+        # @FORMAT: text - ответ текстом, без ограничения JSON
+        json_output = task['format'] != 'text'
+        answer = "ОТВЕТ (только JSON):" if json_output else "ОТВЕТ (текстом, без JSON):"
+        
+        # Инструкции и документ одинаковы у всех задач, задача - в конце.
+        # Документ, не помещающийся в окно, сокращается до фрагментов,
+        # относящихся к задаче (пропущенное учитывается в file_info)
+        task_text = f"ЗАДАЧА:\n{task['description']}\n\n{answer}"
+        document, omitted = self.context_planner().select(TASK_INSTRUCTIONS, document_text, task_text,
+                                                          query=f"{task['name']} {task['description']}")
+        if omitted:
+            self.omitted_chars[task['name']] = omitted
+        prompt = build_prompt(TASK_INSTRUCTIONS, document, task_text, document_title='ДОКУМЕНТ')
 
         # Вызываем LLM
-        response = self.call_llm(prompt)
+        response = self.call_llm(prompt, task['name'], json_output)
         
         if not response:
             print(f"   ⚠️  Пустой ответ от LLM")
             return {}
         
+        if not json_output:
+            return response.strip()
+        
         # Извлекаем JSON из ответа
         try:
             # Ищем JSON в ответе (может быть обёрнут в markdown или текст)
@@ -146,14 +189,17 @@ class LLMInstructionParser:
             if json_match:
                 json_str = json_match.group(0)
                 result = json.loads(json_str)
+                self.parse_stats.record(True)
                 print(f"   ✅ Успешно извлечено: {len(str(result))} символов")
                 return result
             else:
+                self.parse_stats.record(False)
                 print(f"   ⚠️  JSON не найден в ответе")
                 print(f"   Ответ: {response[:200]}...")
                 return {}
         
         except json.JSONDecodeError as e:
+            self.parse_stats.record(False)
             print(f"   ❌ Ошибка парсинга JSON: {e}")
             print(f"   Ответ: {response[:500]}...")
             return {}
@@ -188,6 +234,13 @@ class LLMInstructionParser:
             task_result = self.execute_task(task, document_text)
             result['extracted_data'][task['output_key']] = task_result
         
+        result['file_info']['ollama_retries'] = self.pool.retry_stats()
+        result['file_info']['ollama_metrics'] = self.metrics.summary()
+        result['file_info']['json_parse'] = self.parse_stats.summary()
+        result['file_info']['context'] = {
+            "window": self.planner.context_window if self.planner else None,
+            "omitted_chars": self.omitted_chars
+        }
         return result
 
 
@@ -209,6 +262,10 @@ def main():
                        help='Токен авторизации для API')
     parser.add_argument('--no-ssl-verify', action='store_true',
                        help='Отключить проверку SSL сертификата')
+    add_cache_arguments(parser)
+    add_http_arguments(parser)
+    add_format_arguments(parser)
+    add_context_arguments(parser)
     
     args = parser.parse_args()
     
@@ -239,7 +296,13 @@ def main():
         ollama_url=args.ollama_url,
         model=args.model,
         token=args.token,
-        verify_ssl=not args.no_ssl_verify
+        verify_ssl=not args.no_ssl_verify,
+        cache=cache_from_args(args),
+        retries=args.retries,
+        deadline=args.request_deadline,
+        keep_alive=args.keep_alive,
+        json_format=args.json_format,
+        num_ctx=args.num_ctx
     )
     
     # Парсим документ
@@ -260,6 +323,10 @@ def main():
         else:
             print(f"   {key}: {type(value).__name__}")
     
+    if llm_parser.cache:
+        llm_parser.cache.print_stats()
+    llm_parser.metrics.print_summary()
+    llm_parser.parse_stats.print_summary()
     print("="*80)
 
 
@@ -7,26 +7,52 @@ LLM-парсер для извлечения структурированных
 
 import argparse
 import json
-import requests
+import sys
 import time
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
 import re
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Общие модули LLM (llm_cache, ollama_client) лежат в корне проекта
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from llm_cache import LLMCache, add_cache_arguments, cache_from_args
+from llm_prompt import ContextPlanner, add_context_arguments, build_prompt
+from llm_schema import DEFAULT_JSON_FORMAT, JSONParseStats, add_format_arguments, blocks_schema, response_format
+from ollama_client import DEFAULT_KEEP_ALIVE, DEFAULT_RETRIES, OllamaMetrics, OllamaPool, add_http_arguments
+
+# Резерв окна контекста на ответ; ответ этапа 1 повторяет текст блоков,
+# поэтому документ идёт в него частями не больше BLOCKS_PART_TOKENS
+OUTPUT_TOKENS = 4096
+BLOCKS_PART_TOKENS = 3000
 
 class LLMDocumentParser:
     """Парсер документов с использованием LLM через Ollama"""
     
-    def __init__(self, ollama_url: str, model: str, token: Optional[str] = None, verify_ssl: bool = True):
+    def __init__(self, ollama_url: str, model: str, token: Optional[str] = None, verify_ssl: bool = True,
+                 cache: Optional[LLMCache] = None, retries: int = DEFAULT_RETRIES,
+                 deadline: Optional[float] = None, keep_alive: Union[str, int] = DEFAULT_KEEP_ALIVE,
+                 json_format: str = DEFAULT_JSON_FORMAT, num_ctx: Optional[int] = None):
         self.ollama_url = ollama_url.rstrip('/')
         self.model = model
         self.token = token
-        self.session = requests.Session()
-        self.session.verify = verify_ssl
-        if token:
-            self.session.headers.update({'X-Access-Token': token})
+        # Генерация идёт через OllamaPool (повторы, deadline), служебные запросы - через его сессию
+        self.pool = OllamaPool(self.ollama_url, token, verify_ssl, retries=retries, deadline=deadline)
+        self.session = self.pool.endpoints[0].session
+        self.cache = cache
+        self.keep_alive = keep_alive
+        self.metrics = OllamaMetrics()
+        self.json_format = json_format
+        self.parse_stats = JSONParseStats()
+        self.num_ctx = num_ctx
+        self.planner = None
+    
+    def context_planner(self) -> ContextPlanner:
+        """Планировщик окна контекста (окно узнаётся у модели при первом запросе)"""
+        if self.planner is None:
+            self.planner = ContextPlanner.for_model(self.pool, self.model, self.num_ctx, OUTPUT_TOKENS)
+        return self.planner
     
     def test_connection(self) -> bool:
         """Тестирует соединение с Ollama"""
@@ -142,37 +168,51 @@ class LLMDocumentParser:
                     response = response[json_start:json_end]
             
             parsed = json.loads(response)
+            self.parse_stats.record(True)
             return parsed.get('blocks', [])
         except json.JSONDecodeError as e:
+            self.parse_stats.record(False)
             print(f"❌ Ошибка парсинга блоков: {e}")
             return []
     
-    def call_ollama(self, prompt: str, context: str = "") -> Optional[str]:
-        """Вызывает Ollama API"""
+    def call_ollama(self, prompt: str, context: str = "", label: str = "",
+                    schema: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Вызывает Ollama API (schema - JSON-схема ответа, без неё ответ - любой JSON)"""
         try:
-            # Объединяем промпт и контекст
-            full_prompt = f"{prompt}\n\nКонтекст:\n{context}" if context else prompt
+            # Промпт - неизменный префикс (KV-кэш Ollama), контекст - после него
+            full_prompt = build_prompt(prompt, context, document_title='Контекст')
             
             payload = {
                 "model": self.model,
                 "prompt": full_prompt,
                 "stream": False,
+                "keep_alive": self.keep_alive,
                 "options": {
                     "temperature": 0.1,  # Низкая температура для более точных результатов
-                    "top_p": 0.9
+                    "top_p": 0.9,
+                    **self.context_planner().options()
                 }
             }
+            output_format = response_format(self.json_format, schema)
+            if output_format:
+                payload["format"] = output_format
             
-            response = self.session.post(f"{self.ollama_url}/api/generate", 
-                                       json=payload, 
-                                       timeout=60)
+            cached = self.cache.lookup(payload) if self.cache else None
+            if cached is not None:
+                return cached
             
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('response', '').strip()
-            else:
-                print(f"❌ Ошибка API: {response.status_code} - {response.text}")
-                return None
+            with self.pool.post("/api/generate", json=payload, timeout=60) as response:
+                if response.status_code == 200:
+                    result = response.json()
+                    self.metrics.record(result, label)
+                    self.context_planner().calibrate(full_prompt, result.get('prompt_eval_count'))
+                    text = result.get('response', '').strip()
+                    if self.cache and text:
+                        self.cache.store(payload, text)
+                    return text
+                else:
+                    print(f"❌ Ошибка API: {response.status_code} - {response.text}")
+                    return None
                 
         except Exception as e:
             print(f"❌ Ошибка вызова Ollama: {e}")
@@ -194,15 +234,17 @@ class LLMDocumentParser:
         print(f"  Применяем промпт для типа: {chunk_type}")
         
         # Вызываем Ollama с соответствующим промптом
-        result = self.call_ollama(prompt, chunk)
+        result = self.call_ollama(prompt, chunk, chunk_type)
         
         if result:
             try:
                 # Пытаемся распарсить JSON результат
                 parsed_result = json.loads(result)
+                self.parse_stats.record(True)
                 return parsed_result
             except json.JSONDecodeError:
                 # Если не JSON, сохраняем как текст
+                self.parse_stats.record(False)
                 return {"raw_result": result}
         
         return {}
@@ -218,13 +260,21 @@ class LLMDocumentParser:
             return {}
         
         # Вызываем основной промпт для разбивки на блоки
-        main_response = self.call_ollama(main_prompt, content)
-        if not main_response:
-            print("❌ Не удалось получить разбивку на блоки")
-            return {}
+        # Типы блоков из примера в промпте ограничивают block_type в схеме ответа
+        block_types = self.extract_block_types_from_main_prompt(main_prompt)
+        # Длинный документ разбивается на блоки по частям - ответ повторяет текст блоков
+        parts = self.context_planner().plan(main_prompt, content, max_tokens=BLOCKS_PART_TOKENS)
+        blocks = []
+        for index, part in enumerate(parts, 1):
+            if len(parts) > 1:
+                print(f"  📄 Часть {index}/{len(parts)} ({len(part)} символов)")
+            main_response = self.call_ollama(main_prompt, part, 'blocks', blocks_schema(block_types))
+            if not main_response:
+                print("❌ Не удалось получить разбивку на блоки")
+                return {}
         
-        # Парсим блоки из ответа
-        blocks = self.parse_blocks_from_main_response(main_response)
+            # Парсим блоки из ответа
+            blocks.extend(self.parse_blocks_from_main_response(main_response))
         if not blocks:
             print("❌ Не удалось распарсить блоки")
             return {}
@@ -287,14 +337,16 @@ class LLMDocumentParser:
                 continue
             
             # Обрабатываем блок
-            block_result = self.call_ollama(specialized_prompt, block_content)
+            block_result = self.call_ollama(specialized_prompt, block_content, block_type)
             if block_result:
                 try:
                     # Пытаемся распарсить JSON результат
                     parsed_result = json.loads(block_result)
+                    self.parse_stats.record(True)
                     final_results.update(parsed_result)
                 except json.JSONDecodeError:
                     # Если не JSON, сохраняем как текст
+                    self.parse_stats.record(False)
                     final_results[f"{block_type}_raw"] = block_result
             
             # Пауза между блоками
@@ -351,7 +403,11 @@ class LLMDocumentParser:
             "file_info": {
                 "filename": file_path.name,
                 "processing_method": "two_stage_separate_prompts",
-                "total_prompts": len(prompts)
+                "total_prompts": len(prompts),
+                "ollama_retries": self.pool.retry_stats(),
+                "ollama_metrics": self.metrics.summary(),
+                "json_parse": self.parse_stats.summary(),
+                "context_window": self.planner.context_window if self.planner else None
             },
             "extracted_data": final_results
         }
@@ -388,6 +444,10 @@ def main():
                        help='Размер перекрытия между чанками (по умолчанию: 200)')
     parser.add_argument('--no-ssl-verify', action='store_true',
                        help='Отключить проверку SSL сертификата')
+    add_cache_arguments(parser)
+    add_http_arguments(parser)
+    add_format_arguments(parser)
+    add_context_arguments(parser)
     
     args = parser.parse_args()
     
@@ -404,7 +464,13 @@ def main():
     
     # Создаем парсер
     parser_instance = LLMDocumentParser(args.ollama_url, args.model, args.token, 
-                                      verify_ssl=not args.no_ssl_verify)
+                                      verify_ssl=not args.no_ssl_verify,
+                                      cache=cache_from_args(args),
+                                      retries=args.retries,
+                                      deadline=args.request_deadline,
+                                      keep_alive=args.keep_alive,
+                                      json_format=args.json_format,
+                                      num_ctx=args.num_ctx)
     
     # Тестируем соединение
     if not parser_instance.test_connection():
@@ -434,6 +500,11 @@ def main():
     else:
         print(f"\n❌ Обработка не удалась")
 
+    if parser_instance.cache:
+        parser_instance.cache.print_stats()
+    parser_instance.metrics.print_summary()
+    parser_instance.parse_stats.print_summary()
+
 
 if __name__ == "__main__":
     main()
@@ -14,6 +14,12 @@ import numpy as np
 from PIL import Image
 import fitz  # PyMuPDF для работы с PDF
 
+from preprocessing import pixmap_to_bgr
+
+# Общий интерфейс OCR-движков (ocr_engines.py) лежит в корне проекта
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ocr_engines import readtext_blocks
+
 # Импорты OCR библиотек
 try:
     import easyocr
@@ -45,41 +51,48 @@ class OCRProcessor:
         """Обработка изображения с помощью EasyOCR"""
         reader = self.initialize_easyocr()
         
-        # Читаем изображение
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Не удалось загрузить изображение: {image_path}")
+        # Читаем изображение (или используем уже отрендеренную страницу)
+        if isinstance(image_path, np.ndarray):
+            image = image_path
+        else:
+            image = cv2.imread(image_path)
+            if image is None:
+                raise ValueError(f"Не удалось загрузить изображение: {image_path}")
         
         # Распознавание текста
-        results = reader.readtext(image)
+        blocks = readtext_blocks(reader, image)
         
         # Извлекаем текст
-        text_lines = []
-        for (bbox, text, confidence) in results:
-            if confidence > 0.5:  # Фильтруем по уверенности
-                text_lines.append(text)
-        
-        return '\n'.join(text_lines)
+        return '\n'.join(block['text'] for block in blocks)
+    
+    def recognize_page(self, image):
+        """Общий интерфейс движков (ocr_engines.py): страница RGB -> блоки текста"""
+        reader = self.initialize_easyocr()
+        blocks = readtext_blocks(reader, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+        return {'blocks': blocks, 'tables': []}
     
     def convert_pdf_to_images(self, pdf_path, resolution=5.0):
-        """Конвертация PDF в изображения"""
+        """Лениво рендерит страницы PDF в numpy-массивы BGR
+        
+        Возвращает (число страниц, генератор изображений). Изображение - вид на буфер
+        пиксмапа PyMuPDF без кодирования в PNG и обратно; оно действительно до
+        перехода к следующей странице.
+        """
         doc = fitz.open(pdf_path)
-        images = []
+        page_count = len(doc)
         
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            # Увеличиваем разрешение для лучшего качества OCR
-            mat = fitz.Matrix(resolution, resolution)
-            pix = page.get_pixmap(matrix=mat)
-            img_data = pix.tobytes("png")
-            
-            # Конвертируем в numpy array для OpenCV
-            nparr = np.frombuffer(img_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            images.append(img)
+        def render_pages():
+            try:
+                # Увеличиваем разрешение для лучшего качества OCR
+                mat = fitz.Matrix(resolution, resolution)
+                for page in doc:
+                    # Пиксмап держим в переменной: массив - вид на его буфер и без него недействителен
+                    pix = page.get_pixmap(matrix=mat, alpha=False)
+                    yield pixmap_to_bgr(pix)
+            finally:
+                doc.close()
         
-        doc.close()
-        return images
+        return page_count, render_pages()
     
     def save_image_temp(self, image, temp_path):
         """Сохранение изображения во временный файл"""
@@ -93,7 +106,8 @@ def process_image_file(processor, image_path):
         text = processor.process_with_easyocr(image_path)
         return text
     except Exception as e:
-        print(f"❌ Ошибка при обработке {image_path}: {e}")
+        name = image_path if isinstance(image_path, str) else "страницы"
+        print(f"❌ Ошибка при обработке {name}: {e}")
         return ""
 
 
@@ -151,23 +165,16 @@ def main():
             elif file_ext in pdf_extensions:
                 # Конвертируем PDF в изображения и обрабатываем каждую страницу
                 print(f"\n📑 Конвертируем PDF: {file_path.name}")
-                images = processor.convert_pdf_to_images(str(file_path), resolution=args.resolution)
+                page_count, images = processor.convert_pdf_to_images(str(file_path), resolution=args.resolution)
                 
                 all_text = []
                 for i, image in enumerate(images):
-                    print(f"  📄 Обрабатываем страницу {i+1}/{len(images)}")
+                    print(f"  📄 Обрабатываем страницу {i+1}/{page_count}")
                     
-                    # Сохраняем изображение во временный файл
-                    temp_path = f"/tmp/temp_page_{i}.png"
-                    processor.save_image_temp(image, temp_path)
-                    
-                    # Обрабатываем изображение
-                    text = process_image_file(processor, temp_path)
+                    # Обрабатываем страницу прямо из памяти, без временного PNG
+                    text = process_image_file(processor, image)
                     if text.strip():
                         all_text.append(f"--- Страница {i+1} ---\n{text}\n")
-                    
-                    # Удаляем временный файл
-                    os.remove(temp_path)
                 
                 # Сохраняем результат
                 output_file = output_dir / f"{file_path.stem}.txt"
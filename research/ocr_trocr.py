@@ -8,6 +8,7 @@ OCR скрипт на базе TrOCR с поддержкой печатного
 import argparse
 import os
 import sys
+import time
 from pathlib import Path
 import cv2
 import numpy as np
@@ -17,6 +18,9 @@ from typing import List, Tuple, Dict
 import warnings
 warnings.filterwarnings('ignore')
 
+from preprocessing import PREPROCESS_PROFILES, denoise, pixmap_to_bgr
+from table_regions import find_table_regions
+
 # Проверка наличия библиотек
 try:
     from transformers import TrOCRProcessor as HFTrOCRProcessor, VisionEncoderDecoderModel
@@ -29,6 +33,63 @@ except ImportError:
     sys.exit(1)
 
 
+def find_runs(mask):
+    """Возвращает массив [(start, end)] непрерывных участков True (end не включается)"""
+    padded = np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+    return edges.reshape(-1, 2)
+
+
+def find_line_spans(projection, threshold, min_height=10):
+    """Границы строк по горизонтальной проекции (векторизованно)
+    
+    Строка начинается, когда проекция становится > threshold, и заканчивается,
+    когда она становится < threshold; значения, равные порогу, состояние не меняют.
+    Строка, не закрытая до конца изображения, отбрасывается.
+    """
+    projection = np.asarray(projection)
+    # 1 - вход в строку, 0 - выход, -1 - состояние не меняется
+    events = np.where(projection > threshold, 1, np.where(projection < threshold, 0, -1))
+    if events.size == 0:
+        return []
+    if events[0] < 0:
+        events[0] = 0
+    # Протягиваем последнее событие вперед: состояние "внутри строки" в каждой позиции
+    last_event = np.maximum.accumulate(np.where(events >= 0, np.arange(events.size), 0))
+    in_text = events[last_event] == 1
+    
+    runs = find_runs(in_text)
+    # Незакрытая строка в конце не засчитывается
+    runs = runs[runs[:, 1] < projection.size]
+    runs = runs[(runs[:, 1] - runs[:, 0]) > min_height]
+    return [(int(start), int(end)) for start, end in runs]
+
+
+def split_lines_into_columns(binary, lines, min_column_gap=None):
+    """Делит каждую строку на колонки по вертикальным просветам шире min_column_gap
+    
+    По умолчанию просвет должен быть не уже трёх высот строки - промежутки между
+    словами так не режутся.
+    """
+    segments = []
+    for y_start, y_end in lines:
+        ink = np.any(binary[y_start:y_end] > 0, axis=0)
+        runs = find_runs(ink)
+        if len(runs) == 0:
+            continue
+        
+        gap = min_column_gap or 3 * (y_end - y_start)
+        gaps = runs[1:, 0] - runs[:-1, 1]
+        # Индексы участков, с которых начинается новая колонка
+        breaks = np.flatnonzero(gaps >= gap) + 1
+        starts = np.concatenate(([0], breaks))
+        ends = np.concatenate((breaks, [len(runs)])) - 1
+        for first, last in zip(starts, ends):
+            segments.append((y_start, y_end, int(runs[first, 0]), int(runs[last, 1])))
+    
+    return segments
+
+
 class TextTypeDetector:
     """Детектор типа текста: печатный vs рукописный"""
     
@@ -81,40 +142,91 @@ class TextTypeDetector:
             'contour_count': contour_count,
             'std_dev': std_dev
         }
-
-
-class TableDetector:
-    """Детектор таблиц на изображении"""
     
     @staticmethod
-    def detect_tables(image):
-        """Определяет области таблиц"""
+    def analyze_text_regions(image, lines):
+        """Пакетный вариант analyze_text_region для всех строк страницы
+        
+        Бинаризация (Otsu), Canny и поиск компонент выполняются один раз для всей
+        страницы; признаки строк считаются по интегральным изображениям за O(1)
+        на строку. Порог Otsu общий для страницы, а число контуров оценивается как
+        число связных компонент штрихов плюс число "дырок" в буквах, центры которых
+        попадают в строку, - поэтому признаки близки, но не идентичны поштучному анализу.
+        
+        lines - [(y_start, y_end)] или [(y_start, y_end, x_start, x_end)].
+        Возвращает словарь numpy-массивов с теми же ключами, что analyze_text_region.
+        """
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
         
-        # Бинаризация
-        _, binary = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY_INV)
-        
-        # Обнаружение горизонтальных и вертикальных линий
-        horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (40, 1))
-        vertical_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 40))
-        
-        horizontal_lines = cv2.morphologyEx(binary, cv2.MORPH_OPEN, horizontal_kernel, iterations=2)
-        vertical_lines = cv2.morphologyEx(binary, cv2.MORPH_OPEN, vertical_kernel, iterations=2)
+        bounds = np.array([
+            line if len(line) == 4 else (line[0], line[1], 0, gray.shape[1])
+            for line in lines
+        ], dtype=np.int64).reshape(-1, 4)
+        y0, y1, x0, x1 = bounds.T
         
-        # Объединяем линии
-        table_mask = cv2.add(horizontal_lines, vertical_lines)
+        # Бинаризация и края - один раз на страницу
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        edges = cv2.Canny(binary, 50, 150)
         
-        # Находим контуры (потенциальные таблицы)
-        contours, _ = cv2.findContours(table_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        def box_sum(integral):
+            return integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        
+        area = np.maximum((y1 - y0) * (x1 - x0), 1).astype(np.float64)
+        
+        # 1. Плотность краёв и 3. доля чёрных пикселей
+        edge_density = box_sum(cv2.integral((edges > 0).astype(np.uint8), sdepth=cv2.CV_64F)) / area
+        black_ratio = box_sum(cv2.integral((binary > 0).astype(np.uint8), sdepth=cv2.CV_64F)) / area
+        
+        # 4. Стандартное отклонение яркости через суммы и суммы квадратов
+        gray_sum, gray_sqsum = cv2.integral2(gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        mean = box_sum(gray_sum) / area
+        std_dev = np.sqrt(np.maximum(box_sum(gray_sqsum) / area - mean ** 2, 0))
+        
+        # 2. Число контуров: компоненты штрихов + дырки (фон, не касающийся края страницы)
+        _, _, _, ink_centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        _, _, hole_stats, hole_centroids = cv2.connectedComponentsWithStats(
+            cv2.bitwise_not(binary), connectivity=4)
+        page_h, page_w = gray.shape
+        touches_border = (
+            (hole_stats[:, cv2.CC_STAT_LEFT] == 0) | (hole_stats[:, cv2.CC_STAT_TOP] == 0) |
+            (hole_stats[:, cv2.CC_STAT_LEFT] + hole_stats[:, cv2.CC_STAT_WIDTH] >= page_w) |
+            (hole_stats[:, cv2.CC_STAT_TOP] + hole_stats[:, cv2.CC_STAT_HEIGHT] >= page_h)
+        )
+        centroids = np.vstack((ink_centroids[1:], hole_centroids[1:][~touches_border[1:]]))
+        cx, cy = centroids[:, 0], centroids[:, 1]
+        inside = ((cy[None, :] >= y0[:, None]) & (cy[None, :] < y1[:, None]) &
+                  (cx[None, :] >= x0[:, None]) & (cx[None, :] < x1[:, None]))
+        contour_count = inside.sum(axis=1)
+        
+        # Та же эвристика, что и в analyze_text_region
+        handwritten_score = (
+            (edge_density > 0.1).astype(int) +
+            (contour_count > 50).astype(int) +
+            (black_ratio < 0.15).astype(int) +
+            (std_dev > 40).astype(int)
+        )
         
-        table_regions = []
-        for contour in contours:
-            x, y, w, h = cv2.boundingRect(contour)
-            # Фильтруем слишком маленькие области
-            if w > 200 and h > 100:
-                table_regions.append((x, y, w, h))
+        return {
+            'is_handwritten': handwritten_score >= 2,
+            'confidence': handwritten_score / 4.0,
+            'edge_density': edge_density,
+            'contour_count': contour_count,
+            'black_ratio': black_ratio,
+            'std_dev': std_dev
+        }
+
+
+class TableDetector:
+    """Детектор таблиц на изображении"""
+    
+    @staticmethod
+    def detect_tables(image, scale=None):
+        """Определяет области таблиц
         
-        return table_regions
+        Кандидаты ищутся на уменьшенной копии, области - в полном разрешении внутри
+        них (table_regions.py); scale=1 - поиск целиком в полном разрешении.
+        """
+        return find_table_regions(image, min_width=200, min_height=100, scale=scale)
     
     @staticmethod
     def remove_table_lines(image_region):
@@ -143,47 +255,141 @@ class TableDetector:
         return result
 
 
+# Модели TrOCR по типу текста
+MODEL_NAMES = {
+    'printed': 'microsoft/trocr-base-printed',
+    'handwritten': 'microsoft/trocr-base-handwritten',
+}
+
+MODEL_TITLES = {
+    'printed': 'печатного текста',
+    'handwritten': 'рукописного текста',
+}
+
+
+# Профили декодирования строки
+DECODING_PROFILES = {
+    # Жадный поиск: быстро, достаточно для чистой печати
+    'greedy-fast': {'num_beams': 1, 'max_tokens': 96},
+    # Лучевой поиск с ранней остановкой: медленнее, точнее на сложных строках
+    'beam-accurate': {'num_beams': 4, 'early_stopping': True, 'max_tokens': 128},
+}
+
+# Оценка бюджета токенов по ширине строки: символов на одну высоту строки
+# и токенов на символ (с запасом - для кириллицы BPE даёт почти токен на символ)
+CHARS_PER_LINE_HEIGHT = 2.0
+TOKENS_PER_CHAR = 1.0
+MIN_LINE_TOKENS = 8
+
+# Строки с меньшей долей "чернил" или меньшего размера считаются шумом
+MIN_INK_RATIO = 0.01
+MIN_LINE_SIZE = 6
+
+
+def line_token_budget(width, height, max_tokens):
+    """Максимум новых токенов для строки заданного размера"""
+    chars = width / max(height, 1) * CHARS_PER_LINE_HEIGHT
+    budget = int(np.ceil(chars * TOKENS_PER_CHAR)) + 4
+    return int(min(max_tokens, max(MIN_LINE_TOKENS, budget)))
+
+
+class TrOCRModelManager:
+    """Загрузка и хранение моделей TrOCR
+    
+    Модель загружается один раз и остаётся в памяти, пока жив менеджер: между файлами
+    пакета и между циклами режима --watch. С cache_dir веса один раз пересохраняются
+    локально в safetensors; дальше они отображаются в память (mmap), загрузка занимает
+    доли секунды, а страницы файла общие для всех процессов, читающих тот же кэш.
+    """
+    
+    def __init__(self, device='cpu', cache_dir=None):
+        self.device = device
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.models = {}
+    
+    def local_path(self, kind):
+        """Каталог с локальной копией модели в safetensors"""
+        return self.cache_dir / MODEL_NAMES[kind].replace('/', '--')
+    
+    def _ensure_converted(self, kind):
+        """Пересохраняет модель в safetensors, если её ещё нет в кэше"""
+        target = self.local_path(kind)
+        if (target / 'model.safetensors').exists():
+            return target
+        
+        print(f"💾 Конвертация модели для {MODEL_TITLES[kind]} в safetensors: {target}")
+        processor = HFTrOCRProcessor.from_pretrained(MODEL_NAMES[kind])
+        model = VisionEncoderDecoderModel.from_pretrained(MODEL_NAMES[kind])
+        
+        # Пишем во временный каталог и переименовываем: параллельные процессы
+        # не увидят наполовину записанную модель
+        tmp_dir = target.with_name(f"{target.name}.tmp{os.getpid()}")
+        model.save_pretrained(tmp_dir, safe_serialization=True)
+        processor.save_pretrained(tmp_dir)
+        try:
+            tmp_dir.rename(target)
+        except OSError:
+            # Другой процесс успел раньше - используем его копию
+            import shutil
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return target
+    
+    def get(self, kind):
+        """Возвращает (processor, model), загружая модель при первом обращении"""
+        if kind not in self.models:
+            print(f"📥 Загрузка модели для {MODEL_TITLES[kind]}...")
+            start = time.perf_counter()
+            
+            source = MODEL_NAMES[kind]
+            if self.cache_dir:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                source = self._ensure_converted(kind)
+            
+            processor = HFTrOCRProcessor.from_pretrained(source)
+            model = VisionEncoderDecoderModel.from_pretrained(source)
+            model.to(self.device)
+            model.eval()
+            self.models[kind] = (processor, model)
+            
+            print(f"✅ Модель для {MODEL_TITLES[kind]} загружена за {time.perf_counter() - start:.1f} с")
+        return self.models[kind]
+    
+    def preload(self, kinds):
+        """Загружает модели заранее, до обработки первого файла"""
+        for kind in kinds:
+            self.get(kind)
+
+
 class TrOCRProcessor:
     """Обработчик на базе TrOCR"""
     
-    def __init__(self, use_gpu=True):
+    def __init__(self, use_gpu=True, batch_size=16, model_cache=None, decoding='greedy-fast',
+                 preprocess='auto'):
         self.use_gpu = use_gpu and torch.cuda.is_available()
         self.device = "cuda" if self.use_gpu else "cpu"
+        self.batch_size = max(1, batch_size)
+        self.decoding = DECODING_PROFILES[decoding]
+        self.preprocess = preprocess
+        
+        # Статистика декодирования текущей страницы
+        self.tokens_decoded = 0
+        self.lines_skipped = 0
         
         print(f"🔧 Устройство: {self.device.upper()}")
         
-        # Модели
-        self.printed_processor = None
-        self.printed_model = None
-        self.handwritten_processor = None
-        self.handwritten_model = None
+        # Модели загружаются лениво и остаются в памяти
+        self.models = TrOCRModelManager(self.device, cache_dir=model_cache)
         
         self.text_detector = TextTypeDetector()
         self.table_detector = TableDetector()
     
     def initialize_printed_model(self):
-        """Инициализация модели для печатного текста"""
-        if self.printed_processor is None:
-            print("📥 Загрузка модели для печатного текста...")
-            # Используем базовую модель TrOCR для печатного текста
-            self.printed_processor = HFTrOCRProcessor.from_pretrained('microsoft/trocr-base-printed')
-            self.printed_model = VisionEncoderDecoderModel.from_pretrained('microsoft/trocr-base-printed')
-            self.printed_model.to(self.device)
-            self.printed_model.eval()
-            print("✅ Модель для печатного текста загружена")
-        return self.printed_processor, self.printed_model
+        """Модель для печатного текста"""
+        return self.models.get('printed')
     
     def initialize_handwritten_model(self):
-        """Инициализация модели для рукописного текста"""
-        if self.handwritten_processor is None:
-            print("📥 Загрузка модели для рукописного текста...")
-            # Используем модель для рукописного текста
-            self.handwritten_processor = HFTrOCRProcessor.from_pretrained('microsoft/trocr-base-handwritten')
-            self.handwritten_model = VisionEncoderDecoderModel.from_pretrained('microsoft/trocr-base-handwritten')
-            self.handwritten_model.to(self.device)
-            self.handwritten_model.eval()
-            print("✅ Модель для рукописного текста загружена")
-        return self.handwritten_processor, self.handwritten_model
+        """Модель для рукописного текста"""
+        return self.models.get('handwritten')
     
     def preprocess_image(self, image, enhance=True):
         """Предобработка изображения"""
@@ -197,15 +403,19 @@ class TrOCRProcessor:
             clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
             enhanced = clahe.apply(gray)
             
-            # Убираем шум
-            denoised = cv2.fastNlMeansDenoising(enhanced, None, 10, 7, 21)
+            # Убираем шум (профиль --preprocess)
+            denoised = denoise(enhanced, self.preprocess)
             
             return denoised
         
         return gray
     
-    def segment_text_lines(self, image):
-        """Сегментирует изображение на строки текста"""
+    def segment_text_lines(self, image, columns=False, min_column_gap=None):
+        """Сегментирует изображение на строки текста
+        
+        Возвращает [(y_start, y_end)], а с columns=True - [(y_start, y_end, x_start, x_end)]:
+        каждая строка дополнительно делится на колонки по широким вертикальным просветам.
+        """
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
         
         # Бинаризация
@@ -216,64 +426,131 @@ class TrOCRProcessor:
         
         # Находим границы строк
         threshold = np.max(horizontal_projection) * 0.1
-        in_text = False
-        lines = []
-        start_y = 0
+        lines = find_line_spans(horizontal_projection, threshold, min_height=10)
         
-        for i, value in enumerate(horizontal_projection):
-            if not in_text and value > threshold:
-                in_text = True
-                start_y = i
-            elif in_text and value < threshold:
-                in_text = False
-                if i - start_y > 10:  # Минимальная высота строки
-                    lines.append((start_y, i))
+        if not columns:
+            return lines
         
-        return lines
+        return split_lines_into_columns(binary, lines, min_column_gap)
     
-    def recognize_line(self, image, line_coords, is_handwritten=False):
-        """Распознает одну строку текста"""
+    @staticmethod
+    def line_bounds(image, line_coords):
+        """(y_start, y_end, x_start, x_end) для строки во всю ширину или колонки"""
+        if len(line_coords) == 4:
+            return line_coords
         y_start, y_end = line_coords
+        return y_start, y_end, 0, image.shape[1]
+    
+    def crop_line(self, image, line_coords):
+        """Вырезает строку (или её колонку) с отступами и конвертирует в PIL Image"""
+        y_start, y_end, x_start, x_end = self.line_bounds(image, line_coords)
         # Добавляем отступы
         y_start = max(0, y_start - 5)
         y_end = min(image.shape[0], y_end + 5)
+        x_start = max(0, x_start - 5)
+        x_end = min(image.shape[1], x_end + 5)
         
-        line_img = image[y_start:y_end, :]
+        line_img = image[y_start:y_end, x_start:x_end]
         
         # Конвертируем в PIL Image
         if len(line_img.shape) == 2:
-            pil_img = Image.fromarray(line_img).convert('RGB')
-        else:
-            pil_img = Image.fromarray(cv2.cvtColor(line_img, cv2.COLOR_BGR2RGB))
-        
-        # Выбираем модель
-        if is_handwritten:
-            processor, model = self.initialize_handwritten_model()
-        else:
-            processor, model = self.initialize_printed_model()
+            return Image.fromarray(line_img).convert('RGB')
+        return Image.fromarray(cv2.cvtColor(line_img, cv2.COLOR_BGR2RGB))
+    
+    def recognize_line(self, image, line_coords, is_handwritten=False):
+        """Распознает одну строку текста"""
+        return self.recognize_lines(image, [line_coords], [is_handwritten], batch_size=1)[0]
+    
+    def recognize_lines(self, image, lines, handwritten_flags=None, batch_size=None, skip_flags=None):
+        """Распознает строки пакетами
+        
+        Строки группируются по модели (печатная/рукописная), внутри группы сортируются
+        по бюджету токенов (по ширине строки) и проходят через model.generate пакетами
+        по batch_size. Строки из skip_flags (пустые, шум) не декодируются. Результаты
+        возвращаются в исходном порядке строк. Если пакет падает, его строки
+        распознаются по одной.
+        """
+        batch_size = batch_size or self.batch_size
+        if handwritten_flags is None:
+            handwritten_flags = [False] * len(lines)
+        if skip_flags is None:
+            skip_flags = [False] * len(lines)
+        
+        results = [''] * len(lines)
+        self.lines_skipped += sum(1 for flag in skip_flags if flag)
+        
+        # Бюджет токенов каждой строки по её ширине
+        budgets = []
+        for line_coords in lines:
+            y_start, y_end, x_start, x_end = self.line_bounds(image, line_coords)
+            budgets.append(line_token_budget(x_end - x_start, y_end - y_start, self.decoding['max_tokens']))
+        
+        for is_handwritten in (False, True):
+            indices = [i for i, flag in enumerate(handwritten_flags)
+                       if bool(flag) == is_handwritten and not skip_flags[i]]
+            if not indices:
+                continue
+            # Пакеты из строк похожей длины не ждут самую длинную строку страницы
+            indices.sort(key=lambda i: budgets[i])
+            
+            # Выбираем модель
+            if is_handwritten:
+                processor, model = self.initialize_handwritten_model()
+            else:
+                processor, model = self.initialize_printed_model()
+            
+            for start in range(0, len(indices), batch_size):
+                batch_indices = indices[start:start + batch_size]
+                crops = [self.crop_line(image, lines[i]) for i in batch_indices]
+                max_tokens = max(budgets[i] for i in batch_indices)
+                try:
+                    texts = self._generate(processor, model, crops, max_tokens)
+                except Exception as e:
+                    if len(batch_indices) == 1:
+                        print(f"    ⚠️  Ошибка при распознавании строки {batch_indices[0]+1}: {e}")
+                        continue
+                    # Изолируем сбойную строку: распознаем пакет по одной
+                    texts = []
+                    for i, crop in zip(batch_indices, crops):
+                        try:
+                            texts.append(self._generate(processor, model, [crop], budgets[i])[0])
+                        except Exception as line_error:
+                            print(f"    ⚠️  Ошибка при распознавании строки {i+1}: {line_error}")
+                            texts.append('')
+                
+                for i, text in zip(batch_indices, texts):
+                    results[i] = text
         
-        # Обработка
-        pixel_values = processor(images=pil_img, return_tensors="pt").pixel_values
+        return results
+    
+    def _generate(self, processor, model, crops, max_tokens=None):
+        """Один проход encoder-decoder для пакета изображений строк"""
+        # Процессор приводит все строки к одному размеру, пакет собирается в один тензор
+        pixel_values = processor(images=crops, return_tensors="pt").pixel_values
         pixel_values = pixel_values.to(self.device)
         
+        generate_kwargs = {k: v for k, v in self.decoding.items() if k != 'max_tokens'}
+        generate_kwargs['max_new_tokens'] = max_tokens or self.decoding['max_tokens']
+        
         # Генерация текста
         with torch.no_grad():
-            generated_ids = model.generate(pixel_values)
+            generated_ids = model.generate(pixel_values, **generate_kwargs)
         
-        generated_text = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+        # Считаем реально декодированные токены (без стартового и паддинга)
+        pad_token_id = processor.tokenizer.pad_token_id
+        self.tokens_decoded += int((generated_ids[:, 1:] != pad_token_id).sum())
         
-        return generated_text
+        return processor.batch_decode(generated_ids, skip_special_tokens=True)
     
-    def process_image(self, image_path, detect_tables=True, auto_detect_handwritten=True):
-        """Обработка изображения с автоматическим определением типа текста"""
-        print(f"\n📄 Обрабатываем: {image_path}")
-        
-        # Читаем изображение
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Не удалось загрузить изображение: {image_path}")
+    def recognize(self, image, detect_tables=True, auto_detect_handwritten=True, columns=False):
+        """Распознаёт страницу BGR: {'blocks': строки вне таблиц, 'tables': строки таблиц}
         
-        all_text = []
+        TrOCR не возвращает уверенность, поэтому confidence у блоков - None.
+        """
+        blocks = []
+        tables = []
+        self.tokens_decoded = 0
+        self.lines_skipped = 0
         
         # Определяем таблицы
         table_regions = []
@@ -293,32 +570,43 @@ class TrOCRProcessor:
         # Предобработка
         preprocessed = self.preprocess_image(text_image, enhance=True)
         
-        # Сегментация на строки
-        lines = self.segment_text_lines(preprocessed)
+        # Сегментация на строки (и колонки, если нужно)
+        lines = self.segment_text_lines(preprocessed, columns=columns)
         print(f"  📝 Найдено строк текста: {len(lines)}")
         
-        # Обрабатываем каждую строку
-        for idx, line_coords in enumerate(lines):
-            y_start, y_end = line_coords
-            line_region = preprocessed[y_start:y_end, :]
+        # Признаки всех строк страницы за один проход
+        handwritten_flags = [False] * len(lines)
+        skip_flags = [False] * len(lines)
+        if lines:
+            text_info = self.text_detector.analyze_text_regions(preprocessed, lines)
             
-            # Определяем тип текста
-            if auto_detect_handwritten and line_region.shape[0] > 10 and line_region.shape[1] > 10:
-                text_info = self.text_detector.analyze_text_region(line_region)
-                is_handwritten = text_info['is_handwritten']
+            for idx, line_coords in enumerate(lines):
+                y_start, y_end, x_start, x_end = self.line_bounds(preprocessed, line_coords)
+                height, width = y_end - y_start, x_end - x_start
                 
-                if is_handwritten:
-                    print(f"    ✍️  Строка {idx+1}: рукописный текст (уверенность: {text_info['confidence']:.2f})")
-            else:
-                is_handwritten = False
-            
-            # Распознаем строку
-            try:
-                text = self.recognize_line(preprocessed, line_coords, is_handwritten=is_handwritten)
-                if text.strip():
-                    all_text.append(text.strip())
-            except Exception as e:
-                print(f"    ⚠️  Ошибка при распознавании строки {idx+1}: {e}")
+                # Пустые строки и шум (пылинки, остатки линий) не декодируем
+                if (height < MIN_LINE_SIZE or width < MIN_LINE_SIZE or
+                        text_info['black_ratio'][idx] < MIN_INK_RATIO or
+                        text_info['contour_count'][idx] == 0):
+                    skip_flags[idx] = True
+                    continue
+                
+                # Слишком узкие строки не классифицируем
+                if auto_detect_handwritten and height > 10 and width > 10 and text_info['is_handwritten'][idx]:
+                    handwritten_flags[idx] = True
+                    print(f"    ✍️  Строка {idx+1}: рукописный текст (уверенность: {text_info['confidence'][idx]:.2f})")
+        
+        # Распознаем все строки страницы пакетами
+        texts = self.recognize_lines(preprocessed, lines, handwritten_flags, skip_flags=skip_flags)
+        for line_coords, text, is_handwritten in zip(lines, texts, handwritten_flags):
+            if text.strip():
+                y_start, y_end, x_start, x_end = self.line_bounds(preprocessed, line_coords)
+                blocks.append({
+                    'text': text.strip(),
+                    'bbox': (int(x_start), int(y_start), int(x_end), int(y_end)),
+                    'confidence': None,
+                    'handwritten': bool(is_handwritten)
+                })
         
         # Обрабатываем таблицы
         for idx, (x, y, w, h) in enumerate(table_regions):
@@ -331,37 +619,121 @@ class TrOCRProcessor:
             # Сегментируем таблицу на строки
             table_lines = self.segment_text_lines(table_no_lines)
             
-            table_text = ["\n=== ТАБЛИЦА ==="]
-            for line_coords in table_lines:
-                try:
-                    text = self.recognize_line(table_no_lines, line_coords, is_handwritten=False)
-                    if text.strip():
-                        table_text.append(text.strip())
-                except Exception as e:
-                    pass
-            
-            table_text.append("=== КОНЕЦ ТАБЛИЦЫ ===\n")
-            all_text.extend(table_text)
+            # Каждая строка таблицы - одна ячейка: TrOCR не делит строку на столбцы
+            rows = [[text.strip()] for text in self.recognize_lines(table_no_lines, table_lines) if text.strip()]
+            tables.append({'bbox': (x, y, x + w, y + h), 'rows': rows})
+        
+        print(f"  🔢 Декодировано токенов: {self.tokens_decoded}, пропущено строк (пусто/шум): {self.lines_skipped}")
+        
+        return {'blocks': blocks, 'tables': tables}
+    
+    def recognize_page(self, image, **kwargs):
+        """Общий интерфейс движков (ocr_engines.py): страница RGB -> блоки текста и таблицы"""
+        return self.recognize(cv2.cvtColor(image, cv2.COLOR_RGB2BGR), **kwargs)
+    
+    def process_image(self, image_path, detect_tables=True, auto_detect_handwritten=True, columns=False):
+        """Обработка изображения с автоматическим определением типа текста"""
+        # Читаем изображение (или используем уже отрендеренную страницу)
+        if isinstance(image_path, np.ndarray):
+            image = image_path
+        else:
+            print(f"\n📄 Обрабатываем: {image_path}")
+            image = cv2.imread(image_path)
+            if image is None:
+                raise ValueError(f"Не удалось загрузить изображение: {image_path}")
+        
+        page = self.recognize(image, detect_tables, auto_detect_handwritten, columns)
+        
+        all_text = [block['text'] for block in page['blocks']]
+        for table in page['tables']:
+            all_text.append("\n=== ТАБЛИЦА ===")
+            all_text.extend(row[0] for row in table['rows'])
+            all_text.append("=== КОНЕЦ ТАБЛИЦЫ ===\n")
         
         return '\n'.join(all_text)
     
     def convert_pdf_to_images(self, pdf_path, resolution=5.0):
-        """Конвертация PDF в изображения"""
+        """Лениво рендерит страницы PDF в numpy-массивы BGR
+        
+        Возвращает (число страниц, генератор изображений). Изображение - вид на буфер
+        пиксмапа PyMuPDF без кодирования в PNG и обратно; оно действительно до
+        перехода к следующей странице.
+        """
         doc = fitz.open(pdf_path)
-        images = []
+        page_count = len(doc)
         
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            mat = fitz.Matrix(resolution, resolution)
-            pix = page.get_pixmap(matrix=mat)
-            img_data = pix.tobytes("png")
+        def render_pages():
+            try:
+                # Увеличиваем разрешение для лучшего качества OCR
+                mat = fitz.Matrix(resolution, resolution)
+                for page in doc:
+                    # Пиксмап держим в переменной: массив - вид на его буфер и без него недействителен
+                    pix = page.get_pixmap(matrix=mat, alpha=False)
+                    yield pixmap_to_bgr(pix)
+            finally:
+                doc.close()
+        
+        return page_count, render_pages()
+
+
+# Поддерживаемые форматы
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'}
+PDF_EXTENSIONS = {'.pdf'}
+
+
+def process_file(processor, file_path, output_dir, args):
+    """Распознаёт один файл (изображение или PDF) и сохраняет текст; True при успехе"""
+    file_ext = file_path.suffix.lower()
+    
+    if file_ext in IMAGE_EXTENSIONS:
+        try:
+            text = processor.process_image(
+                str(file_path),
+                detect_tables=not args.no_tables,
+                auto_detect_handwritten=not args.no_handwritten,
+                columns=args.columns
+            )
             
-            nparr = np.frombuffer(img_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            images.append(img)
-        
-        doc.close()
-        return images
+            output_file = output_dir / f"{file_path.stem}.txt"
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(text)
+            
+            print(f"✅ Результат сохранен: {output_file}")
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка при обработке {file_path}: {e}")
+        
+    elif file_ext in PDF_EXTENSIONS:
+        try:
+            print(f"\n📑 Конвертируем PDF: {file_path}")
+            page_count, images = processor.convert_pdf_to_images(str(file_path), resolution=args.resolution)
+            
+            all_text = []
+            for i, image in enumerate(images):
+                print(f"\n📄 Страница {i+1}/{page_count}")
+                
+                # Обрабатываем страницу прямо из памяти, без временного PNG
+                text = processor.process_image(
+                    image,
+                    detect_tables=not args.no_tables,
+                    auto_detect_handwritten=not args.no_handwritten,
+                    columns=args.columns
+                )
+                
+                if text.strip():
+                    all_text.append(f"--- Страница {i+1} ---\n{text}\n")
+            
+            # Сохраняем результат
+            output_file = output_dir / f"{file_path.stem}.txt"
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(all_text))
+            
+            print(f"\n✅ Результат сохранен: {output_file}")
+            return True
+        except Exception as e:
+            print(f"\n❌ Ошибка при обработке {file_path}: {e}")
+    
+    return False
 
 
 def main():
@@ -380,6 +752,22 @@ def main():
                        help='Отключить автоматическое определение рукописного текста')
     parser.add_argument('--resolution', type=float, default=5.0,
                        help='Разрешение для PDF (по умолчанию: 5.0)')
+    parser.add_argument('--columns', action='store_true',
+                       help='Делить строки на колонки (не растягивать строку на всю ширину страницы)')
+    parser.add_argument('--batch-size', type=int, default=16,
+                       help='Сколько строк распознавать за один проход модели (по умолчанию: 16)')
+    parser.add_argument('--decoding', choices=list(DECODING_PROFILES), default='greedy-fast',
+                       help='Профиль декодирования: greedy-fast (быстро) или beam-accurate (лучевой поиск)')
+    parser.add_argument('--preprocess', choices=PREPROCESS_PROFILES, default='auto',
+                       help='Шумоподавление: auto (только на зашумлённых страницах), nlmeans, '
+                            'median, bilateral, morph, none (по умолчанию: auto)')
+    parser.add_argument('--preload', nargs='+', choices=list(MODEL_NAMES), default=[],
+                       help='Загрузить модели при старте, до первого файла')
+    parser.add_argument('--model-cache',
+                       help='Каталог для локальной копии моделей в safetensors (mmap, общая для процессов)')
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                       help='Режим демона: следить за входным каталогом и обрабатывать новые файлы '
+                            '(интервал опроса в секундах); модели остаются в памяти')
     
     args = parser.parse_args()
     
@@ -393,71 +781,34 @@ def main():
         sys.exit(1)
     
     # Инициализируем процессор
-    processor = TrOCRProcessor(use_gpu=not args.no_gpu)
-    
-    # Поддерживаемые форматы
-    image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'}
-    pdf_extensions = {'.pdf'}
+    processor = TrOCRProcessor(use_gpu=not args.no_gpu, batch_size=args.batch_size,
+                               model_cache=args.model_cache, decoding=args.decoding,
+                               preprocess=args.preprocess)
+    processor.models.preload(args.preload)
     
     # Обрабатываем файлы
     processed_files = 0
+    seen = {}
     
-    for file_path in sorted(input_dir.iterdir()):
-        if file_path.is_file():
-            file_ext = file_path.suffix.lower()
-            
-            if file_ext in image_extensions:
-                try:
-                    text = processor.process_image(
-                        str(file_path),
-                        detect_tables=not args.no_tables,
-                        auto_detect_handwritten=not args.no_handwritten
-                    )
-                    
-                    output_file = output_dir / f"{file_path.stem}.txt"
-                    with open(output_file, 'w', encoding='utf-8') as f:
-                        f.write(text)
-                    
-                    print(f"✅ Результат сохранен: {output_file}")
-                    processed_files += 1
-                except Exception as e:
-                    print(f"❌ Ошибка при обработке {file_path}: {e}")
+    try:
+        while True:
+            for file_path in sorted(input_dir.iterdir()):
+                if not file_path.is_file():
+                    continue
+                # Файл обрабатывается заново, только если он изменился
+                mtime = file_path.stat().st_mtime
+                if seen.get(file_path) == mtime:
+                    continue
+                seen[file_path] = mtime
                 
-            elif file_ext in pdf_extensions:
-                try:
-                    print(f"\n📑 Конвертируем PDF: {file_path}")
-                    images = processor.convert_pdf_to_images(str(file_path), resolution=args.resolution)
-                    
-                    all_text = []
-                    for i, image in enumerate(images):
-                        print(f"\n📄 Страница {i+1}/{len(images)}")
-                        
-                        # Сохраняем во временный файл
-                        temp_path = f"/tmp/temp_trocr_page_{i}.png"
-                        cv2.imwrite(temp_path, image)
-                        
-                        # Обрабатываем
-                        text = processor.process_image(
-                            temp_path,
-                            detect_tables=not args.no_tables,
-                            auto_detect_handwritten=not args.no_handwritten
-                        )
-                        
-                        if text.strip():
-                            all_text.append(f"--- Страница {i+1} ---\n{text}\n")
-                        
-                        # Удаляем временный файл
-                        os.remove(temp_path)
-                    
-                    # Сохраняем результат
-                    output_file = output_dir / f"{file_path.stem}.txt"
-                    with open(output_file, 'w', encoding='utf-8') as f:
-                        f.write('\n'.join(all_text))
-                    
-                    print(f"\n✅ Результат сохранен: {output_file}")
+                if process_file(processor, file_path, output_dir, args):
                     processed_files += 1
-                except Exception as e:
-                    print(f"\n❌ Ошибка при обработке {file_path}: {e}")
+            
+            if args.watch is None:
+                break
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        print("\n⏹️  Остановлено пользователем")
     
     print(f"\n{'='*60}")
     print(f"✅ Обработано файлов: {processed_files}")
@@ -6,6 +6,8 @@
 """
 
 import argparse
+import csv
+import io
 import os
 import sys
 from pathlib import Path
@@ -14,6 +16,13 @@ import numpy as np
 from PIL import Image
 import fitz  # PyMuPDF для работы с PDF
 
+from preprocessing import PREPROCESS_PROFILES, denoise, pixmap_to_bgr, resolve_profile
+from table_regions import find_table_regions
+
+# Общий интерфейс OCR-движков (ocr_engines.py) лежит в корне проекта
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ocr_engines import readtext_blocks
+
 try:
     import easyocr
     EASYOCR_AVAILABLE = True
@@ -27,7 +36,7 @@ class TableDetector:
     """Детектор и обработчик таблиц"""
     
     @staticmethod
-    def preprocess_for_table(image):
+    def preprocess_for_table(image, profile='auto'):
         """Предобработка изображения для улучшения распознавания таблиц"""
         # Конвертируем в grayscale
         if len(image.shape) == 3:
@@ -39,46 +48,28 @@ class TableDetector:
         clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
         enhanced = clahe.apply(gray)
         
+        # Уровень шума оцениваем до бинаризации
+        profile = resolve_profile(enhanced, profile)
+        
         # Бинаризация с адаптивным порогом
         binary = cv2.adaptiveThreshold(
             enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
             cv2.THRESH_BINARY, 11, 2
         )
         
-        # Убираем шум
-        denoised = cv2.fastNlMeansDenoising(binary, None, 10, 7, 21)
+        # Убираем шум (профиль --preprocess)
+        denoised = denoise(binary, profile)
         
         return denoised
     
     @staticmethod
-    def detect_table_regions(image):
-        """Определяет области таблиц на изображении"""
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
-        
-        # Бинаризация
-        _, binary = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY_INV)
-        
-        # Обнаружение горизонтальных и вертикальных линий
-        horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (40, 1))
-        vertical_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 40))
-        
-        horizontal_lines = cv2.morphologyEx(binary, cv2.MORPH_OPEN, horizontal_kernel, iterations=2)
-        vertical_lines = cv2.morphologyEx(binary, cv2.MORPH_OPEN, vertical_kernel, iterations=2)
+    def detect_table_regions(image, scale=None):
+        """Определяет области таблиц на изображении
         
-        # Объединяем линии
-        table_mask = cv2.add(horizontal_lines, vertical_lines)
-        
-        # Находим контуры (потенциальные таблицы)
-        contours, _ = cv2.findContours(table_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        table_regions = []
-        for contour in contours:
-            x, y, w, h = cv2.boundingRect(contour)
-            # Фильтруем слишком маленькие области
-            if w > 100 and h > 100:
-                table_regions.append((x, y, w, h))
-        
-        return table_regions
+        Кандидаты ищутся на уменьшенной копии, области - в полном разрешении внутри
+        них (table_regions.py); scale=1 - поиск целиком в полном разрешении.
+        """
+        return find_table_regions(image, min_width=100, min_height=100, scale=scale)
     
     @staticmethod
     def extract_table_cells(image, table_region):
@@ -108,15 +99,50 @@ class TableDetector:
             if w_c > 20 and h_c > 20:  # Минимальный размер ячейки
                 cells.append((x + x_c, y + y_c, w_c, h_c))
         
+        # RETR_TREE возвращает и внешний контур сетки - оставляем только ячейки,
+        # внутри которых нет других ячеек
+        def contains(outer, inner):
+            return (outer != inner and outer[0] <= inner[0] and outer[1] <= inner[1] and
+                    outer[0] + outer[2] >= inner[0] + inner[2] and outer[1] + outer[3] >= inner[1] + inner[3])
+        cells = [cell for cell in set(cells) if not any(contains(cell, other) for other in cells)]
+        
         return sorted(cells, key=lambda c: (c[1], c[0]))  # Сортируем по строкам, затем столбцам
+    
+    @staticmethod
+    def cells_to_grid(cells):
+        """Раскладывает ячейки по сетке: [(строка, столбец)] для каждой ячейки и размер сетки
+        
+        Границы строк и столбцов - кластеры верхних и левых краёв ячеек с допуском
+        в половину самой маленькой ячейки. Объединённая ячейка занимает первую позицию.
+        """
+        def positions(starts, tolerance):
+            clusters = []
+            for value in sorted(starts):
+                if clusters and value - clusters[-1] <= tolerance:
+                    continue
+                clusters.append(value)
+            return clusters
+        
+        def index_of(clusters, value):
+            return min(range(len(clusters)), key=lambda i: abs(clusters[i] - value))
+        
+        rows = positions([c[1] for c in cells], min(c[3] for c in cells) / 2)
+        cols = positions([c[0] for c in cells], min(c[2] for c in cells) / 2)
+        
+        grid = [(index_of(rows, c[1]), index_of(cols, c[0])) for c in cells]
+        return grid, len(rows), len(cols)
 
 
 class OCRProcessor:
     """Класс для обработки изображений с помощью EasyOCR"""
     
-    def __init__(self, use_gpu=False, detect_tables=True):
+    def __init__(self, use_gpu=False, detect_tables=True, preprocess='auto',
+                 table_mode='grid', table_format='markdown'):
         self.use_gpu = use_gpu
         self.detect_tables = detect_tables
+        self.preprocess = preprocess
+        self.table_mode = table_mode
+        self.table_format = table_format
         self.reader = None
         self.table_detector = TableDetector()
         
@@ -127,13 +153,110 @@ class OCRProcessor:
             self.reader = easyocr.Reader(['ru', 'en'], gpu=self.use_gpu)
         return self.reader
     
+    def table_rows(self, image, table_region):
+        """Строки таблицы: (строки, True) по сетке ячеек, а если сетки нет - (строки, False) по всей области"""
+        if self.table_mode == 'grid':
+            cells = self.table_detector.extract_table_cells(image, table_region)
+            if len(cells) >= 2:
+                return self.table_grid_rows(image, table_region, cells), True
+            print("  Сетка ячеек не найдена, распознаём таблицу целиком")
+        return self.table_flow_rows(image, table_region), False
+    
+    def format_table_text(self, rows, is_grid):
+        """Текст таблицы для итогового файла"""
+        if is_grid:
+            body = [self.format_table(rows)]
+        else:
+            body = [" | ".join(row) for row in rows]
+        return "\n".join(["\n=== ТАБЛИЦА ===", *body, "=== КОНЕЦ ТАБЛИЦЫ ===\n"])
+    
     def process_table_region(self, image, table_region):
-        """Обработка области таблицы с улучшенной предобработкой"""
+        """Обработка области таблицы: по сетке ячеек, а если сетки нет - всей областью"""
+        return self.format_table_text(*self.table_rows(image, table_region))
+    
+    def recognize_cells(self, table_img, cells):
+        """Распознаёт ячейки (координаты относительно table_img), возвращает тексты
+        
+        Однострочные ячейки распознаются одним вызовом reader.recognize без детекции
+        текста (на GPU - пакетами), высокие многострочные - readtext по вырезу ячейки.
+        Пустые ячейки (без "чернил") пропускаются. Работа ограничена площадью ячеек.
+        """
+        reader = self.initialize_easyocr()
+        texts = [''] * len(cells)
+        
+        _, ink = cv2.threshold(table_img, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        line_height = float(np.median([c[3] for c in cells]))
+        
+        boxes = {}
+        for idx, (x, y, w, h) in enumerate(cells):
+            # Отступаем от линий сетки
+            x_min, y_min = x + 2, y + 2
+            x_max, y_max = x + w - 2, y + h - 2
+            if x_max <= x_min or y_max <= y_min or cv2.countNonZero(ink[y_min:y_max, x_min:x_max]) < 10:
+                continue
+            
+            if h > line_height * 1.8:
+                # Многострочная ячейка: детекция строк внутри неё
+                results = reader.readtext(table_img[y_min:y_max, x_min:x_max], paragraph=False)
+                results.sort(key=lambda r: (r[0][0][1], r[0][0][0]))
+                texts[idx] = ' '.join(text for _, text, confidence in results if confidence > 0.3)
+            else:
+                boxes[(x_min, y_min, x_max, y_max)] = idx
+        
+        if boxes:
+            results = reader.recognize(
+                table_img,
+                horizontal_list=[[x_min, x_max, y_min, y_max] for x_min, y_min, x_max, y_max in boxes],
+                free_list=[],
+                paragraph=False
+            )
+            # Порядок результатов может не совпадать с порядком рамок - сопоставляем по координатам
+            for bbox, text, confidence in results:
+                key = (int(bbox[0][0]), int(bbox[0][1]), int(bbox[2][0]), int(bbox[2][1]))
+                if key in boxes and confidence > 0.3:
+                    texts[boxes[key]] = text
+        
+        return texts
+    
+    def format_table(self, matrix):
+        """Матрица строк таблицы в Markdown или CSV"""
+        if self.table_format == 'csv':
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator='\n').writerows(matrix)
+            return buffer.getvalue().rstrip('\n')
+        
+        def row_text(row):
+            return '| ' + ' | '.join(cell.replace('|', '\\|') for cell in row) + ' |'
+        
+        lines = [row_text(matrix[0]), '|' + '---|' * len(matrix[0])]
+        lines.extend(row_text(row) for row in matrix[1:])
+        return '\n'.join(lines)
+    
+    def table_grid_rows(self, image, table_region, cells):
+        """Обработка таблицы по ячейкам: матрица строк x столбцов"""
+        x, y, w, h = table_region
+        table_img = self.table_detector.preprocess_for_table(image[y:y+h, x:x+w], self.preprocess)
+        
+        # Координаты ячеек относительно таблицы
+        local_cells = [(cx - x, cy - y, cw, ch) for cx, cy, cw, ch in cells]
+        grid, n_rows, n_cols = self.table_detector.cells_to_grid(local_cells)
+        print(f"  Сетка таблицы: {n_rows} x {n_cols}, ячеек: {len(cells)}")
+        
+        texts = self.recognize_cells(table_img, local_cells)
+        
+        matrix = [[''] * n_cols for _ in range(n_rows)]
+        for (row, col), text in zip(grid, texts):
+            matrix[row][col] = text
+        
+        return matrix
+    
+    def table_flow_rows(self, image, table_region):
+        """Обработка области таблицы целиком с группировкой слов в строки по Y"""
         x, y, w, h = table_region
         table_img = image[y:y+h, x:x+w]
         
         # Предобработка для таблиц
-        preprocessed = self.table_detector.preprocess_for_table(table_img)
+        preprocessed = self.table_detector.preprocess_for_table(table_img, self.preprocess)
         
         # OCR на предобработанном изображении
         reader = self.initialize_easyocr()
@@ -142,8 +265,8 @@ class OCRProcessor:
         # Сортируем результаты по позиции (сверху вниз, слева направо)
         results_sorted = sorted(results, key=lambda r: (r[0][0][1], r[0][0][0]))
         
-        # Форматируем как таблицу
-        table_text = ["\n=== ТАБЛИЦА ==="]
+        # Группируем слова в строки таблицы
+        rows = []
         current_row = []
         prev_y = None
         
@@ -154,96 +277,94 @@ class OCRProcessor:
                 # Новая строка таблицы
                 if prev_y is not None and abs(y_pos - prev_y) > 20:
                     if current_row:
-                        table_text.append(" | ".join(current_row))
+                        rows.append(current_row)
                         current_row = []
                 
                 current_row.append(text)
                 prev_y = y_pos
         
         if current_row:
-            table_text.append(" | ".join(current_row))
-        
-        table_text.append("=== КОНЕЦ ТАБЛИЦЫ ===\n")
+            rows.append(current_row)
         
-        return "\n".join(table_text)
+        return rows
     
-    def process_with_easyocr(self, image_path):
-        """Обработка изображения с автоматическим определением таблиц"""
+    def recognize(self, image):
+        """Распознаёт страницу BGR: {'blocks': текст вне таблиц, 'tables': таблицы со строками}"""
         reader = self.initialize_easyocr()
         
-        # Читаем изображение
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Не удалось загрузить изображение: {image_path}")
+        # Определяем области таблиц
+        table_regions = self.table_detector.detect_table_regions(image) if self.detect_tables else []
+        if not table_regions:
+            # Если таблиц не найдено, обычный OCR
+            return {'blocks': readtext_blocks(reader, image), 'tables': []}
         
-        all_text = []
+        print(f"  Найдено таблиц: {len(table_regions)}")
         
-        if self.detect_tables:
-            # Определяем области таблиц
-            table_regions = self.table_detector.detect_table_regions(image)
-            
-            if table_regions:
-                print(f"  Найдено таблиц: {len(table_regions)}")
-                
-                # Создаем маску для нетабличных областей
-                mask = np.ones(image.shape[:2], dtype=np.uint8) * 255
-                for x, y, w, h in table_regions:
-                    mask[y:y+h, x:x+w] = 0
-                
-                # OCR для обычного текста (вне таблиц)
-                masked_image = cv2.bitwise_and(image, image, mask=mask)
-                results = reader.readtext(masked_image)
-                
-                text_results = []
-                for (bbox, text, confidence) in results:
-                    if confidence > 0.5:
-                        text_results.append((bbox[0][1], text))  # Сохраняем Y-координату
-                
-                # OCR для таблиц
-                table_results = []
-                for idx, region in enumerate(table_regions):
-                    table_text = self.process_table_region(image, region)
-                    table_results.append((region[1], table_text))  # Y-координата таблицы
-                
-                # Объединяем результаты в правильном порядке
-                all_results = text_results + table_results
-                all_results.sort(key=lambda r: r[0])
-                
-                all_text = [text for _, text in all_results]
-            else:
-                # Если таблиц не найдено, обычный OCR
-                results = reader.readtext(image)
-                for (bbox, text, confidence) in results:
-                    if confidence > 0.5:
-                        all_text.append(text)
+        # Создаем маску для нетабличных областей
+        mask = np.ones(image.shape[:2], dtype=np.uint8) * 255
+        for x, y, w, h in table_regions:
+            mask[y:y+h, x:x+w] = 0
+        
+        # OCR для обычного текста (вне таблиц)
+        masked_image = cv2.bitwise_and(image, image, mask=mask)
+        blocks = readtext_blocks(reader, masked_image)
+        
+        # OCR для таблиц
+        tables = []
+        for x, y, w, h in table_regions:
+            rows, is_grid = self.table_rows(image, (x, y, w, h))
+            tables.append({'bbox': (x, y, x + w, y + h), 'rows': rows, 'grid': is_grid})
+        
+        return {'blocks': blocks, 'tables': tables}
+    
+    def recognize_page(self, image):
+        """Общий интерфейс движков (ocr_engines.py): страница RGB -> блоки текста и таблицы"""
+        return self.recognize(cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+    
+    def process_with_easyocr(self, image_path):
+        """Обработка изображения с автоматическим определением таблиц"""
+        # Читаем изображение (или используем уже отрендеренную страницу)
+        if isinstance(image_path, np.ndarray):
+            image = image_path
         else:
-            # Обычный OCR без обработки таблиц
-            results = reader.readtext(image)
-            for (bbox, text, confidence) in results:
-                if confidence > 0.5:
-                    all_text.append(text)
+            image = cv2.imread(image_path)
+            if image is None:
+                raise ValueError(f"Не удалось загрузить изображение: {image_path}")
         
-        return '\n'.join(all_text)
+        page = self.recognize(image)
+        if not page['tables']:
+            return '\n'.join(block['text'] for block in page['blocks'])
+        
+        # Объединяем текст и таблицы в порядке сверху вниз (по Y-координате)
+        all_results = [(block['bbox'][1], block['text']) for block in page['blocks']]
+        all_results += [(table['bbox'][1], self.format_table_text(table['rows'], table['grid']))
+                        for table in page['tables']]
+        all_results.sort(key=lambda r: r[0])
+        
+        return '\n'.join(text for _, text in all_results)
     
     def convert_pdf_to_images(self, pdf_path):
-        """Конвертация PDF в изображения"""
-        doc = fitz.open(pdf_path)
-        images = []
-        
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            # Увеличиваем разрешение для лучшего качества OCR
-            mat = fitz.Matrix(3.0, 3.0)  # 3x увеличение для таблиц
-            pix = page.get_pixmap(matrix=mat)
-            img_data = pix.tobytes("png")
-            
-            # Конвертируем в numpy array для OpenCV
-            nparr = np.frombuffer(img_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            images.append(img)
+        """Лениво рендерит страницы PDF в numpy-массивы BGR
         
-        doc.close()
-        return images
+        Возвращает (число страниц, генератор изображений). Изображение - вид на буфер
+        пиксмапа PyMuPDF без кодирования в PNG и обратно; оно действительно до
+        перехода к следующей странице.
+        """
+        doc = fitz.open(pdf_path)
+        page_count = len(doc)
+        
+        def render_pages():
+            try:
+                # Увеличиваем разрешение для лучшего качества OCR
+                mat = fitz.Matrix(3.0, 3.0)  # 3x увеличение для таблиц
+                for page in doc:
+                    # Пиксмап держим в переменной: массив - вид на его буфер и без него недействителен
+                    pix = page.get_pixmap(matrix=mat, alpha=False)
+                    yield pixmap_to_bgr(pix)
+            finally:
+                doc.close()
+        
+        return page_count, render_pages()
     
     def save_image_temp(self, image, temp_path):
         """Сохранение изображения во временный файл"""
@@ -263,6 +384,13 @@ def main():
     parser.add_argument('--output', '-o',
                        default='output_tables', 
                        help='Каталог для выходных файлов (по умолчанию: output_tables)')
+    parser.add_argument('--preprocess', choices=PREPROCESS_PROFILES, default='auto',
+                       help='Шумоподавление таблиц: auto (только на зашумлённых), nlmeans, '
+                            'median, bilateral, morph, none (по умолчанию: auto)')
+    parser.add_argument('--table-mode', choices=['grid', 'flow'], default='grid',
+                       help='grid - распознавать по ячейкам сетки, flow - всю таблицу целиком (по умолчанию: grid)')
+    parser.add_argument('--table-format', choices=['markdown', 'csv'], default='markdown',
+                       help='Формат таблиц в режиме grid (по умолчанию: markdown)')
     
     args = parser.parse_args()
     
@@ -276,7 +404,9 @@ def main():
         sys.exit(1)
     
     # Инициализируем процессор
-    processor = OCRProcessor(use_gpu=args.gpu, detect_tables=not args.no_tables)
+    processor = OCRProcessor(use_gpu=args.gpu, detect_tables=not args.no_tables,
+                             preprocess=args.preprocess, table_mode=args.table_mode,
+                             table_format=args.table_format)
     
     # Поддерживаемые форматы
     image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'}
@@ -303,23 +433,16 @@ def main():
                 
             elif file_ext in pdf_extensions:
                 print(f"\nКонвертируем PDF: {file_path}")
-                images = processor.convert_pdf_to_images(str(file_path))
+                page_count, images = processor.convert_pdf_to_images(str(file_path))
                 
                 all_text = []
                 for i, image in enumerate(images):
-                    print(f"  Обрабатываем страницу {i+1}/{len(images)}")
-                    
-                    # Сохраняем изображение во временный файл
-                    temp_path = f"/tmp/temp_page_{i}.png"
-                    processor.save_image_temp(image, temp_path)
+                    print(f"  Обрабатываем страницу {i+1}/{page_count}")
                     
-                    # Обрабатываем изображение
-                    text = processor.process_with_easyocr(temp_path)
+                    # Обрабатываем страницу прямо из памяти, без временного PNG
+                    text = processor.process_with_easyocr(image)
                     if text.strip():
                         all_text.append(f"--- Страница {i+1} ---\n{text}\n")
-                    
-                    # Удаляем временный файл
-                    os.remove(temp_path)
                 
                 # Сохраняем результат
                 output_file = output_dir / f"{file_path.stem}.txt"
@@ -12,65 +12,27 @@ Regex-парсер с LLM-генерацией паттернов
 import argparse
 import json
 import re
-import requests
+import sys
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Общие модули LLM (llm_cache, ollama_client) лежат в корне проекта
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from llm_cache import LLMCache, add_cache_arguments, cache_from_args
+from llm_prompt import ContextPlanner, add_context_arguments, build_prompt, part_task
+from llm_schema import (DEFAULT_JSON_FORMAT, REGEX_SET_SCHEMA, JSONParseStats, add_format_arguments,
+                        response_format)
+from ollama_client import DEFAULT_KEEP_ALIVE, DEFAULT_RETRIES, OllamaMetrics, OllamaPool, add_http_arguments
 
-class RegexGenerator:
-    """Генератор regex паттернов с помощью LLM"""
-    
-    def __init__(self, ollama_url: str, model: str, token: Optional[str] = None, verify_ssl: bool = True):
-        self.ollama_url = ollama_url.rstrip('/')
-        self.model = model
-        self.token = token
-        self.session = requests.Session()
-        self.session.verify = verify_ssl
-        if token:
-            self.session.headers.update({'X-Access-Token': token})
-    
-    def call_ollama(self, prompt: str) -> Optional[str]:
-        """Вызывает Ollama API"""
-        try:
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,
-                    "top_p": 0.9
-                }
-            }
-            
-            response = self.session.post(f"{self.ollama_url}/api/generate", 
-                                       json=payload, 
-                                       timeout=120)
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('response', '').strip()
-            else:
-                print(f"❌ Ошибка API: {response.status_code}")
-                return None
-                
-        except Exception as e:
-            print(f"❌ Ошибка вызова Ollama: {e}")
-            return None
-    
-    def generate_regex_patterns(self, text: str) -> Dict[str, Any]:
-        """Генерирует regex паттерны для текста"""
-        
-        # Анализируем весь текст для понимания структуры
-        full_text = text if len(text) < 15000 else text[:15000]
-        
-        prompt = f"""Ты эксперт по регулярным выражениям и парсингу технических документов.
+# Ответ с паттернами - до стольких токенов (резерв в окне контекста)
+OUTPUT_TOKENS = 4096
 
-Проанализируй ВЕСЬ текст технического документа и создай ПОЛНЫЙ набор регулярных выражений для извлечения ВСЕХ данных.
+# Статическая часть промпта генерации паттернов (документ добавляется после неё)
+REGEX_INSTRUCTIONS = """Ты эксперт по регулярным выражениям и парсингу технических документов.
 
-ТЕКСТ ДОКУМЕНТА:
-{full_text}
+Проанализируй ВЕСЬ текст технического документа и создай ПОЛНЫЙ набор регулярных выражений для извлечения ВСЕХ данных.
 
 ЗАДАЧА:
 Создай ПОЛНЫЙ JSON с регулярными выражениями для извлечения ВСЕХ элементов документа:
@@ -82,131 +44,131 @@ class RegexGenerator:
 
 ФОРМАТ JSON:
 
-{{
-  "metadata": {{
-    "document_number": {{
+{
+  "metadata": {
+    "document_number": {
       "pattern": "regex для извлечения номера документа (учитывай '--- Страница 1 ---')",
       "description": "краткое описание",
       "flags": ["MULTILINE"]
-    }},
-    "date": {{
+    },
+    "date": {
       "pattern": "regex для даты в формате ММ.ГГГГ",
       "flags": ["MULTILINE"]
-    }},
-    "addressees": {{
+    },
+    "addressees": {
       "pattern": "regex для всех адресатов (строки 'Начальнику ...')",
       "flags": ["MULTILINE"]
-    }}
-  }},
+    }
+  },
   
-  "technical_params": {{
-    "steel_grade": {{"pattern": "стали марки (\\\\d+)", "description": "..."}},
-    "code_oemk": {{"pattern": "код ОЭМК\\\\s*([^\\\\n]+)", "flags": ["IGNORECASE"]}},
-    "export_name": {{"pattern": "экспортное наименование\\\\s+([^\\\\n]+)", "flags": ["MULTILINE"]}},
-    "analog": {{"pattern": "условный аналог\\\\s+([^\\\\n]+)", "flags": ["MULTILINE"]}},
-    "production_code": {{"pattern": "код вида продукции\\\\s+(\\\\d+)", "flags": ["MULTILINE"]}},
-    "standard": {{"pattern": "стандарт выплавки\\\\s+([^\\\\n]+)", "flags": ["MULTILINE"]}}
-  }},
+  "technical_params": {
+    "steel_grade": {"pattern": "стали марки (\\\\d+)", "description": "..."},
+    "code_oemk": {"pattern": "код ОЭМК\\\\s*([^\\\\n]+)", "flags": ["IGNORECASE"]},
+    "export_name": {"pattern": "экспортное наименование\\\\s+([^\\\\n]+)", "flags": ["MULTILINE"]},
+    "analog": {"pattern": "условный аналог\\\\s+([^\\\\n]+)", "flags": ["MULTILINE"]},
+    "production_code": {"pattern": "код вида продукции\\\\s+(\\\\d+)", "flags": ["MULTILINE"]},
+    "standard": {"pattern": "стандарт выплавки\\\\s+([^\\\\n]+)", "flags": ["MULTILINE"]}
+  },
   
-  "sections": {{
-    "section_1_nlz": {{
+  "sections": {
+    "section_1_nlz": {
       "pattern": "ПРОИЗВОДСТВО НЛЗ:([\\\\s\\\\S]+?)(?=2\\\\. ПРОИЗВОДСТВО ПРОКАТА|Таблица 3)",
       "description": "Раздел 1: Производство НЛЗ",
       "extraction_method": "structured_subsections",
       "subsection_pattern": "^(1\\\\.\\\\d+\\\\.?)\\\\s+([\\\\s\\\\S]+?)(?=^1\\\\.\\\\d+\\\\.|^2\\\\.|$)",
       "flags": ["DOTALL", "MULTILINE"]
-    }},
-    "section_2_rolling": {{
+    },
+    "section_2_rolling": {
       "pattern": "2\\\\. ПРОИЗВОДСТВО ПРОКАТА([\\\\s\\\\S]+?)(?=3\\\\. КОНТРОЛЬ И АТТЕСТАЦИЯ)",
       "description": "Раздел 2: Производство проката",
       "extraction_method": "structured_subsections",
       "subsection_pattern": "^(2\\\\.\\\\d+\\\\.?)\\\\s+([\\\\s\\\\S]+?)(?=^2\\\\.\\\\d+\\\\.|^3\\\\.|$)",
       "flags": ["DOTALL", "MULTILINE"]
-    }},
-    "section_3_control": {{
+    },
+    "section_3_control": {
       "pattern": "3\\\\. КОНТРОЛЬ И АТТЕСТАЦИЯ ПРОКАТА([\\\\s\\\\S]+?)(?=Таблица 6|Технический директор)",
       "description": "Раздел 3: Контроль и аттестация",
       "extraction_method": "structured_subsections",
       "subsection_pattern": "^(3\\\\.\\\\d+\\\\.?)\\\\s+([\\\\s\\\\S]+?)(?=^3\\\\.\\\\d+\\\\.|Технический директор|$)",
       "flags": ["DOTALL", "MULTILINE"]
-    }},
-    "signatures": {{
+    },
+    "signatures": {
       "pattern": "Технический директор\\\\s*\\\\n([^\\\\n]+)",
       "flags": ["MULTILINE"]
-    }},
-    "distribution_plan": {{
+    },
+    "distribution_plan": {
       "pattern": "План рассылки:\\\\s*([^\\\\n]+)",
       "flags": ["MULTILINE"]
-    }}
-  }},
+    }
+  },
   
   "tables": [
-    {{
+    {
       "table_name": "chemical_composition",
       "table_number": "1",
       "description": "Химический состав",
       "extraction_method": "structured",
-      "structure": {{
-        "elements": {{
+      "structure": {
+        "elements": {
           "pattern": "Таблица\\\\s*1\\\\s*\\\\n(С\\\\s*\\\\n\\\\s*Si\\\\s*\\\\nMn\\\\s*\\\\nS\\\\s*\\\\nCr\\\\s*\\\\nNi\\\\s*\\\\nCu\\\\s*\\\\nAl)",
           "flags": ["MULTILINE"]
-        }},
-        "recommended": {{
+        },
+        "recommended": {
           "pattern": "Рекоменд:\\\\s*\\\\n([0-9,\\\\n]+?)\\\\nАттестат",
           "flags": ["MULTILINE"]
-        }},
-        "certificate": {{
+        },
+        "certificate": {
           "pattern": "Аттестат\\\\.\\\\s*\\\\n([0-9,н\\\\.б\\\\s\\\\n]+?)\\\\nЭСПЦ",
           "flags": ["MULTILINE"]
-        }},
-        "espz": {{
+        },
+        "espz": {
           "pattern": "ЭСПЦ\\\\s*\\\\n([0-9,\\\\n]+?)\\\\nПримечания",
           "flags": ["MULTILINE"]
-        }}
-      }}
-    }},
-    {{
+        }
+      }
+    },
+    {
       "table_name": "temperature_regime",
       "table_number": "2",
       "description": "Температурный режим плавок",
       "extraction_method": "structured_table_2",
       "pattern": "Таблица 2\\\\s*\\\\n([\\\\s\\\\S]+?)\\\\n1\\\\.11\\\\.",
       "flags": ["DOTALL"]
-    }},
-    {{
+    },
+    {
       "table_name": "material_info",
       "table_number": "3",
       "description": "Информация о материале",
       "extraction_method": "key_value_table",
       "pattern": "Таблица 3\\\\s*\\\\n([\\\\s\\\\S]+?)\\\\n2\\\\.1\\\\.",
       "flags": ["DOTALL"]
-    }},
-    {{
+    },
+    {
       "table_name": "diameter_tolerances",
       "table_number": "4",
       "description": "Диаметр и допуски",
       "extraction_method": "structured_table_4",
       "pattern": "Таблица 4\\\\s*\\\\n([\\\\s\\\\S]+?)\\\\nРекомендуется прокатку",
       "flags": ["DOTALL"]
-    }},
-    {{
+    },
+    {
       "table_name": "hardenability_band",
       "table_number": "5",
       "description": "Полоса прокаливаемости",
       "extraction_method": "structured_table_5",
       "pattern": "Таблица 5\\\\s*\\\\n([\\\\s\\\\S]+?)\\\\n3\\\\.2\\\\.",
       "flags": ["DOTALL"]
-    }},
-    {{
+    },
+    {
       "table_name": "compression_degree",
       "table_number": "6",
       "description": "Степень обжатия",
       "extraction_method": "structured_table_6",
       "pattern": "Таблица 6\\\\.\\\\s*\\\\n([\\\\s\\\\S]+?)\\\\nТехнический директор",
       "flags": ["DOTALL"]
-    }}
+    }
   ]
-}}
+}
 
 КРИТИЧЕСКИ ВАЖНО:
 1. Найди ВСЕ разделы документа (1., 2., 3., и т.д.)
@@ -219,9 +181,96 @@ class RegexGenerator:
 5. Используй флаги MULTILINE и DOTALL где нужно
 6. Все паттерны должны быть КОНТЕКСТНЫМИ (учитывай что идёт ДО и ПОСЛЕ)
 7. В JSON используй двойные слеши: \\\\d, \\\\s, \\\\n, и т.д.
-
-Верни ТОЛЬКО валидный JSON, без markdown блоков и дополнительного текста!
 """
+
+
+class RegexGenerator:
+    """Генератор regex паттернов с помощью LLM"""
+    
+    def __init__(self, ollama_url: str, model: str, token: Optional[str] = None, verify_ssl: bool = True,
+                 cache: Optional[LLMCache] = None, retries: int = DEFAULT_RETRIES,
+                 deadline: Optional[float] = None, keep_alive: Union[str, int] = DEFAULT_KEEP_ALIVE,
+                 json_format: str = DEFAULT_JSON_FORMAT, num_ctx: Optional[int] = None):
+        self.ollama_url = ollama_url.rstrip('/')
+        self.model = model
+        self.token = token
+        self.pool = OllamaPool(self.ollama_url, token, verify_ssl, retries=retries, deadline=deadline)
+        self.cache = cache
+        self.keep_alive = keep_alive
+        self.metrics = OllamaMetrics()
+        self.response_format = response_format(json_format, REGEX_SET_SCHEMA)
+        self.parse_stats = JSONParseStats()
+        self.num_ctx = num_ctx
+        self.planner = None
+    
+    def context_planner(self) -> ContextPlanner:
+        """Планировщик окна контекста (окно узнаётся у модели при первом запросе)"""
+        if self.planner is None:
+            self.planner = ContextPlanner.for_model(self.pool, self.model, self.num_ctx, OUTPUT_TOKENS)
+        return self.planner
+    
+    def call_ollama(self, prompt: str) -> Optional[str]:
+        """Вызывает Ollama API"""
+        try:
+            payload = {
+                "model": self.model,
+                "prompt": prompt,
+                "stream": False,
+                "keep_alive": self.keep_alive,
+                "options": {
+                    "temperature": 0.1,
+                    "top_p": 0.9,
+                    **self.context_planner().options()
+                }
+            }
+            if self.response_format:
+                payload["format"] = self.response_format
+            
+            cached = self.cache.lookup(payload) if self.cache else None
+            if cached is not None:
+                print("🗄️  Ответ LLM взят из кэша")
+                return cached
+            
+            with self.pool.post("/api/generate", json=payload, timeout=120) as response:
+                if response.status_code == 200:
+                    result = response.json()
+                    self.metrics.record(result)
+                    self.context_planner().calibrate(prompt, result.get('prompt_eval_count'))
+                    text = result.get('response', '').strip()
+                    if self.cache and text:
+                        self.cache.store(payload, text)
+                    return text
+                else:
+                    print(f"❌ Ошибка API: {response.status_code}")
+                    return None
+                
+        except Exception as e:
+            print(f"❌ Ошибка вызова Ollama: {e}")
+            return None
+    
+    def generate_regex_patterns(self, text: str) -> Dict[str, Any]:
+        """Генерирует regex паттерны для текста
+        
+        Анализируем весь текст для понимания структуры: документ, не помещающийся
+        в окно контекста модели, идёт по частям, паттерны частей объединяются.
+        """
+        task = "Верни ТОЛЬКО валидный JSON, без markdown блоков и дополнительного текста!"
+        parts = self.context_planner().plan(REGEX_INSTRUCTIONS, text, task)
+        if len(parts) == 1:
+            return self.generate_for_text(text, task)
+        
+        pattern_sets = []
+        for index, part in enumerate(parts, 1):
+            print(f"📄 Часть {index}/{len(parts)} ({len(part)} символов)")
+            pattern_sets.append(self.generate_for_text(part, part_task(task, index, len(parts))))
+        return merge_pattern_sets(pattern_sets)
+    
+    def generate_for_text(self, text: str, task: str) -> Dict[str, Any]:
+        """Один запрос генерации паттернов по тексту (целиком помещающемуся в окно)"""
+        
+        # Инструкции одинаковы для всех документов и идут первыми - Ollama
+        # переиспользует их KV-кэш, заново обрабатывается только документ
+        prompt = build_prompt(REGEX_INSTRUCTIONS, text, task, document_title='ТЕКСТ ДОКУМЕНТА')
         
         print("🤖 Генерируем regex паттерны с помощью LLM...")
         response = self.call_ollama(prompt)
@@ -262,13 +311,42 @@ class RegexGenerator:
             response = re_module.sub(r'"(pattern|subsection_pattern)":\s*"([^"]*)"', normalize_pattern, response)
             
             patterns = json.loads(response)
+            self.parse_stats.record(True)
             return patterns
         except json.JSONDecodeError as e:
+            self.parse_stats.record(False)
             print(f"❌ Ошибка парсинга JSON: {e}")
             print(f"Ответ LLM:\n{response[:500]}...")
             return {}
 
 
+def merge_pattern_sets(pattern_sets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Объединяет паттерны частей документа
+    
+    Паттерн группы берётся из первой части, где он есть; таблицы - все, без
+    повторов по номеру (или имени).
+    """
+    merged = {}
+    seen_tables = set()
+    for patterns in pattern_sets:
+        for group, value in patterns.items():
+            if isinstance(value, dict):
+                target = merged.setdefault(group, {})
+                for name, pattern_info in value.items():
+                    target.setdefault(name, pattern_info)
+            elif isinstance(value, list):
+                target = merged.setdefault(group, [])
+                for item in value:
+                    key = (item.get('table_number') or item.get('table_name')) if isinstance(item, dict) else None
+                    if key is not None and key in seen_tables:
+                        continue
+                    seen_tables.add(key)
+                    target.append(item)
+            else:
+                merged.setdefault(group, value)
+    return merged
+
+
 class RegexParser:
     """Применяет regex паттерны к тексту"""
     
@@ -706,6 +784,10 @@ def main():
                        help='Токен авторизации')
     parser.add_argument('--no-ssl-verify', action='store_true',
                        help='Отключить проверку SSL')
+    add_cache_arguments(parser)
+    add_http_arguments(parser)
+    add_format_arguments(parser)
+    add_context_arguments(parser)
     
     args = parser.parse_args()
     
@@ -736,6 +818,7 @@ def main():
         return
     
     patterns = {}
+    ollama_metrics = None
     
     # РЕЖИМ 1: Генерация regex паттернов
     if args.mode in ['generate', 'both']:
@@ -747,10 +830,24 @@ def main():
             args.ollama_url, 
             args.model, 
             args.token,
-            verify_ssl=not args.no_ssl_verify
+            verify_ssl=not args.no_ssl_verify,
+            cache=cache_from_args(args),
+            retries=args.retries,
+            deadline=args.request_deadline,
+            keep_alive=args.keep_alive,
+            json_format=args.json_format,
+            num_ctx=args.num_ctx
         )
         
         patterns = generator.generate_regex_patterns(text)
+        if generator.cache:
+            generator.cache.print_stats()
+        retry_stats = generator.pool.retry_stats()
+        if retry_stats['retries']:
+            print(f"🔁 Повторов запросов к Ollama: {retry_stats['retries']}")
+        generator.metrics.print_summary()
+        ollama_metrics = generator.metrics.summary()
+        generator.parse_stats.print_summary()
         
         if patterns:
             save_regex_patterns(patterns, regex_file)
@@ -793,6 +890,9 @@ def main():
             },
             "extracted_data": results
         }
+        if ollama_metrics:
+            # Генерация паттернов в этом же запуске (--mode both)
+            final_results["file_info"]["ollama_metrics"] = ollama_metrics
         
         # Сохраняем результаты
         save_results(final_results, output_file)